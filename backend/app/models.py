@@ -5,7 +5,7 @@ from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC
 import enum
 
 Base = declarative_base()
@@ -259,6 +259,10 @@ class Document(Base):
     ai_processed_at = Column(DateTime(timezone=True), nullable=True)
     ai_error = Column(Text, nullable=True)
     
+    # RAG embedding provenance (blake2b-128 of the OCR text the embeddings were built from)
+    embedding_source_hash = Column(String(32), nullable=True)
+    embedding_chunk_count = Column(Integer, nullable=True)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
@@ -366,7 +370,8 @@ class DocumentEmbedding(Base):
     
     chunk_text = Column(Text, nullable=False)
     chunk_index = Column(Integer, nullable=False)
-    embedding = Column(Vector(1536))  # text-embedding-3-large with dimensions=1536 (optimized for pgvector)
+    chunk_hash = Column(String(32), nullable=True)  # blake2b-128 of "model:dimensions:chunk_text", lets re-embedding reuse unchanged chunks
+    embedding = Column(HALFVEC(1536))  # text-embedding-3-large with dimensions=1536, stored as float16 (pgvector halfvec)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -375,6 +380,7 @@ class DocumentEmbedding(Base):
     
     __table_args__ = (
         Index('ix_document_embeddings_firm_id_document_id', 'firm_id', 'document_id'),
+        Index('ix_document_embeddings_document_id_chunk_hash', 'document_id', 'chunk_hash'),
     )
     
     def __repr__(self):
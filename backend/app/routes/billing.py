@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User, Firm, SubscriptionStatus, SubscriptionTier
@@ -33,7 +34,8 @@ async def create_checkout_session(
     
     # 2. Create Stripe Customer if not exists
     if not firm.stripe_customer_id:
-        customer_id = stripe_service.create_customer(firm.email, firm.name)
+        # Stripe SDK calls block: run them in the threadpool, not on the event loop
+        customer_id = await run_in_threadpool(stripe_service.create_customer, firm.email, firm.name)
         firm.stripe_customer_id = customer_id
         db.commit()
     
@@ -54,7 +56,8 @@ async def create_checkout_session(
     
     # 4. Create Session
     domain = os.getenv("FRONTEND_URL", "http://localhost:3000")
-    session_url = stripe_service.create_checkout_session(
+    session_url = await run_in_threadpool(
+        stripe_service.create_checkout_session,
         customer_id=firm.stripe_customer_id,
         price_id=None, # We use line_items now
         line_items=line_items, # Pass line_items instead of single price
@@ -75,7 +78,9 @@ async def customer_portal(
         raise HTTPException(status_code=404, detail="No billing account found")
         
     domain = os.getenv("FRONTEND_URL", "http://localhost:3000")
-    url = stripe_service.create_portal_session(firm.stripe_customer_id, f"{domain}/settings")
+    url = await run_in_threadpool(
+        stripe_service.create_portal_session, firm.stripe_customer_id, f"{domain}/settings"
+    )
     return {"url": url}
 
 @router.post("/webhook")
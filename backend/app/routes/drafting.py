@@ -3,8 +3,10 @@ Legal Document Drafting API Routes
 Endpoints for AI-powered legal document generation using GPT-4o
 """
 
-from typing import List, Optional
+import json
+from typing import Generator, Iterator, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 
@@ -15,6 +17,7 @@ from ..models import (
     LegalDocumentType, DraftStatus, UserRole
 )
 from ..services.document_drafting_service import DocumentDraftingService
+from ..services.cache_service import cache_service
 
 
 router = APIRouter(prefix="/api/drafting", tags=["Legal Document Drafting"])
@@ -95,6 +98,36 @@ class GeneratedDocumentResponse(BaseModel):
         from_attributes = True
 
 
+def _sse_stream(stream: Generator[str, None, GeneratedDocument]) -> Iterator[str]:
+    """
+    Relay GPT-4o content deltas as Server-Sent Events.
+    
+    Emits one `data:` event per delta, then a `done` event with the saved
+    document id and title (or an `error` event if generation fails mid-stream).
+    """
+    try:
+        while True:
+            delta = next(stream)
+            yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+    except StopIteration as finished:
+        document = finished.value
+        payload = {"id": document.id, "title": document.title}
+        yield f"event: done\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+
+def _raise_generation_error(e: ValueError, not_found_status: int):
+    """Map service ValueErrors to HTTP errors (missing API key vs. validation)"""
+    error_msg = str(e).lower()
+    if "api key" in error_msg or "openai" in error_msg:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="OpenAI API key not configured. Please contact your administrator."
+        )
+    raise HTTPException(status_code=not_found_status, detail=str(e))
+
+
 # ==================== Document Generation Endpoints ====================
 
 @router.post("/generate/template", response_model=GeneratedDocumentResponse)
@@ -205,6 +238,69 @@ def generate_from_prompt(
         )
 
 
+@router.post("/generate/template/stream")
+def generate_from_template_stream(
+    request: GenerateFromTemplateRequest,
+    current_user: User = Depends(require_role(["lawyer", "admin"])),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a template-based document as Server-Sent Events while GPT-4o writes it.
+    
+    Requires: LAWYER or ADMIN role
+    The document is saved once the stream completes (see the final `done` event).
+    """
+    try:
+        service = DocumentDraftingService()
+        stream = service.generate_from_template_stream(
+            template_id=request.template_id,
+            placeholders=request.placeholders,
+            firm_id=current_user.firm_id,
+            user_id=current_user.id,
+            db=db,
+            expediente_id=request.expediente_id,
+            additional_instructions=request.additional_instructions
+        )
+    except ValueError as e:
+        _raise_generation_error(e, status.HTTP_404_NOT_FOUND)
+    
+    return StreamingResponse(_sse_stream(stream), media_type="text/event-stream")
+
+
+@router.post("/generate/prompt/stream")
+def generate_from_prompt_stream(
+    request: GenerateFromPromptRequest,
+    current_user: User = Depends(require_role(["lawyer", "admin"])),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a free-form document as Server-Sent Events while GPT-4o writes it.
+    
+    Requires: LAWYER or ADMIN role
+    The document is saved once the stream completes (see the final `done` event).
+    """
+    try:
+        try:
+            doc_type = LegalDocumentType(request.document_type.lower())
+        except ValueError:
+            raise ValueError(f"Invalid document type: {request.document_type}")
+        
+        service = DocumentDraftingService()
+        stream = service.generate_from_prompt_stream(
+            document_type=doc_type,
+            user_prompt=request.user_prompt,
+            firm_id=current_user.firm_id,
+            user_id=current_user.id,
+            db=db,
+            expediente_id=request.expediente_id,
+            context=request.context
+        )
+    except ValueError as e:
+        _raise_generation_error(e, status.HTTP_400_BAD_REQUEST)
+    
+    return StreamingResponse(_sse_stream(stream), media_type="text/event-stream")
+
+
 # ==================== Generated Documents Management ====================
 
 @router.get("/documents", response_model=List[GeneratedDocumentResponse])
@@ -519,6 +615,7 @@ def update_template(
     
     db.commit()
     db.refresh(template)
+    cache_service.invalidate_template(template_id, current_user.firm_id)
     
     return TemplateResponse(
         **{k: v for k, v in template.__dict__.items() if not k.startswith('_')},
@@ -554,5 +651,6 @@ def delete_template(
     # Soft delete
     template.is_active = False  # type: ignore
     db.commit()
+    cache_service.invalidate_template(template_id, current_user.firm_id)
     
     return None
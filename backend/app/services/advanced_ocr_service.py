@@ -107,7 +107,7 @@ class AdvancedOCRService:
             
             # Auto-select engine based on language and availability
             if engine == "auto":
-                engine = self._select_best_engine(language)
+                engine = self.select_best_engine(language)
             
             # Process based on file type
             if file_extension == '.pdf':
@@ -131,7 +131,7 @@ class AdvancedOCRService:
             logger.info("Falling back to Tesseract...")
             return self._fallback_to_tesseract(file_path)
     
-    def _select_best_engine(self, language: str) -> OCREngine:
+    def select_best_engine(self, language: str) -> OCREngine:
         """Auto-select best OCR engine based on language"""
         if language == "ar":
             # QARI-OCR is best for Arabic
@@ -160,7 +160,7 @@ class AdvancedOCRService:
         """Process PDF with advanced OCR engines"""
         try:
             # Try direct text extraction first
-            direct_text = self._extract_pdf_text_direct(file_path)
+            direct_text = self.extract_pdf_text_direct(file_path)
             
             if direct_text and len(direct_text.strip()) > 50:
                 logger.info("PDF has extractable text (no OCR needed)")
@@ -168,7 +168,7 @@ class AdvancedOCRService:
                     'extracted_text': direct_text,
                     'ocr_confidence': 99,
                     'detected_language': language,
-                    'pages_processed': self._count_pdf_pages(file_path),
+                    'pages_processed': self.count_pdf_pages(file_path),
                     'method': 'direct_extraction'
                 }
             
@@ -181,7 +181,7 @@ class AdvancedOCRService:
             total_confidence = 0
             
             for i, image in enumerate(images):
-                page_result = self._process_single_image_advanced(
+                page_result = self.process_single_image(
                     image, engine, language
                 )
                 all_text += f"\n--- Page {i + 1} ---\n{page_result['text']}\n"
@@ -210,7 +210,7 @@ class AdvancedOCRService:
         """Process image with advanced OCR engines"""
         try:
             image = Image.open(file_path)
-            result = self._process_single_image_advanced(image, engine, language)
+            result = self.process_single_image(image, engine, language)
             
             return {
                 'extracted_text': result['text'],
@@ -224,7 +224,7 @@ class AdvancedOCRService:
             logger.error(f"Image processing failed: {e}")
             raise
     
-    def _process_single_image_advanced(
+    def process_single_image(
         self,
         image: Image.Image,
         engine: OCREngine,
@@ -350,7 +350,7 @@ class AdvancedOCRService:
             logger.error(f"Tesseract processing failed: {e}")
             raise
     
-    def _extract_pdf_text_direct(self, file_path: str) -> str:
+    def extract_pdf_text_direct(self, file_path: str) -> str:
         """Extract text directly from PDF (no OCR)"""
         try:
             doc = fitz.open(file_path)
@@ -363,7 +363,7 @@ class AdvancedOCRService:
             logger.warning(f"Failed to extract text from PDF: {e}")
             return ""
     
-    def _count_pdf_pages(self, file_path: str) -> int:
+    def count_pdf_pages(self, file_path: str) -> int:
         """Count pages in PDF"""
         try:
             doc = fitz.open(file_path)
@@ -1,14 +1,19 @@
 # backend/app/services/ai_service.py - DeepSeek AI Integration
 
 import asyncio
+import importlib.util
 import json
 import logging
 from typing import Dict, Optional, Any
-from openai import AsyncOpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
+# HTTP/2 multiplexes concurrent AI calls over one TLS connection (needs httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
 
 class AIService:
     """
@@ -29,7 +34,18 @@ class AIService:
             self.client = AsyncOpenAI(
                 api_key=settings.ai_api_key,
                 base_url=settings.ai_base_url,
-                timeout=settings.ai_timeout
+                timeout=settings.ai_timeout,
+                # One pooled connection set for every call; keep-alive outlives the
+                # gaps between documents so calls skip the TCP+TLS handshake
+                http_client=DefaultAsyncHttpxClient(
+                    http2=HTTP2_AVAILABLE,
+                    timeout=settings.ai_timeout,
+                    limits=httpx.Limits(
+                        max_keepalive_connections=32,
+                        max_connections=64,
+                        keepalive_expiry=60
+                    )
+                )
             )
         
         self.model = settings.ai_model
@@ -39,6 +55,11 @@ class AIService:
         """Check if AI service is properly configured."""
         return self.client is not None
     
+    async def aclose(self) -> None:
+        """Close pooled connections (call before the owning event loop shuts down)."""
+        if self.client is not None:
+            await self.client.close()
+    
     async def classify_document(self, text: str) -> Optional[str]:
         """
         Classify legal document into predefined categories.
@@ -210,6 +231,77 @@ Si el documento está en francés, responde en francés."""
             logger.error(f"Summarization failed: {str(e)}")
             return None
     
+    async def analyze_document(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Classify, extract metadata and summarize in ONE chat completion.
+        
+        The document text (the expensive prefill) is sent once instead of
+        three times, at the cost of a single JSON answer for all fields.
+        
+        Args:
+            text: Extracted text from OCR
+            
+        Returns:
+            {"classification": str, "metadata": dict, "summary": str}
+            or None if the analysis fails
+        """
+        if not self.is_enabled():
+            logger.warning("AI service not enabled. Skipping analysis.")
+            return None
+        
+        try:
+            # Truncate text (largest limit of the three separate operations)
+            truncated_text = text[:8000] if len(text) > 8000 else text
+            
+            system_prompt = """Eres un experto legal en leyes de Marruecos.
+Analiza el documento legal y devuelve un JSON con esta estructura exacta:
+{
+  "classification": "UNA categoría exacta: Contrat, Jugement, Facture, Statuts, Procuration, Demande o Autre",
+  "metadata": {
+    "parties": ["lista de partes involucradas"],
+    "dates": ["lista de fechas en formato YYYY-MM-DD si es posible"],
+    "case_number": "número de caso/expediente si existe",
+    "amounts": [{"value": número, "currency": "MAD/EUR/USD"}],
+    "language": "ar" o "fr",
+    "location": "ciudad/tribunal si se menciona"
+  },
+  "summary": "resumen ejecutivo de 3-5 frases: tipo de documento, partes principales, objeto/propósito, fechas clave"
+}
+
+Extrae los valores y escribe el resumen en el idioma principal del documento
+(العربية árabe o Français francés). Si no encuentras algún campo, usa null o lista vacía []."""
+
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Analiza este documento:\n\n{truncated_text}"}
+                ],
+                temperature=0.2,
+                max_tokens=800,
+                response_format={"type": "json_object"}  # Force JSON mode
+            )
+            
+            analysis = json.loads(response.choices[0].message.content)
+            logger.info(f"Document analyzed as: {analysis.get('classification')}")
+            return {
+                "classification": analysis.get("classification"),
+                "metadata": analysis.get("metadata"),
+                "summary": analysis.get("summary")
+            }
+            
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse analysis JSON: {str(e)}")
+            return None
+        except Exception as e:
+            # Handle rate limits with exponential backoff
+            if "429" in str(e) or "rate_limit" in str(e).lower():
+                logger.warning(f"Rate limit hit during analysis: {str(e)}")
+                # Let Celery handle retry with exponential backoff
+                raise
+            logger.error(f"Analysis failed: {str(e)}")
+            return None
+    
     async def process_document(self, text: str) -> Dict[str, Any]:
         """
         Process document with all AI capabilities in parallel.
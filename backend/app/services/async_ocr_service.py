@@ -106,7 +106,7 @@ class AsyncOCRService:
             
             # Auto-select engine
             if engine == "auto":
-                engine = self._sync_ocr_service._select_best_engine(language)
+                engine = self._sync_ocr_service.select_best_engine(language)
             
             # Process based on file type
             if file_extension == '.pdf':
@@ -165,7 +165,7 @@ class AsyncOCRService:
             loop = asyncio.get_event_loop()
             direct_text = await loop.run_in_executor(
                 self.executor,
-                self._sync_ocr_service._extract_pdf_text_direct,
+                self._sync_ocr_service.extract_pdf_text_direct,
                 file_path
             )
             
@@ -173,7 +173,7 @@ class AsyncOCRService:
                 logger.info("PDF has extractable text (no OCR needed)")
                 page_count = await loop.run_in_executor(
                     self.executor,
-                    self._sync_ocr_service._count_pdf_pages,
+                    self._sync_ocr_service.count_pdf_pages,
                     file_path
                 )
                 return {
@@ -312,7 +312,7 @@ class AsyncOCRService:
         # Run the synchronous OCR method in executor
         result = await loop.run_in_executor(
             self.executor,
-            self._sync_ocr_service._process_single_image_advanced,
+            self._sync_ocr_service.process_single_image,
             image,
             engine,
             language
@@ -1,161 +1,623 @@
 import hashlib
+import heapq
 import json
+import os
+import sqlite3
+import time
 from collections import OrderedDict
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
-from threading import Lock
+from typing import Optional, List, Dict, Any, Tuple, Union
+from datetime import timedelta
+from threading import Event, Lock, local
 import logging
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 
+class EmbeddingDiskStore:
+    """
+    SQLite-backed embedding store that survives restarts and is shared by
+    worker processes on the same host (WAL mode allows concurrent readers).
+    
+    Values are raw float16 bytes keyed by the same SHA-256 key as the
+    in-memory cache. Oldest rows are pruned once the file exceeds size_limit.
+    """
+    
+    _PRUNE_CHECK_INTERVAL = 1000  # Writes between size checks
+    
+    def __init__(self, path: str, size_limit: int = 2 * 1024 ** 3):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._size_limit = size_limit
+        self._writes_since_check = 0
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+        )
+    
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, value) VALUES (?, ?)", (key, value)
+            )
+            self._writes_since_check += 1
+            if self._writes_since_check >= self._PRUNE_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._prune_if_needed()
+    
+    def set_many(self, items: List[Tuple[str, bytes]]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, value) VALUES (?, ?)", items
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                # Never leave the shared connection inside an open transaction
+                self._conn.execute("ROLLBACK")
+                raise
+            self._writes_since_check += len(items)
+            if self._writes_since_check >= self._PRUNE_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._prune_if_needed()
+    
+    def _used_bytes(self) -> int:
+        """Bytes held by live pages (the file itself never shrinks without VACUUM)"""
+        page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+    
+    def _prune_if_needed(self):
+        """Drop the oldest 10% of rows at a time while live data exceeds the size limit"""
+        pruned = False
+        while self._used_bytes() > self._size_limit:
+            deleted = self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY rowid LIMIT "
+                "(SELECT COUNT(*) / 10 + 1 FROM embeddings))"
+            ).rowcount
+            pruned = True
+            if not deleted:
+                break
+        if pruned:
+            logger.info("🧹 Pruned embedding disk cache (over %d bytes)", self._size_limit)
+
+
 class CacheService:
     """Thread-safe in-memory LRU cache with TTL and size limits"""
     
-    def __init__(self):
+    def __init__(self, disk_path: Optional[str] = None):
         # LRU caches (OrderedDict maintains insertion order)
         self._embedding_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
         self._classification_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._template_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
         
         # Thread safety
         self._lock = Lock()
         
         # Cache configuration (1 hour TTL as per architect requirements)
         self._cache_ttl = timedelta(hours=1)
+        self._template_ttl = timedelta(minutes=5)  # Templates are edited by hand, keep them fresh
         
         # Size limits to prevent unbounded memory growth
-        self._max_embedding_entries = 10000  # ~40MB max
+        self._max_embedding_bytes = 64 * 1024 * 1024  # 64 MiB regardless of embedding dimensions
         self._max_classification_entries = 5000  # ~10MB max
+        self._max_template_entries = 512
+        
+        # Embeddings are stored as contiguous float16 arrays; track their footprint
+        self._embedding_dtype = np.float16
+        self._embedding_bytes = 0
+        
+        # Min-heaps of (expires_at, key) so sweeps only visit expiring entries
+        self._embedding_expiry_heap: List[Tuple[float, str]] = []
+        self._classification_expiry_heap: List[Tuple[float, str]] = []
+        self._template_expiry_heap: List[Tuple[float, str]] = []
+        
+        # Encoded "model:" key prefixes, built once per model name
+        self._key_prefixes: Dict[str, bytes] = {}
+        
+        # Embedding hits are promoted lazily: each thread buffers keys it read
+        # and moves them to the MRU end in bulk under the lock
+        self._pending_promotions = local()
+        self._promotion_batch_size = 64
+        
+        # Embedding fetches in progress after a MISS (key -> Event set once cached)
+        self._inflight_embeddings: Dict[str, Event] = {}
+        
+        # Optional persistent second tier for embeddings (warm restarts, shared by workers)
+        disk_path = disk_path or os.getenv("EMBEDDING_CACHE_PATH")
+        self._disk: Optional[EmbeddingDiskStore] = None
+        if disk_path:
+            try:
+                self._disk = EmbeddingDiskStore(disk_path)
+                logger.info("💽 Embedding disk cache enabled at %s", disk_path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("⚠️ Embedding disk cache unavailable (%s): %s", disk_path, e)
         
     def _generate_key(self, text: str, model: str = "") -> str:
-        """Generate cache key from text and model"""
-        content = f"{model}:{text}"
-        return hashlib.sha256(content.encode()).hexdigest()
+        """Generate cache key from text and model (sha256 of "model:text")"""
+        prefix = self._key_prefixes.get(model)
+        if prefix is None:
+            prefix = self._key_prefixes.setdefault(model, f"{model}:".encode())
+        digest = hashlib.sha256(prefix)
+        # Always hash the full text: a sampled (head + length + tail) key would
+        # return another document's embedding when only the middle differs.
+        # hashlib releases the GIL for large inputs, so long texts do not
+        # stall other request threads while hashing. OpenSSL's SHA-256 uses
+        # the CPU's SHA extensions where present (faster than blake2b there).
+        digest.update(text.encode())
+        return digest.hexdigest()
+    
+    def embedding_keys(self, texts: List[str], model: str = "text-embedding-3-large") -> List[str]:
+        """
+        Precompute cache keys for texts, so a lookup followed by a store
+        (the *_many / batch methods accept keys=) hashes each text only once.
+        """
+        return [self._generate_key(text, model) for text in texts]
+    
+    def _new_expiry(self, ttl: Optional[timedelta] = None) -> float:
+        """Monotonic deadline for an entry cached now"""
+        return time.monotonic() + (ttl or self._cache_ttl).total_seconds()
     
     def _is_expired(self, cached_data: Dict[str, Any]) -> bool:
         """Check if cached entry has expired"""
-        if "timestamp" not in cached_data:
+        if "expires_at" not in cached_data:
             return True
-        cached_time = datetime.fromisoformat(cached_data["timestamp"])
-        return datetime.now() - cached_time > self._cache_ttl
+        return time.monotonic() > cached_data["expires_at"]
+    
+    def _pop_expired(self, cache: OrderedDict, heap: List[Tuple[float, str]], now: float) -> List[Dict[str, Any]]:
+        """
+        Pop entries whose deadline passed, dropping heap heads made stale by
+        re-insertion, invalidation or LRU eviction along the way
+        """
+        expired = []
+        while heap:
+            expires_at, key = heap[0]
+            cached = cache.get(key)
+            if cached is not None and cached["expires_at"] == expires_at:
+                if expires_at > now:
+                    break
+                del cache[key]
+                expired.append(cached)
+            heapq.heappop(heap)
+        return expired
+    
+    def _track_expiry(self, cache: OrderedDict, heap: List[Tuple[float, str]], key: str) -> List[Dict[str, Any]]:
+        """
+        Push the deadline of a just-stored entry (caller holds the lock), then
+        trim expired/stale heap heads and rebuild the heap once stale items
+        outnumber live entries, so it stays O(len(cache)) without a sweeper.
+        Returns the entries expired along the way.
+        """
+        cached = cache.get(key)
+        if cached is not None:
+            heapq.heappush(heap, (cached["expires_at"], key))
+        expired = self._pop_expired(cache, heap, time.monotonic())
+        if len(heap) > 2 * len(cache):
+            heap[:] = [(entry["expires_at"], entry_key) for entry_key, entry in cache.items()]
+            heapq.heapify(heap)
+        return expired
+    
+    def _discard_embedding(self, cached: Dict[str, Any]):
+        """Release the byte accounting of an embedding entry leaving the cache"""
+        self._embedding_bytes -= cached["embedding"].nbytes
     
     def _evict_lru_if_needed(self, cache: OrderedDict, max_size: int):
         """Evict oldest entries if cache exceeds max size (LRU eviction)"""
-        while len(cache) >= max_size:
+        while len(cache) > max_size:
             # Remove oldest entry (FIFO/LRU behavior)
-            oldest_key = next(iter(cache))
-            del cache[oldest_key]
-            logger.debug(f"🗑️ LRU eviction: removed key {oldest_key[:8] if isinstance(oldest_key, str) else oldest_key}...")
+            oldest_key, _ = cache.popitem(last=False)
+            logger.debug("🗑️ LRU eviction: removed key %.8s...", oldest_key)
     
-    def get_embedding(self, text: str, model: str = "text-embedding-3-large") -> Optional[List[float]]:
-        """Get cached embedding if available and not expired"""
+    def _evict_embeddings_over_budget(self):
+        """Evict oldest embeddings until the cache fits its byte budget (LRU eviction)"""
+        while self._embedding_bytes > self._max_embedding_bytes:
+            oldest_key, oldest = self._embedding_cache.popitem(last=False)
+            self._discard_embedding(oldest)
+            logger.debug("🗑️ LRU eviction: removed embedding key %.8s...", oldest_key)
+    
+    def _promote_pending(self):
+        """Apply this thread's buffered LRU promotions (caller holds the lock)"""
+        pending = getattr(self._pending_promotions, "keys", None)
+        if not pending:
+            return
+        cache = self._embedding_cache
+        for key in pending:
+            if key in cache:
+                cache.move_to_end(key)
+        pending.clear()
+    
+    def _record_hit(self, key: str):
+        """Buffer a hit for promotion, flushing once the batch is full"""
+        pending = getattr(self._pending_promotions, "keys", None)
+        if pending is None:
+            pending = self._pending_promotions.keys = []
+        pending.append(key)
+        if len(pending) >= self._promotion_batch_size:
+            with self._lock:
+                self._promote_pending()
+    
+    def _lookup_embedding(self, text: str, model: str) -> Optional[np.ndarray]:
+        """Return the cached float16 array for (text, model), or None"""
         key = self._generate_key(text, model)
         
+        # Fast path: lock-free read; LRU promotion is deferred to _record_hit
+        cached = self._embedding_cache.get(key)
+        if cached is not None and not self._is_expired(cached):
+            self._record_hit(key)
+            logger.debug("✅ Embedding cache HIT for key %.8s...", key)
+            return cached["embedding"]
+        
         with self._lock:
-            if key in self._embedding_cache:
-                cached = self._embedding_cache[key]
-                
+            cached = self._embedding_cache.get(key)
+            if cached is not None:
                 if not self._is_expired(cached):
-                    # Move to end (most recently used)
+                    # Stored by another thread since the fast-path read
                     self._embedding_cache.move_to_end(key)
-                    logger.debug(f"✅ Embedding cache HIT for key {key[:8]}...")
+                    logger.debug("✅ Embedding cache HIT for key %.8s...", key)
                     return cached["embedding"]
-                else:
-                    # Remove expired entry
-                    del self._embedding_cache[key]
-                    logger.debug(f"❌ Embedding cache EXPIRED for key {key[:8]}...")
+                
+                # Remove expired entry
+                self._discard_embedding(cached)
+                del self._embedding_cache[key]
+                logger.debug("❌ Embedding cache EXPIRED for key %.8s...", key)
             
-            logger.debug(f"❌ Embedding cache MISS for key {key[:8]}...")
+            if self._disk is None:
+                logger.debug("❌ Embedding cache MISS for key %.8s...", key)
+                return None
+        
+        return self._load_from_disk(key)
+    
+    def _load_from_disk(self, key: str) -> Optional[np.ndarray]:
+        """Second-tier lookup: read from the disk store and promote into memory"""
+        try:
+            raw = self._disk.get(key)
+        except sqlite3.Error as e:
+            # A locked or corrupt store degrades to a miss, never a request error
+            logger.warning("⚠️ Embedding disk cache read failed: %s", e)
+            raw = None
+        if raw is None:
+            logger.debug("❌ Embedding cache MISS for key %.8s...", key)
             return None
+        
+        arr = np.frombuffer(raw, dtype=self._embedding_dtype)
+        with self._lock:
+            self._store_embedding(key, arr)
+        logger.debug("💽 Embedding disk cache HIT for key %.8s...", key)
+        return arr
     
-    def set_embedding(self, text: str, embedding: List[float], model: str = "text-embedding-3-large"):
-        """Cache embedding with LRU eviction if cache is full"""
+    def _store_embedding(self, key: str, arr: np.ndarray):
+        """Insert a read-only array into the memory tier (caller holds the lock)"""
+        previous = self._embedding_cache.pop(key, None)
+        if previous is not None:
+            self._discard_embedding(previous)
+        
+        # Add new entry (will be at the end = most recent)
+        self._embedding_cache[key] = {
+            "embedding": arr,
+            "expires_at": self._new_expiry()
+        }
+        self._embedding_bytes += arr.nbytes
+        
+        # Evict LRU entries if over the byte budget
+        self._evict_embeddings_over_budget()
+        
+        for cached in self._track_expiry(self._embedding_cache, self._embedding_expiry_heap, key):
+            self._discard_embedding(cached)
+    
+    def get_embedding(self, text: str, model: str = "text-embedding-3-large") -> Optional[List[float]]:
+        """Get cached embedding if available and not expired"""
+        arr = self._lookup_embedding(text, model)
+        if arr is None:
+            return None
+        return arr.astype(np.float32).tolist()
+    
+    def get_embedding_np(self, text: str, model: str = "text-embedding-3-large") -> Optional[np.ndarray]:
+        """Get cached embedding as a read-only float16 array (no list conversion)"""
+        return self._lookup_embedding(text, model)
+    
+    def get_embeddings_batch(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-3-large",
+        keys: Optional[List[str]] = None
+    ) -> Tuple[Optional[np.ndarray], List[int]]:
+        """
+        Look up many embeddings under a single lock acquisition.
+        
+        Returns a (len(texts), dim) float16 array with hits filled in (None if
+        nothing was cached) and the indices of texts that missed, so callers can
+        request only the misses from the embedding API. keys, if given, are the
+        embedding_keys() of texts.
+        """
+        if keys is None:
+            keys = self.embedding_keys(texts, model)
+        return self.get_embeddings_batch_by_keys(keys)
+    
+    def get_embeddings_batch_by_keys(self, keys: List[str]) -> Tuple[Optional[np.ndarray], List[int]]:
+        """get_embeddings_batch for precomputed embedding_keys() (the texts are not needed)"""
+        hits: List[Tuple[int, np.ndarray]] = []
+        miss_indices: List[int] = []
+        
+        with self._lock:
+            for index, key in enumerate(keys):
+                cached = self._embedding_cache.get(key)
+                if cached is None:
+                    miss_indices.append(index)
+                elif self._is_expired(cached):
+                    self._discard_embedding(cached)
+                    del self._embedding_cache[key]
+                    miss_indices.append(index)
+                else:
+                    self._embedding_cache.move_to_end(key)
+                    hits.append((index, cached["embedding"]))
+        
+        if self._disk is not None and miss_indices:
+            still_missing = []
+            for index in miss_indices:
+                arr = self._load_from_disk(keys[index])
+                if arr is None:
+                    still_missing.append(index)
+                else:
+                    hits.append((index, arr))
+            miss_indices = still_missing
+        
+        logger.debug("Embedding batch lookup: %d hits, %d misses", len(hits), len(miss_indices))
+        if not hits:
+            return None, miss_indices
+        
+        dim = hits[0][1].shape[0]
+        stacked = np.zeros((len(keys), dim), dtype=self._embedding_dtype)
+        for index, arr in hits:
+            if arr.shape[0] != dim:
+                # Mixed dimensions under one model name: refetch rather than guess
+                miss_indices.append(index)
+                continue
+            stacked[index] = arr
+        miss_indices.sort()
+        return stacked, miss_indices
+    
+    def set_embedding(self, text: str, embedding: Union[List[float], np.ndarray], model: str = "text-embedding-3-large"):
+        """Cache embedding as float16 with LRU eviction if cache is full"""
         key = self._generate_key(text, model)
+        arr = np.array(embedding, dtype=self._embedding_dtype)
+        arr.flags.writeable = False
         
         with self._lock:
-            # Evict LRU entries if at capacity
-            self._evict_lru_if_needed(self._embedding_cache, self._max_embedding_entries)
+            self._promote_pending()
+            self._store_embedding(key, arr)
+            logger.debug("💾 Cached embedding for key %.8s...", key)
             
-            # Add new entry (will be at the end = most recent)
-            self._embedding_cache[key] = {
-                "embedding": embedding,
-                "timestamp": datetime.now().isoformat()
-            }
-            logger.debug(f"💾 Cached embedding for key {key[:8]}...")
+            inflight = self._inflight_embeddings.pop(key, None)
+        
+        if self._disk is not None:
+            try:
+                self._disk.set(key, arr.tobytes())
+            except sqlite3.Error as e:
+                logger.warning("⚠️ Embedding disk cache write failed: %s", e)
+        
+        # Wake callers waiting on this fetch
+        if inflight is not None:
+            inflight.set()
+    
+    def get_embeddings_many(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-3-large",
+        keys: Optional[List[str]] = None
+    ) -> List[Optional[List[float]]]:
+        """Batched get_embedding: one lock acquisition, list-per-text results (None on miss)"""
+        stacked, miss_indices = self.get_embeddings_batch(texts, model, keys)
+        if stacked is None:
+            return [None] * len(texts)
+        results: List[Optional[List[float]]] = stacked.astype(np.float32).tolist()
+        for index in miss_indices:
+            results[index] = None
+        return results
+    
+    def set_embeddings_many(
+        self,
+        items: List[Tuple[str, Union[List[float], np.ndarray]]],
+        model: str = "text-embedding-3-large",
+        keys: Optional[List[str]] = None
+    ):
+        """
+        Batched set_embedding for (text, embedding) pairs under one lock
+        acquisition. keys, if given, are the embedding_keys() of the texts.
+        """
+        if keys is None:
+            keys = self.embedding_keys([text for text, _ in items], model)
+        prepared = []
+        for key, (_, embedding) in zip(keys, items):
+            arr = np.array(embedding, dtype=self._embedding_dtype)
+            arr.flags.writeable = False
+            prepared.append((key, arr))
+        
+        woken = []
+        with self._lock:
+            self._promote_pending()
+            for key, arr in prepared:
+                self._store_embedding(key, arr)
+                inflight = self._inflight_embeddings.pop(key, None)
+                if inflight is not None:
+                    woken.append(inflight)
+        logger.debug("💾 Cached %d embeddings", len(prepared))
+        
+        for inflight in woken:
+            inflight.set()
+        
+        if self._disk is not None:
+            try:
+                self._disk.set_many([(key, arr.tobytes()) for key, arr in prepared])
+            except sqlite3.Error as e:
+                logger.warning("⚠️ Embedding disk cache write failed: %s", e)
+    
+    def claim_embedding_fetch(self, text: str, model: str = "text-embedding-3-large") -> Tuple[bool, Event]:
+        """
+        Register the caller as the fetcher of a missed embedding.
+        
+        Returns (True, event) if the caller owns the fetch and must call
+        set_embedding() or release_embedding_fetch(); (False, event) if another
+        caller is already fetching it and the caller should wait on the event.
+        """
+        key = self._generate_key(text, model)
+        
+        with self._lock:
+            inflight = self._inflight_embeddings.get(key)
+            if inflight is not None:
+                return False, inflight
+            inflight = self._inflight_embeddings[key] = Event()
+            return True, inflight
+    
+    def release_embedding_fetch(
+        self,
+        text: str,
+        model: str = "text-embedding-3-large",
+        inflight: Optional[Event] = None
+    ):
+        """
+        Abandon an in-flight fetch without caching (e.g., API failure) and wake
+        waiters. Pass the event returned by claim_embedding_fetch() so a stale
+        owner cannot release a fetch since claimed by another caller.
+        """
+        key = self._generate_key(text, model)
+        
+        with self._lock:
+            current = self._inflight_embeddings.get(key)
+            if current is None or (inflight is not None and current is not inflight):
+                return
+            del self._inflight_embeddings[key]
+        
+        current.set()
     
     def get_classification(self, document_id: int) -> Optional[Dict[str, Any]]:
         """Get cached classification if available and not expired"""
         key = str(document_id)
         
         with self._lock:
-            if key in self._classification_cache:
-                cached = self._classification_cache[key]
-                
-                if not self._is_expired(cached):
-                    # Move to end (most recently used)
-                    self._classification_cache.move_to_end(key)
-                    logger.debug(f"✅ Classification cache HIT for document {document_id}")
-                    return cached["classification"]
-                else:
-                    # Remove expired entry
-                    del self._classification_cache[key]
-                    logger.debug(f"❌ Classification cache EXPIRED for document {document_id}")
+            cached = self._classification_cache.get(key)
+            if cached is None:
+                logger.debug("❌ Classification cache MISS for document %s", document_id)
+                return None
             
-            logger.debug(f"❌ Classification cache MISS for document {document_id}")
-            return None
+            if self._is_expired(cached):
+                # Remove expired entry
+                del self._classification_cache[key]
+                logger.debug("❌ Classification cache EXPIRED for document %s", document_id)
+                return None
+            
+            # Move to end (most recently used)
+            self._classification_cache.move_to_end(key)
+            logger.debug("✅ Classification cache HIT for document %s", document_id)
+            return cached["classification"]
     
     def set_classification(self, document_id: int, classification: Dict[str, Any]):
         """Cache classification with LRU eviction if cache is full"""
         key = str(document_id)
         
         with self._lock:
-            # Evict LRU entries if at capacity
-            self._evict_lru_if_needed(self._classification_cache, self._max_classification_entries)
-            
             # Add new entry (will be at the end = most recent)
             self._classification_cache[key] = {
                 "classification": classification,
-                "timestamp": datetime.now().isoformat()
+                "expires_at": self._new_expiry()
             }
-            logger.debug(f"💾 Cached classification for document {document_id}")
+            self._classification_cache.move_to_end(key)
+            logger.debug("💾 Cached classification for document %s", document_id)
+            
+            # Evict LRU entries if over capacity
+            self._evict_lru_if_needed(self._classification_cache, self._max_classification_entries)
+            self._track_expiry(self._classification_cache, self._classification_expiry_heap, key)
     
     def invalidate_document_classification(self, document_id: int):
         """Remove classification from cache (e.g., when force_reclassify=True)"""
         key = str(document_id)
         
         with self._lock:
-            if key in self._classification_cache:
-                del self._classification_cache[key]
-                logger.debug(f"🗑️ Invalidated classification cache for document {document_id}")
+            if self._classification_cache.pop(key, None) is not None:
+                logger.debug("🗑️ Invalidated classification cache for document %s", document_id)
+    
+    def get_template(self, template_id: int, firm_id: int) -> Optional[Any]:
+        """Get a cached template snapshot if available and not expired"""
+        key = f"{firm_id}:{template_id}"
+        
+        with self._lock:
+            cached = self._template_cache.get(key)
+            if cached is None:
+                return None
+            if self._is_expired(cached):
+                del self._template_cache[key]
+                return None
+            self._template_cache.move_to_end(key)
+            return cached["template"]
+    
+    def set_template(self, template_id: int, firm_id: int, template: Any):
+        """
+        Cache a template snapshot (plain values, never a session-bound ORM instance)
+        """
+        key = f"{firm_id}:{template_id}"
+        
+        with self._lock:
+            self._template_cache[key] = {
+                "template": template,
+                "expires_at": self._new_expiry(self._template_ttl)
+            }
+            self._template_cache.move_to_end(key)
+            
+            self._evict_lru_if_needed(self._template_cache, self._max_template_entries)
+            self._track_expiry(self._template_cache, self._template_expiry_heap, key)
+    
+    def invalidate_template(self, template_id: int, firm_id: int):
+        """Remove a template from cache (e.g., after it is updated or deleted)"""
+        key = f"{firm_id}:{template_id}"
+        
+        with self._lock:
+            if self._template_cache.pop(key, None) is not None:
+                logger.debug("🗑️ Invalidated template cache for template %s", template_id)
     
     def get_cache_stats(self) -> Dict[str, int]:
         """Get cache statistics for monitoring"""
         with self._lock:
             return {
                 "embedding_cache_size": len(self._embedding_cache),
+                "embedding_cache_bytes": self._embedding_bytes,
                 "classification_cache_size": len(self._classification_cache),
-                "embedding_cache_max": self._max_embedding_entries,
+                "template_cache_size": len(self._template_cache),
+                "embedding_cache_max_bytes": self._max_embedding_bytes,
+                "embedding_disk_cache_enabled": self._disk is not None,
                 "classification_cache_max": self._max_classification_entries
             }
     
     def clear_expired_entries(self):
         """Proactively clear all expired entries (can be called periodically)"""
+        now = time.monotonic()
+        
         with self._lock:
             # Clear expired embeddings
-            expired_embeddings = [
-                key for key, value in self._embedding_cache.items()
-                if self._is_expired(value)
-            ]
-            for key in expired_embeddings:
-                del self._embedding_cache[key]
+            expired_embeddings = self._pop_expired(
+                self._embedding_cache, self._embedding_expiry_heap, now
+            )
+            for cached in expired_embeddings:
+                self._discard_embedding(cached)
             
             # Clear expired classifications
-            expired_classifications = [
-                key for key, value in self._classification_cache.items()
-                if self._is_expired(value)
-            ]
-            for key in expired_classifications:
-                del self._classification_cache[key]
+            expired_classifications = self._pop_expired(
+                self._classification_cache, self._classification_expiry_heap, now
+            )
+            
+            # Clear expired templates
+            self._pop_expired(self._template_cache, self._template_expiry_heap, now)
             
             if expired_embeddings or expired_classifications:
                 logger.info(
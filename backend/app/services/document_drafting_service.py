@@ -5,17 +5,90 @@ Generates legal documents in Arabic following Moroccan legal standards
 
 import os
 import time
+import asyncio
 import json
 import re
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable, Generator, NamedTuple
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 from datetime import datetime
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 from ..models import (
     DocumentTemplate, GeneratedDocument, LegalDocumentType, DraftStatus, User
 )
+from .cache_service import cache_service
+
+# Matches {{placeholder}} markers in template content
+PLACEHOLDER_RE = re.compile(r"\{\{([^{}]+)\}\}")
+
+# System prompts are constant per document type: build them once at import
+_ENHANCE_SYSTEM_PROMPT = """أنت محامٍ مغربي خبير متخصص في صياغة الوثائق القانونية وفق القانون المغربي.
+
+السياق القانوني المغربي:
+- النظام القانوني: مزيج من القانون المدني الفرنسي والشريعة الإسلامية
+- القوانين المرجعية: قانون الالتزامات والعقود (ظهير 1913)، مدونة الأسرة (2004)، قانون المسطرة المدنية، قانون المسطرة الجنائية، قانون الشغل، مدونة التجارة
+- المحاكم: محاكم ابتدائية، استئنافية، محكمة النقض، محاكم تجارية، محاكم إدارية
+
+مهمتك: تحسين وصقل الوثيقة القانونية المقدمة، مع التأكد من:
+1. الامتثال الدقيق للمعايير القانونية المغربية والإشارة إلى المواد القانونية ذات الصلة
+2. الصياغة القانونية الدقيقة والاحترافية باستخدام المصطلحات القانونية المغربية المعتمدة
+3. الهيكل القانوني الصحيح (مقدمة، أطراف، شروط، توقيعات، إلخ)
+4. ذكر المواعيد القانونية والآجال المنصوص عليها في القانون المغربي
+5. الوضوح والدقة في التعبير مع تجنب الغموض
+
+قم بإرجاع الوثيقة المحسنة فقط، دون أي تعليقات إضافية."""
+
+_DOCUMENT_TYPE_NAMES_AR = {
+    LegalDocumentType.ACTA: "محضر اجتماع قانوني",
+    LegalDocumentType.DEMANDA: "عريضة دعوى",
+    LegalDocumentType.CONTRATO: "عقد قانوني",
+    LegalDocumentType.PODER: "توكيل قانوني",
+    LegalDocumentType.ESCRITO: "مذكرة قانونية",
+    LegalDocumentType.DICTAMEN: "رأي قانوني",
+    LegalDocumentType.OTHER: "وثيقة قانونية"
+}
+
+_GENERATE_SYSTEM_PROMPT_TEMPLATE = """أنت محامٍ مغربي خبير متخصص في صياغة الوثائق القانونية وفق القانون المغربي.
+
+السياق القانوني المغربي:
+- النظام القانوني: مزيج من القانون المدني الفرنسي والشريعة الإسلامية
+- القوانين المرجعية: قانون الالتزامات والعقود (ظهير 1913)، مدونة الأسرة (2004)، قانون المسطرة المدنية، قانون المسطرة الجنائية، قانون الشغل، مدونة التجارة
+- المحاكم المختصة: محاكم ابتدائية، استئنافية، محكمة النقض، محاكم تجارية، محاكم إدارية
+
+مهمتك: إنشاء {doc_type_ar} احترافية وفقاً للمعايير القانونية المغربية.
+
+يجب أن تتضمن الوثيقة:
+1. صياغة قانونية دقيقة ومهنية باللغة العربية الفصحى
+2. المصطلحات القانونية المغربية المعتمدة رسمياً
+3. الهيكل القانوني الصحيح (ديباجة، أطراف، موضوع، شروط، توقيعات)
+4. الإشارة إلى المواد القانونية ذات الصلة من التشريعات المغربية
+5. ذكر المواعيد والآجال القانونية المنصوص عليها
+6. الامتثال الكامل للتشريعات المغربية النافذة
+7. الوضوح والدقة في التعبير مع تجنب الغموض
+
+قم بإنشاء الوثيقة كاملة، محكمة الصياغة، وجاهزة للاستخدام المباشر."""
+
+_GENERATE_SYSTEM_PROMPTS = {
+    document_type: _GENERATE_SYSTEM_PROMPT_TEMPLATE.format(doc_type_ar=doc_type_ar)
+    for document_type, doc_type_ar in _DOCUMENT_TYPE_NAMES_AR.items()
+}
+
+
+class TemplateSnapshot(NamedTuple):
+    """Session-independent copy of the template fields used for generation"""
+    template_content: str
+    template_type: LegalDocumentType
+    name: str
+    is_active: bool
+
+
+class PromptGenerationRequest(NamedTuple):
+    """One free-form generation in a generate_many batch"""
+    document_type: LegalDocumentType
+    user_prompt: str
+    expediente_id: Optional[int] = None
+    context: Optional[Dict[str, Any]] = None
 
 
 class DocumentDraftingService:
@@ -48,6 +121,198 @@ class DocumentDraftingService:
             self._openai_client = OpenAI(api_key=api_key)
         return self._openai_client
     
+    def _new_async_openai_client(self) -> AsyncOpenAI:
+        """
+        AsyncOpenAI client for one batched generation.
+        
+        Its connection pool is bound to the running event loop, so callers
+        use it as an async context manager and close it when the batch ends.
+        """
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "OpenAI API key not configured. Please add your OpenAI API key to secrets."
+            )
+        return AsyncOpenAI(api_key=api_key)
+    
+    def _chat_completion_kwargs(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Shared GPT-4o parameters for all drafting requests"""
+        return {
+            "model": "gpt-4o",
+            "messages": messages,
+            "temperature": 0.3,  # Lower temperature for legal precision
+            "max_tokens": 4000
+        }
+    
+    def _stream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        build_document: Callable[[str, float], GeneratedDocument],
+        db: Session
+    ) -> Generator[str, None, GeneratedDocument]:
+        """
+        Stream GPT-4o text deltas, then persist the full document at end-of-stream.
+        
+        Yields content deltas as they are decoded; the generator's return value
+        is the saved GeneratedDocument.
+        """
+        client = self._ensure_openai_client()
+        start_time = time.time()
+        parts: List[str] = []
+        
+        stream = client.chat.completions.create(
+            **self._chat_completion_kwargs(messages), stream=True
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+        
+        generated_doc = build_document("".join(parts), time.time() - start_time)
+        db.add(generated_doc)
+        db.commit()
+        db.refresh(generated_doc)
+        
+        return generated_doc
+    
+    def _get_template(self, template_id: int, firm_id: int, db: Session) -> TemplateSnapshot:
+        """Fetch an active template of the firm (cached) or raise ValueError"""
+        snapshot = cache_service.get_template(template_id, firm_id)
+        if snapshot is not None:
+            return snapshot
+        
+        # Verify template exists and belongs to firm
+        template = db.query(DocumentTemplate).filter(
+            DocumentTemplate.id == template_id,
+            DocumentTemplate.firm_id == firm_id,
+            DocumentTemplate.is_active == True
+        ).first()
+        
+        if not template:
+            raise ValueError(f"Template {template_id} not found or not accessible")
+        
+        snapshot = TemplateSnapshot(
+            template_content=str(template.template_content),
+            template_type=template.template_type,
+            name=template.name,
+            is_active=template.is_active
+        )
+        cache_service.set_template(template_id, firm_id, snapshot)
+        return snapshot
+    
+    def _template_messages(
+        self,
+        content: str,
+        additional_instructions: Optional[str]
+    ) -> List[Dict[str, str]]:
+        """Chat messages asking GPT-4o to enhance a filled-in template"""
+        user_prompt = f"""الوثيقة الأصلية:
+
+{content}
+
+{f"تعليمات إضافية: {additional_instructions}" if additional_instructions else ""}
+
+قم بتحسين هذه الوثيقة مع الحفاظ على جميع المعلومات المهمة."""
+
+        return [
+            {"role": "system", "content": _ENHANCE_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _template_document(
+        self,
+        template: TemplateSnapshot,
+        template_id: int,
+        placeholders: Dict[str, str],
+        firm_id: int,
+        user_id: int,
+        expediente_id: Optional[int],
+        additional_instructions: Optional[str],
+        content: str,
+        generation_time: float
+    ) -> GeneratedDocument:
+        """Build (but do not persist) the GeneratedDocument for a template generation"""
+        return GeneratedDocument(
+            firm_id=firm_id,
+            template_id=template_id,
+            expediente_id=expediente_id,
+            document_type=template.template_type,
+            title=f"{template.name} - {time.strftime('%Y-%m-%d %H:%M')}",
+            content=content,
+            status=DraftStatus.DRAFT,
+            user_input=json.dumps(placeholders, ensure_ascii=False),
+            generation_metadata=json.dumps({
+                "placeholders": placeholders,
+                "additional_instructions": additional_instructions,
+                "template_name": template.name
+            }, ensure_ascii=False),
+            model_used="gpt-4o",
+            generation_time_seconds=generation_time,
+            created_by=user_id
+        )
+    
+    def _prompt_messages(
+        self,
+        document_type: LegalDocumentType,
+        user_prompt: str,
+        context: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """Chat messages asking GPT-4o to draft a document from a free-form prompt"""
+        doc_type_ar = _DOCUMENT_TYPE_NAMES_AR.get(document_type, _DOCUMENT_TYPE_NAMES_AR[LegalDocumentType.OTHER])
+        system_prompt = _GENERATE_SYSTEM_PROMPTS.get(
+            document_type, _GENERATE_SYSTEM_PROMPTS[LegalDocumentType.OTHER]
+        )
+        
+        context_str = ""
+        if context:
+            context_str = f"\n\nمعلومات سياقية:\n{json.dumps(context, ensure_ascii=False, indent=2)}"
+        
+        user_message = f"""المطلوب: {user_prompt}{context_str}
+
+قم بإنشاء {doc_type_ar} كاملة وفقاً لهذه المتطلبات."""
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+    
+    def _prompt_document(
+        self,
+        document_type: LegalDocumentType,
+        user_prompt: str,
+        firm_id: int,
+        user_id: int,
+        expediente_id: Optional[int],
+        context: Optional[Dict[str, Any]],
+        content: str,
+        generation_time: float
+    ) -> GeneratedDocument:
+        """Build (but do not persist) the GeneratedDocument for a free-form generation"""
+        doc_type_ar = _DOCUMENT_TYPE_NAMES_AR.get(document_type, _DOCUMENT_TYPE_NAMES_AR[LegalDocumentType.OTHER])
+        
+        # Extract title from first line or use default
+        first_line = content.split('\n')[0] if content else doc_type_ar
+        title = first_line[:200] if len(first_line) < 500 else f"{doc_type_ar} - {time.strftime('%Y-%m-%d %H:%M')}"
+        
+        return GeneratedDocument(
+            firm_id=firm_id,
+            template_id=None,  # No template used
+            expediente_id=expediente_id,
+            document_type=document_type,
+            title=title,
+            content=content,
+            status=DraftStatus.DRAFT,
+            user_input=user_prompt,
+            generation_metadata=json.dumps({
+                "context": context,
+                "generation_method": "free_prompt"
+            }, ensure_ascii=False),
+            model_used="gpt-4o",
+            generation_time_seconds=generation_time,
+            created_by=user_id
+        )
+    
     def generate_from_template(
         self,
         template_id: int,
@@ -76,82 +341,30 @@ class DocumentDraftingService:
         Raises:
             ValueError: If template not found or API key missing
         """
-        # Verify template exists and belongs to firm
-        template = db.query(DocumentTemplate).filter(
-            DocumentTemplate.id == template_id,
-            DocumentTemplate.firm_id == firm_id,
-            DocumentTemplate.is_active == True
-        ).first()
+        template = self._get_template(template_id, firm_id, db)
         
-        if not template:
-            raise ValueError(f"Template {template_id} not found or not accessible")
-        
-        # Replace placeholders in template
-        content = str(template.template_content)  # Convert to string for type safety
-        for key, value in placeholders.items():
-            placeholder_pattern = f"{{{{{key}}}}}"
-            content = content.replace(placeholder_pattern, str(value))
+        # Replace placeholders in template (single pass; unknown placeholders are kept)
+        content = PLACEHOLDER_RE.sub(
+            lambda match: str(placeholders.get(match.group(1), match.group(0))),
+            template.template_content
+        )
         
         # Use GPT-4o to enhance and polish the document
         start_time = time.time()
         
         client = self._ensure_openai_client()
         
-        system_prompt = """أنت محامٍ مغربي خبير متخصص في صياغة الوثائق القانونية وفق القانون المغربي.
-
-السياق القانوني المغربي:
-- النظام القانوني: مزيج من القانون المدني الفرنسي والشريعة الإسلامية
-- القوانين المرجعية: قانون الالتزامات والعقود (ظهير 1913)، مدونة الأسرة (2004)، قانون المسطرة المدنية، قانون المسطرة الجنائية، قانون الشغل، مدونة التجارة
-- المحاكم: محاكم ابتدائية، استئنافية، محكمة النقض، محاكم تجارية، محاكم إدارية
-
-مهمتك: تحسين وصقل الوثيقة القانونية المقدمة، مع التأكد من:
-1. الامتثال الدقيق للمعايير القانونية المغربية والإشارة إلى المواد القانونية ذات الصلة
-2. الصياغة القانونية الدقيقة والاحترافية باستخدام المصطلحات القانونية المغربية المعتمدة
-3. الهيكل القانوني الصحيح (مقدمة، أطراف، شروط، توقيعات، إلخ)
-4. ذكر المواعيد القانونية والآجال المنصوص عليها في القانون المغربي
-5. الوضوح والدقة في التعبير مع تجنب الغموض
-
-قم بإرجاع الوثيقة المحسنة فقط، دون أي تعليقات إضافية."""
-
-        user_prompt = f"""الوثيقة الأصلية:
-
-{content}
-
-{f"تعليمات إضافية: {additional_instructions}" if additional_instructions else ""}
-
-قم بتحسين هذه الوثيقة مع الحفاظ على جميع المعلومات المهمة."""
-
         response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,  # Lower temperature for legal precision
-            max_tokens=4000
+            **self._chat_completion_kwargs(self._template_messages(content, additional_instructions))
         )
         
         generation_time = time.time() - start_time
         enhanced_content = response.choices[0].message.content or content  # Fallback to original if None
         
         # Create generated document
-        generated_doc = GeneratedDocument(
-            firm_id=firm_id,
-            template_id=template_id,
-            expediente_id=expediente_id,
-            document_type=template.template_type,
-            title=f"{template.name} - {time.strftime('%Y-%m-%d %H:%M')}",
-            content=enhanced_content,
-            status=DraftStatus.DRAFT,
-            user_input=json.dumps(placeholders, ensure_ascii=False),
-            generation_metadata=json.dumps({
-                "placeholders": placeholders,
-                "additional_instructions": additional_instructions,
-                "template_name": template.name
-            }, ensure_ascii=False),
-            model_used="gpt-4o",
-            generation_time_seconds=generation_time,
-            created_by=user_id
+        generated_doc = self._template_document(
+            template, template_id, placeholders, firm_id, user_id,
+            expediente_id, additional_instructions, enhanced_content, generation_time
         )
         
         db.add(generated_doc)
@@ -160,6 +373,43 @@ class DocumentDraftingService:
         
         return generated_doc
     
+    def generate_from_template_stream(
+        self,
+        template_id: int,
+        placeholders: Dict[str, str],
+        firm_id: int,
+        user_id: int,
+        db: Session,
+        expediente_id: Optional[int] = None,
+        additional_instructions: Optional[str] = None
+    ) -> Generator[str, None, GeneratedDocument]:
+        """
+        Streaming variant of generate_from_template.
+        
+        Template lookup and API key checks run eagerly, so ValueError is raised
+        before any content is streamed. The returned generator yields content
+        deltas and returns the saved GeneratedDocument once the stream ends.
+        """
+        template = self._get_template(template_id, firm_id, db)
+        self._ensure_openai_client()
+        
+        content = PLACEHOLDER_RE.sub(
+            lambda match: str(placeholders.get(match.group(1), match.group(0))),
+            template.template_content
+        )
+        
+        def build_document(enhanced_content: str, generation_time: float) -> GeneratedDocument:
+            return self._template_document(
+                template, template_id, placeholders, firm_id, user_id,
+                expediente_id, additional_instructions,
+                enhanced_content or content,  # Fallback to original if nothing streamed
+                generation_time
+            )
+        
+        return self._stream_completion(
+            self._template_messages(content, additional_instructions), build_document, db
+        )
+    
     def generate_from_prompt(
         self,
         document_type: LegalDocumentType,
@@ -192,81 +442,17 @@ class DocumentDraftingService:
         
         client = self._ensure_openai_client()
         
-        # Document type specific system prompts
-        type_prompts = {
-            LegalDocumentType.ACTA: "محضر اجتماع قانوني",
-            LegalDocumentType.DEMANDA: "عريضة دعوى",
-            LegalDocumentType.CONTRATO: "عقد قانوني",
-            LegalDocumentType.PODER: "توكيل قانوني",
-            LegalDocumentType.ESCRITO: "مذكرة قانونية",
-            LegalDocumentType.DICTAMEN: "رأي قانوني",
-            LegalDocumentType.OTHER: "وثيقة قانونية"
-        }
-        
-        doc_type_ar = type_prompts.get(document_type, "وثيقة قانونية")
-        
-        system_prompt = f"""أنت محامٍ مغربي خبير متخصص في صياغة الوثائق القانونية وفق القانون المغربي.
-
-السياق القانوني المغربي:
-- النظام القانوني: مزيج من القانون المدني الفرنسي والشريعة الإسلامية
-- القوانين المرجعية: قانون الالتزامات والعقود (ظهير 1913)، مدونة الأسرة (2004)، قانون المسطرة المدنية، قانون المسطرة الجنائية، قانون الشغل، مدونة التجارة
-- المحاكم المختصة: محاكم ابتدائية، استئنافية، محكمة النقض، محاكم تجارية، محاكم إدارية
-
-مهمتك: إنشاء {doc_type_ar} احترافية وفقاً للمعايير القانونية المغربية.
-
-يجب أن تتضمن الوثيقة:
-1. صياغة قانونية دقيقة ومهنية باللغة العربية الفصحى
-2. المصطلحات القانونية المغربية المعتمدة رسمياً
-3. الهيكل القانوني الصحيح (ديباجة، أطراف، موضوع، شروط، توقيعات)
-4. الإشارة إلى المواد القانونية ذات الصلة من التشريعات المغربية
-5. ذكر المواعيد والآجال القانونية المنصوص عليها
-6. الامتثال الكامل للتشريعات المغربية النافذة
-7. الوضوح والدقة في التعبير مع تجنب الغموض
-
-قم بإنشاء الوثيقة كاملة، محكمة الصياغة، وجاهزة للاستخدام المباشر."""
-
-        context_str = ""
-        if context:
-            context_str = f"\n\nمعلومات سياقية:\n{json.dumps(context, ensure_ascii=False, indent=2)}"
-        
-        user_message = f"""المطلوب: {user_prompt}{context_str}
-
-قم بإنشاء {doc_type_ar} كاملة وفقاً لهذه المتطلبات."""
-
         response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.3,  # Lower temperature for legal precision
-            max_tokens=4000
+            **self._chat_completion_kwargs(self._prompt_messages(document_type, user_prompt, context))
         )
         
         generation_time = time.time() - start_time
         content = response.choices[0].message.content or ""
         
-        # Extract title from first line or use default
-        first_line = content.split('\n')[0] if content else doc_type_ar
-        title = first_line[:200] if len(first_line) < 500 else f"{doc_type_ar} - {time.strftime('%Y-%m-%d %H:%M')}"
-        
         # Create generated document
-        generated_doc = GeneratedDocument(
-            firm_id=firm_id,
-            template_id=None,  # No template used
-            expediente_id=expediente_id,
-            document_type=document_type,
-            title=title,
-            content=content,
-            status=DraftStatus.DRAFT,
-            user_input=user_prompt,
-            generation_metadata=json.dumps({
-                "context": context,
-                "generation_method": "free_prompt"
-            }, ensure_ascii=False),
-            model_used="gpt-4o",
-            generation_time_seconds=generation_time,
-            created_by=user_id
+        generated_doc = self._prompt_document(
+            document_type, user_prompt, firm_id, user_id,
+            expediente_id, context, content, generation_time
         )
         
         db.add(generated_doc)
@@ -275,6 +461,89 @@ class DocumentDraftingService:
         
         return generated_doc
     
+    def generate_from_prompt_stream(
+        self,
+        document_type: LegalDocumentType,
+        user_prompt: str,
+        firm_id: int,
+        user_id: int,
+        db: Session,
+        expediente_id: Optional[int] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> Generator[str, None, GeneratedDocument]:
+        """
+        Streaming variant of generate_from_prompt.
+        
+        The API key check runs eagerly; the returned generator yields content
+        deltas and returns the saved GeneratedDocument once the stream ends.
+        """
+        self._ensure_openai_client()
+        
+        def build_document(content: str, generation_time: float) -> GeneratedDocument:
+            return self._prompt_document(
+                document_type, user_prompt, firm_id, user_id,
+                expediente_id, context, content, generation_time
+            )
+        
+        return self._stream_completion(
+            self._prompt_messages(document_type, user_prompt, context), build_document, db
+        )
+    
+    async def generate_many(
+        self,
+        requests: List[PromptGenerationRequest],
+        firm_id: int,
+        user_id: int,
+        db: Session,
+        max_concurrency: int = 8
+    ) -> List[GeneratedDocument]:
+        """
+        Generate several free-form documents concurrently and save them in one commit.
+        
+        Args:
+            requests: Documents to generate
+            firm_id: Firm ID for tenant isolation
+            user_id: User ID creating the documents
+            db: Database session
+            max_concurrency: Maximum simultaneous GPT-4o requests
+        
+        Returns:
+            GeneratedDocument instances, in the same order as requests
+        
+        Raises:
+            ValueError: If API key missing
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def generate(client: AsyncOpenAI, request: PromptGenerationRequest) -> GeneratedDocument:
+            async with semaphore:
+                start_time = time.time()
+                response = await client.chat.completions.create(
+                    **self._chat_completion_kwargs(
+                        self._prompt_messages(request.document_type, request.user_prompt, request.context)
+                    )
+                )
+                generation_time = time.time() - start_time
+            
+            return self._prompt_document(
+                request.document_type, request.user_prompt, firm_id, user_id,
+                request.expediente_id, request.context,
+                response.choices[0].message.content or "", generation_time
+            )
+        
+        async with self._new_async_openai_client() as client:
+            generated_docs = list(await asyncio.gather(*(generate(client, request) for request in requests)))
+        
+        def save_all() -> None:
+            # One transaction for the whole batch instead of a commit per document
+            db.add_all(generated_docs)
+            db.commit()
+        
+        # The sync session blocks on the database: keep it off the event loop
+        await asyncio.to_thread(save_all)
+        
+        return generated_docs
+    
     def update_document_status(
         self,
         document_id: int,
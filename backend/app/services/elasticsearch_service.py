@@ -8,6 +8,59 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# Índice para documentos con análisis multi-idioma (compartido con los workers de OCR)
+DOCUMENTS_INDEX_BODY = {
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "analysis": {
+            "analyzer": {
+                "arabic_analyzer": {
+                    "type": "standard",
+                    "stopwords": "_arabic_"
+                },
+                "french_analyzer": {
+                    "type": "standard",
+                    "stopwords": "_french_"
+                },
+                "spanish_analyzer": {
+                    "type": "standard",
+                    "stopwords": "_spanish_"
+                }
+            }
+        }
+    },
+    "mappings": {
+        "properties": {
+            "document_id": {"type": "integer"},
+            "filename": {"type": "text"},
+            "ocr_text": {
+                "type": "text",
+                "fields": {
+                    "arabic": {
+                        "type": "text",
+                        "analyzer": "arabic_analyzer"
+                    },
+                    "french": {
+                        "type": "text",
+                        "analyzer": "french_analyzer"
+                    },
+                    "spanish": {
+                        "type": "text",
+                        "analyzer": "spanish_analyzer"
+                    }
+                }
+            },
+            "ocr_language": {"type": "keyword"},
+            "ocr_confidence": {"type": "integer"},
+            "case_id": {"type": "integer"},
+            "uploaded_by": {"type": "integer"},
+            "indexed_at": {"type": "date"},
+            "is_searchable": {"type": "boolean"}
+        }
+    }
+}
+
 class ElasticsearchService:
     """Servicio de búsqueda de texto completo con Elasticsearch para documentos judiciales"""
     
@@ -45,59 +98,6 @@ class ElasticsearchService:
             return False
         
         try:
-            # Índice para documentos con análisis multi-idioma
-            documents_index = {
-                "settings": {
-                    "number_of_shards": 1,
-                    "number_of_replicas": 0,
-                    "analysis": {
-                        "analyzer": {
-                            "arabic_analyzer": {
-                                "type": "standard",
-                                "stopwords": "_arabic_"
-                            },
-                            "french_analyzer": {
-                                "type": "standard",
-                                "stopwords": "_french_"
-                            },
-                            "spanish_analyzer": {
-                                "type": "standard",
-                                "stopwords": "_spanish_"
-                            }
-                        }
-                    }
-                },
-                "mappings": {
-                    "properties": {
-                        "document_id": {"type": "integer"},
-                        "filename": {"type": "text"},
-                        "ocr_text": {
-                            "type": "text",
-                            "fields": {
-                                "arabic": {
-                                    "type": "text",
-                                    "analyzer": "arabic_analyzer"
-                                },
-                                "french": {
-                                    "type": "text",
-                                    "analyzer": "french_analyzer"
-                                },
-                                "spanish": {
-                                    "type": "text",
-                                    "analyzer": "spanish_analyzer"
-                                }
-                            }
-                        },
-                        "ocr_language": {"type": "keyword"},
-                        "ocr_confidence": {"type": "integer"},
-                        "case_id": {"type": "integer"},
-                        "uploaded_by": {"type": "integer"},
-                        "indexed_at": {"type": "date"},
-                        "is_searchable": {"type": "boolean"}
-                    }
-                }
-            }
-            
             # Índice para casos
             cases_index = {
                 "settings": {
@@ -135,7 +135,7 @@ class ElasticsearchService:
             
             # Crear índice de documentos
             if not self.es.indices.exists(index="judicial_documents"):
-                self.es.indices.create(index="judicial_documents", body=documents_index)
+                self.es.indices.create(index="judicial_documents", body=DOCUMENTS_INDEX_BODY)
                 logger.info("✅ Created 'judicial_documents' index")
             
             # Crear índice de casos
@@ -12,54 +12,279 @@ Performance:
 """
 
 import os
+import re
+import json
+import base64
 import time
+import hashlib
 import asyncio
+import bisect
 import logging
-from typing import List, Dict, Any, Optional
-from openai import OpenAI, AsyncOpenAI, OpenAIError
+import threading
+import weakref
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Union
+import importlib.util
+import httpx
+import numpy as np
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient, OpenAIError, RateLimitError
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from app.models import Document, DocumentEmbedding
 from app.services.cache_service import cache_service
 from app.services.metrics_service import metrics_service, MetricType
 
+try:
+    import tiktoken
+except ImportError:  # Optional: chunk_text falls back to fixed word-count windows
+    tiktoken = None
+
 logger = logging.getLogger(__name__)
 
+# Embedding model settings shared by every EmbeddingService
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_DIMENSIONS = 1536  # Optimized for pgvector HNSW index
+
+# Cached embeddings come back as float lists, fresh API results as float32 arrays
+EmbeddingVector = Union[List[float], np.ndarray]
+
+# HTTP/2 lets concurrent embedding requests multiplex over one TLS connection (needs httpx[http2])
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Whitespace-delimited words (same tokens as str.split())
+_WORD_RE = re.compile(r"\S+")
+
+# Tokenizer used by text-embedding-3-large (loaded once per process, on first use)
+_TOKEN_ENCODING = "cl100k_base"
+_token_encoder = None
+_token_encoder_loaded = False
+_token_encoder_lock = threading.Lock()
+
+
+# OpenAI clients shared by all EmbeddingService instances in the process, so their
+# connection pools (and TLS sessions) outlive a single request or Celery task.
+# httpx async pools are bound to the event loop that uses them: one client per loop.
+_shared_client: Optional[OpenAI] = None
+_shared_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+_client_lock = threading.Lock()
+
+
+def _openai_api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError(
+            "OPENAI_API_KEY not configured. Please add your OpenAI API key to secrets."
+        )
+    return api_key
+
+
+def _new_async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=_openai_api_key(),
+        http_client=DefaultAsyncHttpxClient(
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+        )
+    )
+
+
+def _get_shared_client() -> OpenAI:
+    """Process-wide sync OpenAI client (created on first use)."""
+    global _shared_client
+    with _client_lock:
+        if _shared_client is None:
+            _shared_client = OpenAI(api_key=_openai_api_key())
+        return _shared_client
+
+
+def _get_shared_async_client() -> Optional[AsyncOpenAI]:
+    """AsyncOpenAI client shared by everything on the running event loop (None outside a loop)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    with _client_lock:
+        client = _shared_async_clients.get(loop)
+        if client is None:
+            client = _shared_async_clients[loop] = _new_async_client()
+        return client
+
+
+def _get_token_encoder():
+    """Return the shared tiktoken encoder, or None if tiktoken is unavailable."""
+    global _token_encoder, _token_encoder_loaded
+    if not _token_encoder_loaded:
+        with _token_encoder_lock:
+            if not _token_encoder_loaded:
+                if tiktoken is not None:
+                    try:
+                        _token_encoder = tiktoken.get_encoding(_TOKEN_ENCODING)
+                    except Exception as e:
+                        logger.warning(f"tiktoken encoding unavailable, using word-count chunks: {e}")
+                _token_encoder_loaded = True
+    return _token_encoder
+
+
+def _word_token_counts(encoder, text: str, word_starts: np.ndarray) -> np.ndarray:
+    """
+    Number of tokens per word, from a single encode of the whole text.
+    
+    Each token is attributed to the word it starts in (leading whitespace
+    tokens go to the previous word), so the counts sum to the text's tokens.
+    """
+    _, token_offsets = encoder.decode_with_offsets(encoder.encode_ordinary(text))
+    token_words = np.searchsorted(word_starts, token_offsets, side="right") - 1
+    return np.bincount(np.maximum(token_words, 0), minlength=len(word_starts))
+
+
+def _count_tokens(texts: List[str]) -> Optional[List[int]]:
+    """Tokens per text with the embedding tokenizer, or None if tiktoken is unavailable."""
+    encoder = _get_token_encoder()
+    if encoder is None:
+        return None
+    return [len(ids) for ids in encoder.encode_ordinary_batch(texts)]
+
+
+def _pack_batches(token_counts: List[int], max_tokens: int, max_items: int) -> List[Tuple[int, int]]:
+    """
+    Greedily split a sequence into contiguous [start, end) batches holding at
+    most max_items items and max_tokens tokens (an item over the token budget
+    gets a batch of its own).
+    """
+    batches = []
+    start = 0
+    batch_tokens = 0
+    for index, count in enumerate(token_counts):
+        if index > start and (index - start >= max_items or batch_tokens + count > max_tokens):
+            batches.append((start, index))
+            start = index
+            batch_tokens = 0
+        batch_tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+def _chunk_windows(
+    word_starts: np.ndarray,
+    word_ends: np.ndarray,
+    chunk_size: int,
+    overlap: int,
+    min_chars: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute (start, end) character offsets of every overlapping word window.
+    
+    Windows begin and end on a word, so end - start equals the stripped chunk
+    length and the minimum-size filter is a vector comparison.
+    """
+    num_words = len(word_starts)
+    first_words = np.arange(0, num_words, chunk_size - overlap)
+    last_words = np.minimum(first_words + chunk_size, num_words) - 1
+    starts = word_starts[first_words]
+    ends = word_ends[last_words]
+    keep = (ends - starts) > min_chars
+    return starts[keep], ends[keep]
+
+
+def _token_windows(
+    word_starts: np.ndarray,
+    word_ends: np.ndarray,
+    word_tokens: np.ndarray,
+    max_tokens: int,
+    overlap: int,
+    min_chars: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute (start, end) character offsets of overlapping word windows that
+    each hold as many whole words as fit in max_tokens.
+    
+    Window ends are binary-searched over cumulative token counts; a single
+    word longer than the budget still gets a window of its own.
+    """
+    num_words = len(word_starts)
+    cumulative = list(accumulate(word_tokens.tolist(), initial=0))
+    first_words, last_words = [], []
+    first = 0
+    while first < num_words:
+        end = bisect.bisect_right(cumulative, cumulative[first] + max_tokens) - 1
+        end = min(max(end, first + 1), num_words)
+        first_words.append(first)
+        last_words.append(end - 1)
+        if end == num_words:
+            break
+        first = max(end - overlap, first + 1)
+    starts = word_starts[first_words]
+    ends = word_ends[last_words]
+    keep = (ends - starts) > min_chars
+    return starts[keep], ends[keep]
+
+
+@dataclass
+class ChunkPlan:
+    """
+    Struct-of-arrays view of a document's chunks: index-aligned character
+    offsets into the source text, cache keys and embeddings (None until
+    embedded). Chunk strings are not kept; they are re-sliced from the text.
+    """
+    text: str
+    starts: np.ndarray
+    ends: np.ndarray
+    keys: List[str]
+    hashes: List[str]
+    vectors: List[Optional[EmbeddingVector]]
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    def chunk(self, index: int) -> str:
+        return self.text[self.starts[index]:self.ends[index]]
+    
+    def chunks(self) -> Iterator[str]:
+        return (self.text[start:end] for start, end in zip(self.starts.tolist(), self.ends.tolist()))
+    
+    @property
+    def miss_indices(self) -> List[int]:
+        return [index for index, vector in enumerate(self.vectors) if vector is None]
+
 
 class EmbeddingService:
     """Service for generating and managing document embeddings for semantic search."""
     
     def __init__(self):
-        """Initialize service (OpenAI clients loaded lazily when needed)."""
+        """Initialize service (shared OpenAI clients picked up lazily when needed)."""
         self._client = None  # Sync client
-        self._async_client = None  # Async client
-        self.model = "text-embedding-3-large"
-        self.dimensions = 1536  # Optimized for pgvector HNSW index
-        self.chunk_size = 500  # Words per chunk
+        self._async_client = None  # Async client override (defaults to the running loop's shared client)
+        self.model = EMBEDDING_MODEL
+        self.dimensions = EMBEDDING_DIMENSIONS
+        self.chunk_size = 500  # Words per chunk (fallback when tiktoken is unavailable)
+        self.chunk_max_tokens = 800  # Tokens per chunk (tiktoken-based chunking)
         self.chunk_overlap = 50  # Words overlap between chunks
-        self.batch_size = 100  # Max chunks per OpenAI batch request
+        self.batch_size = 100  # Max chunks per OpenAI batch request (without tiktoken); streaming batch size
+        self.batch_max_items = 2048  # OpenAI limit on inputs per embeddings request
+        self.batch_max_tokens = 200_000  # Token budget per embeddings request (API limit is 300k)
         self.async_enabled = os.getenv("ASYNC_EMBEDDINGS_ENABLED", "true").lower() == "true"
+        self.inflight_wait_timeout = 30.0  # Seconds to wait on a duplicate in-flight fetch
     
     def _ensure_openai_client(self):
-        """Lazy-load OpenAI client (only when needed for embedding operations)."""
+        """Lazy-load OpenAI client (shared process-wide, only when needed for embedding operations)."""
         if self._client is None:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                raise ValueError(
-                    "OPENAI_API_KEY not configured. Please add your OpenAI API key to secrets."
-                )
-            self._client = OpenAI(api_key=api_key)
+            self._client = _get_shared_client()
         return self._client
     
     def _ensure_async_client(self):
-        """Lazy-load AsyncOpenAI client (only when needed for async operations)."""
-        if self._async_client is None:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                raise ValueError(
-                    "OPENAI_API_KEY not configured. Please add your OpenAI API key to secrets."
-                )
-            self._async_client = AsyncOpenAI(api_key=api_key)
-        return self._async_client
+        """Lazy-load AsyncOpenAI client (shared per event loop, only when needed for async operations)."""
+        if self._async_client is not None:
+            return self._async_client
+        shared = _get_shared_async_client()
+        if shared is None:
+            # Not on an event loop: keep a private client, as before
+            self._async_client = _new_async_client()
+            return self._async_client
+        return shared
     
     @property
     def client(self):
@@ -81,16 +306,104 @@ class EmbeddingService:
         Returns:
             List of text chunks
         """
-        words = text.split()
-        chunks = []
+        return list(self.iter_chunks(text))
+    
+    def iter_chunks(self, text: str) -> Iterator[str]:
+        """
+        Lazily yield the chunks of chunk_text (window offsets are computed up
+        front; the chunk strings are sliced only as they are consumed).
+        """
+        starts, ends = self._chunk_offsets(text)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield text[start:end]
+    
+    def _chunk_offsets(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(start, end) character offsets of every chunk (the whole text if it is too short)"""
+        # Character offsets of every word, so chunks are slices of the original text
+        spans = np.fromiter(
+            (pos for match in _WORD_RE.finditer(text) for pos in match.span()),
+            dtype=np.int64
+        )
+        word_starts, word_ends = spans[0::2], spans[1::2]
+        encoder = _get_token_encoder()
+        if encoder is not None and len(word_starts):
+            # Size chunks by the model's token budget rather than a word count
+            word_tokens = _word_token_counts(encoder, text, word_starts)
+            starts, ends = _token_windows(
+                word_starts, word_ends, word_tokens, self.chunk_max_tokens, self.chunk_overlap, min_chars=100
+            )
+        else:
+            starts, ends = _chunk_windows(
+                word_starts, word_ends, self.chunk_size, self.chunk_overlap, min_chars=100
+            )
+        if not len(starts):
+            return np.array([0]), np.array([len(text)])  # Return full text if too short
+        return starts, ends
+    
+    def build_chunk_plan(self, text: str) -> ChunkPlan:
+        """
+        Chunk, hash and look up a document's chunks in one pass.
         
-        for i in range(0, len(words), self.chunk_size - self.chunk_overlap):
-            chunk_words = words[i:i + self.chunk_size]
-            chunk = " ".join(chunk_words)
-            if len(chunk.strip()) > 100:  # Minimum chunk size (characters)
-                chunks.append(chunk)
+        Cache keys and chunk hashes are computed for every chunk up front;
+        cache hits are filled in as float16 rows and misses are left as None.
+        """
+        starts, ends = self._chunk_offsets(text)
+        chunks = [text[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+        keys = cache_service.embedding_keys(chunks, self.model)
+        hashes = self._chunk_hashes(chunks)
+        vectors: List[Optional[EmbeddingVector]] = [None] * len(keys)
+        cached, miss_indices = cache_service.get_embeddings_batch_by_keys(keys)
+        if cached is not None:
+            hits = np.ones(len(keys), dtype=bool)
+            hits[miss_indices] = False
+            for index in np.flatnonzero(hits).tolist():
+                vectors[index] = cached[index]
+        return ChunkPlan(text, starts, ends, keys, hashes, vectors)
+    
+    def _claim_or_join_fetch(self, text: str) -> Tuple[Optional[List[float]], Optional[threading.Event]]:
+        """
+        Own the embedding fetch for text, or join the one already in flight.
         
-        return chunks if chunks else [text]  # Return full text if too short
+        Returns (embedding, None) once another caller caches it, or
+        (None, event) when this caller won the claim and must call
+        set_embedding() or release_embedding_fetch(..., event). If the
+        claim is not won within inflight_wait_timeout, returns (None, None):
+        the caller fetches without owning (and so never releases) the key.
+        After a failed fetch, waiters re-claim so only one of them retries.
+        """
+        deadline = time.monotonic() + self.inflight_wait_timeout
+        while True:
+            owner, inflight = cache_service.claim_embedding_fetch(text, self.model)
+            if owner:
+                return None, inflight
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, None
+            inflight.wait(timeout=remaining)
+            cached = cache_service.get_embedding(text, self.model)
+            if cached is not None:
+                return cached, None
+    
+    async def _claim_or_join_fetch_async(self, text: str) -> Tuple[Optional[List[float]], Optional[threading.Event]]:
+        """
+        _claim_or_join_fetch for the event loop: waits by polling the event
+        with short sleeps instead of parking an executor thread per waiter.
+        """
+        deadline = time.monotonic() + self.inflight_wait_timeout
+        while True:
+            owner, inflight = cache_service.claim_embedding_fetch(text, self.model)
+            if owner:
+                return None, inflight
+            delay = 0.005
+            while not inflight.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, None
+                await asyncio.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.1)
+            cached = cache_service.get_embedding(text, self.model)
+            if cached is not None:
+                return cached, None
     
     def generate_embedding(self, text: str) -> List[float]:
         """
@@ -105,7 +418,10 @@ class EmbeddingService:
         Raises:
             Exception: If OpenAI API call fails
         """
+        inflight = None
         cached = cache_service.get_embedding(text, self.model)
+        if cached is None:
+            cached, inflight = self._claim_or_join_fetch(text)
         if cached is not None:
             # Record cache hit
             metrics_service.record_latency(
@@ -134,7 +450,152 @@ class EmbeddingService:
             cache_service.set_embedding(text, embedding, self.model)
             return embedding
         except OpenAIError as e:
+            if inflight is not None:
+                cache_service.release_embedding_fetch(text, self.model, inflight)
             raise Exception(f"OpenAI API error: {str(e)}")
+        except Exception:
+            if inflight is not None:
+                cache_service.release_embedding_fetch(text, self.model, inflight)
+            raise
+    
+    @staticmethod
+    def _text_hash(text: str) -> str:
+        """128-bit fingerprint of an OCR text (or chunk) an embedding was built from"""
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    
+    def _chunk_hashes(self, chunks: Iterable[str]) -> List[str]:
+        """
+        chunk_hash of each chunk: blake2b-128 of "model:dimensions:chunk", so a
+        stored vector is only reused for the same text under the same model
+        and dimensions
+        """
+        prefix = f"{self.model}:{self.dimensions}:".encode()
+        hashes = []
+        for chunk in chunks:
+            digest = hashlib.blake2b(prefix, digest_size=16)
+            digest.update(chunk.encode())
+            hashes.append(digest.hexdigest())
+        return hashes
+    
+    def _check_existing_embeddings(
+        self,
+        document: Document,
+        source_hash: str,
+        db: Session,
+        force_regenerate: bool
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Decide whether a document needs (re-)embedding.
+        
+        Returns the "already_embedded" result when stored embeddings match the
+        current OCR text; otherwise returns None so the caller (re-)embeds the
+        document and replaces its stored embeddings (_delete_embeddings).
+        """
+        if not force_regenerate:
+            if document.embedding_source_hash == source_hash:
+                # Same OCR text as the stored embeddings: no COUNT, no API calls
+                existing_count = document.embedding_chunk_count
+            elif document.embedding_source_hash is None:
+                # Embedded before source hashes were tracked
+                existing_count = db.query(DocumentEmbedding).filter(
+                    DocumentEmbedding.document_id == document.id,
+                    DocumentEmbedding.firm_id == document.firm_id
+                ).count()
+            else:
+                existing_count = 0  # OCR text changed since the last embedding
+            
+            if existing_count:
+                return {
+                    "document_id": document.id,
+                    "chunks_embedded": existing_count,
+                    "status": "already_embedded",
+                    "message": "Document already has embeddings. Use force_regenerate=True to regenerate."
+                }
+        
+        return None
+    
+    def _delete_embeddings(self, document: Document, db: Session, force_regenerate: bool):
+        """Delete a document's stored embeddings before re-embedding it (no-op if it never had any)"""
+        if force_regenerate or document.embedding_source_hash is not None:
+            db.query(DocumentEmbedding).filter(
+                DocumentEmbedding.document_id == document.id,
+                DocumentEmbedding.firm_id == document.firm_id
+            ).delete()
+    
+    def _reuse_stored_embeddings(self, plan: ChunkPlan, document: Document, db: Session) -> int:
+        """
+        Fill plan misses from the document's stored embeddings whose chunk_hash
+        is unchanged, so re-embedding an edited document only pays for the
+        chunks that actually changed. Returns the number of chunks reused.
+        """
+        missing = {plan.hashes[index] for index in plan.miss_indices}
+        if not missing or document.embedding_source_hash is None:
+            return 0
+        
+        stored = dict(
+            db.query(DocumentEmbedding.chunk_hash, DocumentEmbedding.embedding).filter(
+                DocumentEmbedding.document_id == document.id,
+                DocumentEmbedding.firm_id == document.firm_id,
+                DocumentEmbedding.chunk_hash.in_(missing)
+            ).all()
+        )
+        reused = 0
+        for index in plan.miss_indices:
+            vector = stored.get(plan.hashes[index])
+            if vector is not None:
+                plan.vectors[index] = vector.to_numpy()
+                reused += 1
+        return reused
+    
+    def _insert_embeddings(
+        self,
+        document_id: int,
+        firm_id: int,
+        chunks: Iterable[str],
+        embeddings: List[Optional[EmbeddingVector]],
+        db: Session,
+        chunk_hashes: Optional[List[str]] = None
+    ) -> int:
+        """
+        Insert all successfully embedded chunks with one executemany INSERT
+        (no per-row ORM unit-of-work). Caller commits. Returns rows inserted.
+        """
+        if chunk_hashes is None:
+            chunks = list(chunks)
+            chunk_hashes = self._chunk_hashes(chunks)
+        rows = [
+            {
+                "document_id": document_id,
+                "firm_id": firm_id,
+                "chunk_text": chunk,
+                "chunk_index": idx,
+                "chunk_hash": chunk_hashes[idx],
+                "embedding": embedding_vector
+            }
+            for idx, (chunk, embedding_vector) in enumerate(zip(chunks, embeddings))
+            if embedding_vector is not None
+        ]
+        if rows:
+            db.execute(insert(DocumentEmbedding), rows)
+        return len(rows)
+    
+    def _persist_embeddings(
+        self,
+        document: Document,
+        chunks: Iterable[str],
+        embeddings: List[Optional[EmbeddingVector]],
+        source_hash: str,
+        db: Session,
+        chunk_hashes: Optional[List[str]] = None
+    ) -> int:
+        """Insert a document's embeddings, record their provenance and commit. Returns rows inserted."""
+        embeddings_created = self._insert_embeddings(
+            document.id, document.firm_id, chunks, embeddings, db, chunk_hashes
+        )
+        document.embedding_source_hash = source_hash
+        document.embedding_chunk_count = embeddings_created
+        db.commit()
+        return embeddings_created
     
     def embed_document(
         self,
@@ -173,55 +634,32 @@ class EmbeddingService:
                 "Document has no OCR text or text too short. Run OCR first."
             )
         
-        # Check if already embedded
-        existing_count = db.query(DocumentEmbedding).filter(
-            DocumentEmbedding.document_id == document_id,
-            DocumentEmbedding.firm_id == firm_id
-        ).count()
-        
-        if existing_count > 0 and not force_regenerate:
-            return {
-                "document_id": document_id,
-                "chunks_embedded": existing_count,
-                "status": "already_embedded",
-                "message": "Document already has embeddings. Use force_regenerate=True to regenerate."
-            }
-        
-        # Delete existing embeddings if regenerating
-        if force_regenerate:
-            db.query(DocumentEmbedding).filter(
-                DocumentEmbedding.document_id == document_id,
-                DocumentEmbedding.firm_id == firm_id
-            ).delete()
-        
-        # Chunk the document
-        chunks = self.chunk_text(document.ocr_text)
+        # Check if already embedded (skips all work when the OCR text is unchanged)
+        source_hash = self._text_hash(document.ocr_text)
+        already_embedded = self._check_existing_embeddings(document, source_hash, db, force_regenerate)
+        if already_embedded is not None:
+            return already_embedded
         
-        # Generate embeddings for each chunk
+        # Chunk, hash and look up the document (same plan as the async path)
         start_time = time.time()
-        embeddings_created = 0
+        plan = self.build_chunk_plan(document.ocr_text)
+        
+        # Unchanged chunks keep their stored embeddings, unless a full rebuild was requested
+        if not force_regenerate:
+            self._reuse_stored_embeddings(plan, document, db)
+        self._delete_embeddings(document, db, force_regenerate)
         
-        for idx, chunk in enumerate(chunks):
+        # Generate embeddings for each remaining chunk
+        for idx in plan.miss_indices:
             try:
-                # Generate embedding
-                embedding_vector = self.generate_embedding(chunk)
-                
-                # Store in database
-                doc_embedding = DocumentEmbedding(
-                    document_id=document_id,
-                    firm_id=firm_id,
-                    chunk_text=chunk,
-                    chunk_index=idx,
-                    embedding=embedding_vector
-                )
-                db.add(doc_embedding)
-                embeddings_created += 1
-                
+                plan.vectors[idx] = self.generate_embedding(plan.chunk(idx))
             except Exception as e:
                 print(f"Error embedding chunk {idx}: {str(e)}")
-                continue
         
-        db.commit()
+        # Store in database
+        embeddings_created = self._persist_embeddings(
+            document, plan.chunks(), plan.vectors, source_hash, db, plan.hashes
+        )
         processing_time = time.time() - start_time
         
         # Record metrics
@@ -232,7 +670,7 @@ class EmbeddingService:
             metadata={
                 'document_id': document_id,
                 'chunks_embedded': embeddings_created,
-                'total_chunks': len(chunks)
+                'total_chunks': len(plan)
             }
         )
         
@@ -240,7 +678,7 @@ class EmbeddingService:
             "document_id": document_id,
             "document_name": document.file_name,
             "chunks_embedded": embeddings_created,
-            "total_chunks": len(chunks),
+            "total_chunks": len(plan),
             "processing_time_seconds": round(processing_time, 2),
             "status": "success"
         }
@@ -264,6 +702,11 @@ class EmbeddingService:
         if cached is not None:
             return cached
         
+        # Own the fetch, or join the one already in flight (without blocking the loop)
+        cached, inflight = await self._claim_or_join_fetch_async(text)
+        if cached is not None:
+            return cached
+        
         try:
             response = await self.async_client.embeddings.create(
                 model=self.model,
@@ -276,62 +719,188 @@ class EmbeddingService:
             cache_service.set_embedding(text, embedding, self.model)
             return embedding
         except OpenAIError as e:
+            if inflight is not None:
+                cache_service.release_embedding_fetch(text, self.model, inflight)
             # Preserve OpenAIError type for retry logic in generate_embeddings_batch
             logger.debug(f"OpenAI async API error (will retry): {str(e)}")
             raise
+        except Exception:
+            if inflight is not None:
+                cache_service.release_embedding_fetch(text, self.model, inflight)
+            raise
+    
+    @staticmethod
+    def _retry_after_seconds(error: OpenAIError) -> Optional[float]:
+        """Seconds requested by a 429 Retry-After header, if any"""
+        if not isinstance(error, RateLimitError):
+            return None
+        try:
+            return float(error.response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _decode_embeddings(content: bytes, count: int) -> List[Optional[np.ndarray]]:
+        """
+        Decode a base64 embeddings response body straight into float32 arrays,
+        scattered by response index (order is not guaranteed).
+        """
+        vectors: List[Optional[np.ndarray]] = [None] * count
+        for item in json.loads(content)["data"]:
+            vectors[item["index"]] = np.frombuffer(base64.b64decode(item["embedding"]), dtype=np.float32)
+        return vectors
+    
+    async def _embed_batch_with_retry(
+        self,
+        batch_texts: List[str],
+        max_retries: int,
+        batch_keys: Optional[List[str]] = None
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Embed a group of texts in one API request (array input) with exponential backoff retry.
+        
+        batch_keys are the texts' precomputed cache keys (see cache_service.embedding_keys).
+        Returns float32 vectors aligned with batch_texts (all None if the batch permanently failed).
+        """
+        if batch_keys is None:
+            batch_keys = cache_service.embedding_keys(batch_texts, self.model)
+        for attempt in range(max_retries):
+            try:
+                logger.debug(f"Embedding batch of {len(batch_texts)} chunks (attempt {attempt + 1})")
+                # Raw response: skip building a pydantic object and a Python float per dimension
+                response = await self.async_client.embeddings.with_raw_response.create(
+                    model=self.model,
+                    input=batch_texts,
+                    dimensions=self.dimensions,
+                    encoding_format="base64"
+                )
+                vectors = self._decode_embeddings(response.content, len(batch_texts))
+                
+                stored = [i for i, vector in enumerate(vectors) if vector is not None]
+                cache_service.set_embeddings_many(
+                    [(batch_texts[i], vectors[i]) for i in stored],
+                    self.model,
+                    keys=[batch_keys[i] for i in stored]
+                )
+                return vectors
+            except OpenAIError as e:
+                # Exponential backoff: 1s, 2s, 4s (or the server's Retry-After on 429)
+                wait_time = self._retry_after_seconds(e) or 2 ** attempt
+                if attempt < max_retries - 1:
+                    logger.warning(
+                        f"Batch embedding failed (attempt {attempt + 1}/{max_retries}): {e}. "
+                        f"Retrying in {wait_time}s..."
+                    )
+                    await asyncio.sleep(wait_time)
+                else:
+                    logger.error(
+                        f"Batch of {len(batch_texts)} chunks permanently failed after {max_retries} attempts: {e}"
+                    )
+            except Exception as e:
+                # Non-retryable error (e.g., validation)
+                logger.error(f"Non-retryable error for batch of {len(batch_texts)} chunks: {e}")
+                break
+        
+        return [None] * len(batch_texts)
+    
+    async def _embed_texts(
+        self,
+        texts: List[str],
+        keys: List[str],
+        semaphore: asyncio.Semaphore,
+        max_retries: int
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Embed texts known to be cache misses, packed into as few requests as the
+        token budget allows (fixed batch_size without tiktoken) and dispatched
+        concurrently. Returns vectors aligned with texts.
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        
+        async def embed_batch(start: int, end: int):
+            """Embed one batch and write its slice of results (disjoint indices, no lock needed)"""
+            async with semaphore:
+                results[start:end] = await self._embed_batch_with_retry(
+                    texts[start:end], max_retries, keys[start:end]
+                )
+        
+        token_counts = _count_tokens(texts)
+        if token_counts is None:
+            bounds = _pack_batches([0] * len(texts), self.batch_max_tokens, self.batch_size)
+        else:
+            bounds = _pack_batches(token_counts, self.batch_max_tokens, self.batch_max_items)
+        await asyncio.gather(*(embed_batch(start, end) for start, end in bounds))
+        return results
     
     async def generate_embeddings_batch(
         self,
         texts: List[str],
         semaphore: Optional[asyncio.Semaphore] = None,
         max_retries: int = 3
-    ) -> List[Optional[List[float]]]:
+    ) -> List[Optional[EmbeddingVector]]:
         """
-        Generate embeddings for multiple texts in parallel with backpressure and retry.
+        Generate embeddings for multiple texts, sending cache misses in array-input batches.
         
         Args:
             texts: List of texts to embed
             semaphore: Optional semaphore for rate limiting
-            max_retries: Maximum retries per chunk (default: 3)
+            max_retries: Maximum retries per batch (default: 3)
         
         Returns:
             List of embedding vectors (None for permanently failed chunks)
         """
         if semaphore is None:
-            semaphore = asyncio.Semaphore(10)  # Default: 10 concurrent requests
+            semaphore = asyncio.Semaphore(5)  # Default: 5 batch requests in flight
         
-        async def embed_with_semaphore_and_retry(text: str, index: int):
-            """Embed single chunk with exponential backoff retry"""
-            async with semaphore:
-                for attempt in range(max_retries):
-                    try:
-                        logger.debug(f"Embedding chunk {index + 1}/{len(texts)} (attempt {attempt + 1})")
-                        return await self.generate_embedding_async(text)
-                    except OpenAIError as e:
-                        # Exponential backoff: 1s, 2s, 4s
-                        wait_time = 2 ** attempt
-                        if attempt < max_retries - 1:
-                            logger.warning(
-                                f"Chunk {index} embedding failed (attempt {attempt + 1}/{max_retries}): {e}. "
-                                f"Retrying in {wait_time}s..."
-                            )
-                            await asyncio.sleep(wait_time)
-                        else:
-                            logger.error(
-                                f"Chunk {index} permanently failed after {max_retries} attempts: {e}"
-                            )
-                            return None
-                    except Exception as e:
-                        # Non-retryable error (e.g., validation)
-                        logger.error(f"Non-retryable error for chunk {index}: {e}")
-                        return None
-                
-                return None  # Should never reach here
+        # Embed each distinct text once (OCR'd documents repeat headers/footers verbatim)
+        unique_texts = list(dict.fromkeys(texts))
         
-        tasks = [embed_with_semaphore_and_retry(text, i) for i, text in enumerate(texts)]
-        results = await asyncio.gather(*tasks, return_exceptions=False)
+        # One batched cache lookup instead of a get per chunk (keys hashed once, reused on store)
+        keys = cache_service.embedding_keys(unique_texts, self.model)
+        unique_results = cache_service.get_embeddings_many(unique_texts, self.model, keys=keys)
+        miss_indices = [index for index, cached in enumerate(unique_results) if cached is None]
         
-        return results
+        vectors = await self._embed_texts(
+            [unique_texts[i] for i in miss_indices], [keys[i] for i in miss_indices], semaphore, max_retries
+        )
+        for index, vector in zip(miss_indices, vectors):
+            unique_results[index] = vector
+        
+        if len(unique_texts) == len(texts):
+            return unique_results
+        
+        # Scatter back to the caller's order, duplicates included
+        by_text = dict(zip(unique_texts, unique_results))
+        return [by_text[text] for text in texts]
+    
+    async def _embed_plan_misses(
+        self,
+        plan: ChunkPlan,
+        semaphore: asyncio.Semaphore,
+        max_retries: int = 3
+    ):
+        """
+        Embed a plan's cache misses, each distinct chunk once, in one
+        _embed_texts call (batched and dispatched concurrently there).
+        Results are written into plan.vectors (None where embedding failed).
+        """
+        first_index: Dict[str, int] = {}
+        duplicates: List[int] = []
+        unique: List[int] = []
+        for index in plan.miss_indices:
+            if plan.keys[index] in first_index:
+                duplicates.append(index)  # Same chunk text as an earlier miss
+                continue
+            first_index[plan.keys[index]] = index
+            unique.append(index)
+        
+        vectors = await self._embed_texts(
+            [plan.chunk(i) for i in unique], [plan.keys[i] for i in unique], semaphore, max_retries
+        )
+        for index, vector in zip(unique, vectors):
+            plan.vectors[index] = vector
+        for index in duplicates:
+            plan.vectors[index] = plan.vectors[first_index[plan.keys[index]]]
     
     async def embed_document_async(
         self,
@@ -367,52 +936,31 @@ class EmbeddingService:
                 "Document has no OCR text or text too short. Run OCR first."
             )
         
-        # Check if already embedded
-        existing_count = db.query(DocumentEmbedding).filter(
-            DocumentEmbedding.document_id == document_id,
-            DocumentEmbedding.firm_id == firm_id
-        ).count()
-        
-        if existing_count > 0 and not force_regenerate:
-            return {
-                "document_id": document_id,
-                "chunks_embedded": existing_count,
-                "status": "already_embedded",
-                "message": "Document already has embeddings. Use force_regenerate=True to regenerate.",
-                "async_processing": True
-            }
+        # Check if already embedded (skips all work when the OCR text is unchanged)
+        source_hash = self._text_hash(document.ocr_text)
+        already_embedded = self._check_existing_embeddings(document, source_hash, db, force_regenerate)
+        if already_embedded is not None:
+            already_embedded["async_processing"] = True
+            return already_embedded
         
-        # Delete existing embeddings if regenerating
-        if force_regenerate:
-            db.query(DocumentEmbedding).filter(
-                DocumentEmbedding.document_id == document_id,
-                DocumentEmbedding.firm_id == firm_id
-            ).delete()
+        # Chunk, hash and look up the document in one pass, then embed the misses in parallel
+        start_time = time.time()
+        plan = self.build_chunk_plan(document.ocr_text)
         
-        # Chunk the document
-        chunks = self.chunk_text(document.ocr_text)
-        logger.info(f"Embedding {len(chunks)} chunks for document {document_id} (async mode)")
+        # Unchanged chunks keep their stored embeddings (only the delta is re-embedded),
+        # unless a full rebuild was requested, e.g. after a model/dimensions change
+        reused = 0 if force_regenerate else self._reuse_stored_embeddings(plan, document, db)
+        self._delete_embeddings(document, db, force_regenerate)
         
-        # Generate embeddings in parallel
-        start_time = time.time()
-        semaphore = asyncio.Semaphore(10)  # Max 10 concurrent embedding requests
-        embeddings = await self.generate_embeddings_batch(chunks, semaphore)
-        
-        # Store embeddings in database
-        embeddings_created = 0
-        for idx, (chunk, embedding_vector) in enumerate(zip(chunks, embeddings)):
-            if embedding_vector is not None:
-                doc_embedding = DocumentEmbedding(
-                    document_id=document_id,
-                    firm_id=firm_id,
-                    chunk_text=chunk,
-                    chunk_index=idx,
-                    embedding=embedding_vector
-                )
-                db.add(doc_embedding)
-                embeddings_created += 1
+        semaphore = asyncio.Semaphore(5)  # Max 5 concurrent batch requests
+        await self._embed_plan_misses(plan, semaphore)
+        logger.info(f"Embedded {len(plan)} chunks for document {document_id} (async mode, {reused} reused)")
         
-        db.commit()
+        # Store embeddings in a worker thread so the sync INSERT/COMMIT does not block the
+        # event loop; the session is not used meanwhile
+        embeddings_created = await asyncio.to_thread(
+            self._persist_embeddings, document, plan.chunks(), plan.vectors, source_hash, db, plan.hashes
+        )
         processing_time = time.time() - start_time
         
         # Record metrics
@@ -423,12 +971,12 @@ class EmbeddingService:
             metadata={
                 'document_id': document_id,
                 'chunks_embedded': embeddings_created,
-                'total_chunks': len(chunks)
+                'total_chunks': len(plan)
             }
         )
         
         logger.info(
-            f"✅ Async embedding completed: {embeddings_created}/{len(chunks)} chunks "
+            f"✅ Async embedding completed: {embeddings_created}/{len(plan)} chunks "
             f"in {processing_time:.2f}s for document {document_id}"
         )
         
@@ -436,25 +984,228 @@ class EmbeddingService:
             "document_id": document_id,
             "document_name": document.file_name,
             "chunks_embedded": embeddings_created,
-            "total_chunks": len(chunks),
+            "total_chunks": len(plan),
             "processing_time_seconds": round(processing_time, 2),
             "status": "success",
             "async_processing": True
         }
     
-    def embed_query(self, query: str) -> List[float]:
+    def _batch_request_lines(self, document_chunks: Dict[int, List[str]]) -> str:
+        """Batch API input (JSONL): one /v1/embeddings request per chunk, custom_id "doc_id:chunk_index"."""
+        return "\n".join(
+            json.dumps({
+                "custom_id": f"{document_id}:{chunk_index}",
+                "method": "POST",
+                "url": "/v1/embeddings",
+                "body": {"model": self.model, "input": chunk, "dimensions": self.dimensions}
+            }, ensure_ascii=False)
+            for document_id, chunks in document_chunks.items()
+            for chunk_index, chunk in enumerate(chunks)
+        )
+    
+    @staticmethod
+    def _parse_batch_output(output: str) -> Dict[int, Dict[int, List[float]]]:
+        """Map Batch API output lines to {document_id: {chunk_index: embedding}} (failed lines are skipped)."""
+        vectors: Dict[int, Dict[int, List[float]]] = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                logger.warning(f"Batch embedding request {record.get('custom_id')} failed: {record.get('error')}")
+                continue
+            document_id, chunk_index = map(int, record["custom_id"].split(":"))
+            vectors.setdefault(document_id, {})[chunk_index] = response["body"]["data"][0]["embedding"]
+        return vectors
+    
+    def submit_batch_embedding_job(
+        self,
+        document_ids: List[int],
+        firm_id: int,
+        db: Session
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Submit documents to the OpenAI Batch API (24h window, ~50% cheaper) for bulk backfills.
+        
+        Interactive embedding should keep using embed_document_async; this path
+        is for indexing a firm's existing corpus. Documents whose embeddings
+        already match their OCR text are skipped.
+        
+        Args:
+            document_ids: Documents to embed
+            firm_id: Firm ID for tenant isolation
+            db: Database session
+        
+        Returns:
+            Dict with batch_id and the per-document {source_hash, chunk_count} needed
+            to collect the results, or None if no document needs embedding
+        """
+        documents = db.query(Document).filter(
+            Document.id.in_(document_ids),
+            Document.firm_id == firm_id
+        ).all()
+        
+        document_chunks: Dict[int, List[str]] = {}
+        manifest: Dict[str, Dict[str, Any]] = {}
+        for document in documents:
+            if not document.ocr_text or len(document.ocr_text.strip()) < 100:
+                continue
+            source_hash = self._text_hash(document.ocr_text)
+            if document.embedding_source_hash == source_hash:
+                continue
+            chunks = self.chunk_text(document.ocr_text)
+            document_chunks[document.id] = chunks
+            manifest[str(document.id)] = {"source_hash": source_hash, "chunk_count": len(chunks)}
+        
+        if not document_chunks:
+            return None
+        
+        try:
+            input_file = self.client.files.create(
+                file=("embeddings.jsonl", self._batch_request_lines(document_chunks).encode("utf-8")),
+                purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/embeddings",
+                completion_window="24h"
+            )
+        except OpenAIError as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+        
+        logger.info(
+            f"Submitted embedding batch {batch.id}: {len(document_chunks)} documents, "
+            f"{sum(len(chunks) for chunks in document_chunks.values())} chunks"
+        )
+        return {"batch_id": batch.id, "firm_id": firm_id, "documents": manifest}
+    
+    def collect_batch_embedding_job(
+        self,
+        batch_id: str,
+        firm_id: int,
+        documents: Dict[str, Dict[str, Any]],
+        db: Session
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Store the results of a finished embedding batch.
+        
+        Args:
+            batch_id: OpenAI batch ID returned by submit_batch_embedding_job
+            firm_id: Firm ID for tenant isolation
+            documents: Per-document manifest returned by submit_batch_embedding_job
+            db: Database session
+        
+        Returns:
+            None while the batch is still running, otherwise a dict with the batch
+            status and the number of documents/chunks stored
+        """
+        try:
+            batch = self.client.batches.retrieve(batch_id)
+        except OpenAIError as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+        
+        if batch.status in ("validating", "in_progress", "finalizing"):
+            return None
+        if batch.status != "completed" or not batch.output_file_id:
+            logger.error(f"Embedding batch {batch_id} ended with status {batch.status}")
+            return {"batch_id": batch_id, "status": batch.status, "documents_embedded": 0, "chunks_embedded": 0}
+        
+        vectors = self._parse_batch_output(self.client.files.content(batch.output_file_id).text)
+        
+        documents_embedded = 0
+        chunks_embedded = 0
+        for document in db.query(Document).filter(
+            Document.id.in_([int(document_id) for document_id in documents]),
+            Document.firm_id == firm_id
+        ).all():
+            expected = documents[str(document.id)]
+            # Skip documents whose OCR text changed (or re-chunks differently) since submission
+            if not document.ocr_text or self._text_hash(document.ocr_text) != expected["source_hash"]:
+                logger.info(f"Skipping batch results for document {document.id}: OCR text changed")
+                continue
+            chunks = self.chunk_text(document.ocr_text)
+            if len(chunks) != expected["chunk_count"]:
+                logger.warning(f"Skipping batch results for document {document.id}: chunking changed")
+                continue
+            
+            document_vectors = vectors.get(document.id, {})
+            embeddings = [document_vectors.get(chunk_index) for chunk_index in range(len(chunks))]
+            
+            db.query(DocumentEmbedding).filter(
+                DocumentEmbedding.document_id == document.id,
+                DocumentEmbedding.firm_id == firm_id
+            ).delete()
+            created = self._insert_embeddings(document.id, firm_id, chunks, embeddings, db)
+            document.embedding_source_hash = expected["source_hash"]
+            document.embedding_chunk_count = created
+            cache_service.set_embeddings_many(
+                [(chunk, vector) for chunk, vector in zip(chunks, embeddings) if vector is not None],
+                self.model
+            )
+            documents_embedded += 1
+            chunks_embedded += created
+        
+        db.commit()
+        logger.info(
+            f"✅ Embedding batch {batch_id} stored: {chunks_embedded} chunks for {documents_embedded} documents"
+        )
+        return {
+            "batch_id": batch_id,
+            "status": batch.status,
+            "documents_embedded": documents_embedded,
+            "chunks_embedded": chunks_embedded
+        }
+    
+    def embed_query(self, query: str) -> EmbeddingVector:
         """
         Generate embedding for a search query.
         
+        Chat queries repeat heavily, so whitespace is normalized before the
+        cache lookup and a cached hit is returned as the stored float16 array
+        (no list conversion; semantic search rounds to halfvec anyway).
+        
         Args:
             query: Search query text
         
         Returns:
             1536-dimensional vector
         """
+        query = " ".join(query.split())
+        cached = cache_service.get_embedding_np(query, self.model)
+        if cached is not None:
+            metrics_service.record_latency(
+                metric_type=MetricType.CACHE_HIT,
+                duration_seconds=0.0,
+                success=True,
+                metadata={'cache_type': 'query_embedding'}
+            )
+            return cached
         return self.generate_embedding(query)
 
 
+# Per-process event loop (and service) reused by embed_document_sync_wrapper, so the
+# AsyncOpenAI connection pool and its TLS sessions stay warm across documents.
+# Started lazily so Celery prefork children each get their own loop thread.
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_service: Optional[EmbeddingService] = None
+_background_lock = threading.Lock()
+
+
+def _get_background_loop() -> Tuple[asyncio.AbstractEventLoop, EmbeddingService]:
+    """Return the shared background event loop and service, starting the loop thread on first use."""
+    global _background_loop, _background_service
+    with _background_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="embedding-event-loop", daemon=True
+            ).start()
+            _background_loop = loop
+            _background_service = EmbeddingService()
+        return _background_loop, _background_service
+
+
 # Helper function for running async embedding in sync contexts (e.g., Celery)
 def embed_document_sync_wrapper(
     document_id: int,
@@ -476,20 +1227,16 @@ def embed_document_sync_wrapper(
     Returns:
         Dict with embedding stats
     """
-    service = EmbeddingService()
+    loop, service = _get_background_loop()
     
     if use_async and service.async_enabled:
         try:
-            # Run async version
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(
-                    service.embed_document_async(document_id, firm_id, db, force_regenerate)
-                )
-                return result
-            finally:
-                loop.close()
+            # Run async version on the shared loop (caller blocks, so db is never used concurrently)
+            future = asyncio.run_coroutine_threadsafe(
+                service.embed_document_async(document_id, firm_id, db, force_regenerate),
+                loop
+            )
+            return future.result()
         except Exception as e:
             logger.warning(f"Async embedding failed, falling back to sync: {e}")
             # Fallback to sync
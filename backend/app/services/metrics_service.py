@@ -3,8 +3,9 @@ Metrics Service - Optimized performance tracking and monitoring
 Tracks latencies, success/failure rates, and resource usage across async pipeline
 
 Optimizations for 600 concurrent tenants:
+- Lock-free recording (samples buffered in per-thread-sharded deques, folded in batches)
 - Sharded locks (per metric type) to reduce contention
-- Incremental quantile tracking (no full sorting on each event)
+- Fixed-bucket latency histograms (percentiles without sorting)
 - Lightweight counters (minimal metadata storage)
 - Lock-free reads where possible
 - Thread-safe operations without global bottleneck
@@ -16,17 +17,19 @@ Features:
 - Prometheus-compatible format
 """
 
+import os
 import time
 import logging
+import itertools
 import math
-import random
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from collections import defaultdict
-from threading import RLock
+from datetime import datetime, timedelta, timezone
+from collections import Counter, deque
+from threading import Lock, local
 from enum import Enum
-import statistics
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +47,99 @@ class MetricType(str, Enum):
     CACHE_MISS = "cache_miss"
 
 
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (HDR-style)
+    
+    Fixed buckets from 1µs to 60s, each 1% wider than the previous one:
+    - O(1) memory per metric (~1.8k counters), whatever the sample count
+    - Percentiles in O(#buckets) from a cumulative sum, no sorting
+    - Every reported percentile is within 1% of a recorded sample
+    
+    Durations under 1µs land in a zero bucket; durations over 60s are clamped
+    to the last bucket (min/max are tracked exactly by AggregatedMetrics).
+    """
+    MIN_SECONDS = 1e-6
+    MAX_SECONDS = 60.0
+    RELATIVE_PRECISION = 0.01
+    
+    _LOG_GROWTH = math.log1p(RELATIVE_PRECISION)
+    BUCKET_COUNT = 2 + int(math.log(MAX_SECONDS / MIN_SECONDS) / _LOG_GROWTH)
+    
+    def __init__(self):
+        self.counts = np.zeros(self.BUCKET_COUNT, dtype=np.int64)
+        self.total_count = 0
+    
+    def record_many(self, durations_seconds: List[float]):
+        """Add a batch of durations (vectorized bucket lookup)"""
+        if not len(durations_seconds):
+            return
+        
+        values = np.asarray(durations_seconds, dtype=np.float64)
+        buckets = np.zeros(len(values), dtype=np.intp)
+        nonzero = values >= self.MIN_SECONDS
+        buckets[nonzero] = 1 + (np.log(values[nonzero] / self.MIN_SECONDS) / self._LOG_GROWTH).astype(np.intp)
+        np.minimum(buckets, self.BUCKET_COUNT - 1, out=buckets)
+        
+        self.counts += np.bincount(buckets, minlength=self.BUCKET_COUNT)
+        self.total_count += len(values)
+    
+    def value_at_percentile(self, percentile: float) -> float:
+        """Get the duration (seconds) at a percentile (0-100)"""
+        return self.values_at_percentiles([percentile])[0]
+    
+    def values_at_percentiles(self, percentiles: List[float]) -> List[float]:
+        """Get the durations (seconds) at several percentiles from one cumulative sum"""
+        if not self.total_count:
+            return [0.0] * len(percentiles)
+        
+        ranks = [max(1, math.ceil(self.total_count * p / 100)) for p in percentiles]
+        buckets = np.searchsorted(np.cumsum(self.counts), ranks)
+        # Geometric midpoint of [MIN * g^(bucket-1), MIN * g^bucket); bucket 0 is zero
+        return [
+            self.MIN_SECONDS * math.exp((int(b) - 0.5) * self._LOG_GROWTH) if b else 0.0
+            for b in buckets
+        ]
+
+
+class RecentLatencyWindow:
+    """
+    Ring buffer of the most recent latencies (float32)
+    
+    Complements the all-time histogram: percentiles over the last SIZE samples
+    track current behaviour (what tail-latency alerts care about) instead of
+    being diluted by everything recorded since startup. Batches are written
+    with one vectorized assignment, no per-sample decisions.
+    """
+    SIZE = 1024
+    
+    def __init__(self):
+        self.samples = np.zeros(self.SIZE, dtype=np.float32)
+        self.total_count = 0
+    
+    def record_many(self, durations_seconds: List[float]):
+        """Overwrite the oldest slots with a batch of durations"""
+        count = len(durations_seconds)
+        if not count:
+            return
+        
+        # Only the last SIZE values of a batch can survive in the ring
+        values = np.asarray(durations_seconds, dtype=np.float32)[-self.SIZE:]
+        first = self.total_count + count - len(values)
+        self.samples[(first + np.arange(len(values))) % self.SIZE] = values
+        self.total_count += count
+    
+    def values_at_percentiles(self, percentiles: List[float]) -> List[float]:
+        """Get the durations (seconds) at several percentiles of the window"""
+        window = self.samples[:min(self.total_count, self.SIZE)]
+        if not len(window):
+            return [0.0] * len(percentiles)
+        
+        # Nearest-rank selection: one introselect pass places every rank, no sort
+        ranks = [min(len(window) - 1, int(len(window) * p / 100)) for p in percentiles]
+        return np.partition(window, ranks)[ranks].tolist()
+
+
 @dataclass
 class AggregatedMetrics:
     """
@@ -51,7 +147,7 @@ class AggregatedMetrics:
     
     Optimized for multi-tenant concurrency:
     - No heavy metadata storage (only counters)
-    - Incremental percentile tracking (reservoir sampling)
+    - Percentiles from a fixed-bucket latency histogram (no sorting)
     - Lock-free reads for most operations
     """
     total_calls: int = 0
@@ -61,18 +157,12 @@ class AggregatedMetrics:
     min_latency: float = float('inf')
     max_latency: float = 0.0
     
-    # Lightweight percentile approximation (reservoir of 1000 samples)
-    latency_reservoir: List[float] = field(default_factory=list)
-    reservoir_size: int = 1000  # Fixed size for memory efficiency
+    # Latencies of successful calls (for percentile calculation): all-time and recent
+    latency_histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    recent_latencies: RecentLatencyWindow = field(default_factory=RecentLatencyWindow)
     
     # Error distribution (lightweight counters)
-    error_counts: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
-    
-    # Cached percentiles (updated periodically, not on every sample)
-    _p50_latency: float = 0.0
-    _p95_latency: float = 0.0
-    _p99_latency: float = 0.0
-    _percentiles_dirty: bool = True  # Flag for lazy recomputation
+    error_counts: Counter = field(default_factory=Counter)
     
     @property
     def avg_latency(self) -> float:
@@ -87,36 +177,17 @@ class AggregatedMetrics:
     @property
     def p50_latency(self) -> float:
         """Get P50 (median) latency"""
-        if self._percentiles_dirty and self.latency_reservoir:
-            self._recompute_percentiles()
-        return self._p50_latency
+        return self.latency_histogram.value_at_percentile(50)
     
     @property
     def p95_latency(self) -> float:
         """Get P95 latency"""
-        if self._percentiles_dirty and self.latency_reservoir:
-            self._recompute_percentiles()
-        return self._p95_latency
+        return self.latency_histogram.value_at_percentile(95)
     
     @property
     def p99_latency(self) -> float:
         """Get P99 latency"""
-        if self._percentiles_dirty and self.latency_reservoir:
-            self._recompute_percentiles()
-        return self._p99_latency
-    
-    def _recompute_percentiles(self):
-        """Lazy percentile recomputation (only when read, not on every write)"""
-        if not self.latency_reservoir:
-            return
-        
-        sorted_latencies = sorted(self.latency_reservoir)
-        n = len(sorted_latencies)
-        
-        self._p50_latency = sorted_latencies[int(n * 0.50)] if n > 0 else 0.0
-        self._p95_latency = sorted_latencies[int(n * 0.95)] if n > 0 else 0.0
-        self._p99_latency = sorted_latencies[int(n * 0.99)] if n > 0 else 0.0
-        self._percentiles_dirty = False
+        return self.latency_histogram.value_at_percentile(99)
 
 
 class MetricsService:
@@ -124,37 +195,61 @@ class MetricsService:
     Optimized metrics collection service for JusticeAI Commercial
     
     High-performance metrics for 600 concurrent tenants:
+    - Lock-free writes: record_latency only appends to a per-type deque
+      (thread-safe, no lock); samples are folded into the aggregates in
+      batches, by whichever writer fills the buffer or by the next reader
+    - Buffers sharded by thread (one deque per CPU) so concurrent writers do
+      not all append to the same object
     - Sharded locks (one per metric type) - eliminates global bottleneck
-    - Lazy percentile computation (only on read, not write)
-    - Reservoir sampling (fixed 1000 samples per metric)
+    - Percentiles from a fixed-bucket latency histogram (O(1) insert,
+      O(#buckets) read, every sample counted)
     - Lock-free reads where possible
     """
     
-    def __init__(self, reservoir_size: int = 1000):
+    def __init__(
+        self,
+        flush_threshold: int = 256,
+        shard_count: Optional[int] = None
+    ):
         """
         Initialize optimized metrics service
         
         Args:
-            reservoir_size: Reservoir size per metric (default: 1000 for memory efficiency)
+            flush_threshold: Buffered samples per shard before a writer folds them
+            shard_count: Buffer shards per metric type (default: one per CPU)
         """
-        self.reservoir_size = reservoir_size
+        self.flush_threshold = flush_threshold
+        self.shard_count = shard_count or os.cpu_count() or 1
+        
+        # Samples recorded but not yet folded into the aggregates:
+        # (duration_seconds, success, error_type). deque.append/popleft are thread-safe.
+        self._pending: Dict[MetricType, List[deque]] = {
+            metric_type: [deque() for _ in range(self.shard_count)] for metric_type in MetricType
+        }
+        
+        # Each thread is assigned a buffer shard round-robin on its first write
+        self._thread_shard = local()
+        self._next_shard = itertools.count()
         
         # Sharded locks - one per metric type (eliminates global bottleneck)
         self._metrics: Dict[MetricType, AggregatedMetrics] = {
-            metric_type: AggregatedMetrics(reservoir_size=reservoir_size) 
+            metric_type: AggregatedMetrics()
             for metric_type in MetricType
         }
-        self._locks: Dict[MetricType, RLock] = {
-            metric_type: RLock() for metric_type in MetricType
+        self._locks: Dict[MetricType, Lock] = {
+            metric_type: Lock() for metric_type in MetricType
         }
         
-        # OpenAI rate limit tracking (separate lock)
-        self._rate_limit_events: List[Dict[str, Any]] = []
-        self._rate_limit_lock = RLock()
+        # OpenAI rate limit tracking (separate lock): (recorded_at, event), last 1000 kept
+        self._rate_limit_events: deque = deque(maxlen=1000)
+        self._rate_limit_lock = Lock()
         self._last_cleanup = datetime.utcnow()
         
+        # Prometheus export: metric names and TYPE lines are fixed, only values change
+        self._prometheus_template = self._build_prometheus_template()
+        
         logger.info(
-            f"MetricsService initialized (reservoir_size={reservoir_size}, "
+            f"MetricsService initialized (shards={self.shard_count}, "
             f"sharded_locks={len(self._locks)})"
         )
     
@@ -176,34 +271,62 @@ class MetricsService:
             error_type: Error type if failed
             metadata: Additional metadata (ignored for performance)
         """
-        # Use sharded lock (only locks this metric type, not all metrics)
-        with self._locks[metric_type]:
-            agg = self._metrics[metric_type]
-            agg.total_calls += 1
-            
-            if success:
-                agg.successful_calls += 1
-                # Only add successful latencies to reservoir (for percentile calculation)
-                if len(agg.latency_reservoir) < agg.reservoir_size:
-                    # Reservoir not full yet - add directly
-                    agg.latency_reservoir.append(duration_seconds)
-                else:
-                    # Reservoir full - use reservoir sampling (random replacement)
-                    # This maintains statistical representativeness
-                    replace_idx = random.randint(0, agg.reservoir_size - 1)
-                    agg.latency_reservoir[replace_idx] = duration_seconds
-                
-                # Mark percentiles as dirty (will recompute on next read)
-                agg._percentiles_dirty = True
-            else:
-                agg.failed_calls += 1
-                if error_type:
-                    agg.error_counts[error_type] += 1
-            
-            # Update lightweight stats (no sorting needed)
-            agg.total_latency_seconds += duration_seconds
-            agg.min_latency = min(agg.min_latency, duration_seconds)
-            agg.max_latency = max(agg.max_latency, duration_seconds)
+        # Hot path: no lock, just buffer the sample in this thread's shard
+        shard = getattr(self._thread_shard, "index", None)
+        if shard is None:
+            shard = self._thread_shard.index = next(self._next_shard) % self.shard_count
+        pending = self._pending[metric_type][shard]
+        pending.append((duration_seconds, success, error_type))
+        
+        if len(pending) >= self.flush_threshold:
+            # Fold the batch under the type's lock; if another thread holds it
+            # (flushing or reading), leave the samples for it or the next writer
+            lock = self._locks[metric_type]
+            if lock.acquire(blocking=False):
+                try:
+                    self._flush_pending(metric_type)
+                finally:
+                    lock.release()
+    
+    def _flush_pending(self, metric_type: MetricType):
+        """Fold every shard's buffered samples into the aggregate (lock must be held by caller)"""
+        agg = self._metrics[metric_type]
+        successful_latencies = []
+        
+        for pending in self._pending[metric_type]:
+            for _ in range(len(pending)):
+                duration_seconds, success, error_type = pending.popleft()
+                self._fold_sample(agg, duration_seconds, success, error_type)
+                if success:
+                    successful_latencies.append(duration_seconds)
+        
+        # Only successful latencies feed the percentiles
+        if successful_latencies:
+            latencies = np.asarray(successful_latencies, dtype=np.float64)
+            agg.latency_histogram.record_many(latencies)
+            agg.recent_latencies.record_many(latencies)
+    
+    @staticmethod
+    def _fold_sample(
+        agg: AggregatedMetrics,
+        duration_seconds: float,
+        success: bool,
+        error_type: Optional[str]
+    ):
+        """Add one sample to an aggregate's counters (lock must be held by caller)"""
+        agg.total_calls += 1
+        
+        if success:
+            agg.successful_calls += 1
+        else:
+            agg.failed_calls += 1
+            if error_type:
+                agg.error_counts[error_type] += 1
+        
+        # Update lightweight stats (no sorting needed)
+        agg.total_latency_seconds += duration_seconds
+        agg.min_latency = min(agg.min_latency, duration_seconds)
+        agg.max_latency = max(agg.max_latency, duration_seconds)
     
     def record_rate_limit_event(
         self,
@@ -220,23 +343,22 @@ class MetricsService:
             retry_after: Retry-After header value (seconds)
         """
         # Use separate lock for rate limit events (doesn't block metric writes)
+        recorded_at = time.time()
+        event = {
+            "timestamp": datetime.utcfromtimestamp(recorded_at).isoformat(),
+            "service": service,
+            "error_message": error_message,
+            "retry_after": retry_after
+        }
+        
         with self._rate_limit_lock:
-            event = {
-                "timestamp": datetime.utcnow().isoformat(),
-                "service": service,
-                "error_message": error_message,
-                "retry_after": retry_after
-            }
-            self._rate_limit_events.append(event)
-            
-            # Keep only last 1000 events
-            if len(self._rate_limit_events) > 1000:
-                self._rate_limit_events = self._rate_limit_events[-1000:]
-            
-            logger.warning(
-                f"⚠️ Rate limit hit: {service} - {error_message} "
-                f"(retry_after={retry_after}s)"
-            )
+            # Bounded deque drops the oldest event once 1000 are kept
+            self._rate_limit_events.append((recorded_at, event))
+        
+        logger.warning(
+            f"⚠️ Rate limit hit: {service} - {error_message} "
+            f"(retry_after={retry_after}s)"
+        )
     
     def get_metrics(
         self,
@@ -255,39 +377,78 @@ class MetricsService:
         """
         if metric_type:
             # Single metric - use its lock only
-            with self._locks[metric_type]:
-                return self._serialize_metric(metric_type)
+            return self._serialize_metric(metric_type, self._snapshot_metric(metric_type))
         else:
-            # All metrics - lock individually to minimize contention
-            result = {}
-            for mt in MetricType:
-                with self._locks[mt]:
-                    result[mt.value] = self._serialize_metric(mt)
-            return result
+            # All metrics - one snapshot pass, each type locked individually
+            return {
+                mt.value: self._serialize_metric(mt, values)
+                for mt, values in self.snapshot().items()
+            }
+    
+    def snapshot(self) -> Dict[MetricType, Dict[str, Any]]:
+        """
+        Copy every metric's values in one pass
+        
+        Each type's lock is held only while its buffered samples are folded
+        and its counters copied; callers then work on the copies lock-free.
+        
+        Returns:
+            Dict of raw (unrounded) values per metric type
+        """
+        return {mt: self._snapshot_metric(mt) for mt in MetricType}
+    
+    def _snapshot_metric(self, metric_type: MetricType) -> Dict[str, Any]:
+        """Fold buffered samples and copy one aggregate's values (takes the type's lock)"""
+        with self._locks[metric_type]:
+            self._flush_pending(metric_type)
+            agg = self._metrics[metric_type]
+            p50, p95, p99 = agg.latency_histogram.values_at_percentiles([50, 95, 99])
+            recent_p50, recent_p95, recent_p99 = agg.recent_latencies.values_at_percentiles([50, 95, 99])
+            
+            return {
+                "total_calls": agg.total_calls,
+                "successful_calls": agg.successful_calls,
+                "failed_calls": agg.failed_calls,
+                "success_rate": agg.success_rate,
+                "avg_latency": agg.avg_latency,
+                "min_latency": agg.min_latency if agg.min_latency != float('inf') else 0,
+                "max_latency": agg.max_latency,
+                "p50_latency": p50,
+                "p95_latency": p95,
+                "p99_latency": p99,
+                "recent_p50_latency": recent_p50,
+                "recent_p95_latency": recent_p95,
+                "recent_p99_latency": recent_p99,
+                "error_counts": dict(agg.error_counts),
+                "latency_samples": agg.latency_histogram.total_count
+            }
     
+    @staticmethod
     def _serialize_metric(
-        self,
-        metric_type: MetricType
+        metric_type: MetricType,
+        values: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """Serialize aggregated metrics to dict (lock must be held by caller)"""
-        agg = self._metrics[metric_type]
-        
+        """Serialize a metric snapshot to the API dict"""
         return {
             "metric_type": metric_type.value,
-            "total_calls": agg.total_calls,
-            "successful_calls": agg.successful_calls,
-            "failed_calls": agg.failed_calls,
-            "success_rate_percent": round(agg.success_rate, 2),
+            "total_calls": values["total_calls"],
+            "successful_calls": values["successful_calls"],
+            "failed_calls": values["failed_calls"],
+            "success_rate_percent": round(values["success_rate"], 2),
             "latency": {
-                "avg_seconds": round(agg.avg_latency, 3),
-                "min_seconds": round(agg.min_latency, 3) if agg.min_latency != float('inf') else 0,
-                "max_seconds": round(agg.max_latency, 3),
-                "p50_seconds": round(agg.p50_latency, 3),  # Triggers lazy recomputation if dirty
-                "p95_seconds": round(agg.p95_latency, 3),
-                "p99_seconds": round(agg.p99_latency, 3)
+                "avg_seconds": round(values["avg_latency"], 3),
+                "min_seconds": round(values["min_latency"], 3),
+                "max_seconds": round(values["max_latency"], 3),
+                "p50_seconds": round(values["p50_latency"], 3),
+                "p95_seconds": round(values["p95_latency"], 3),
+                "p99_seconds": round(values["p99_latency"], 3),
+                # Over the last RecentLatencyWindow.SIZE successful calls
+                "recent_p50_seconds": round(values["recent_p50_latency"], 3),
+                "recent_p95_seconds": round(values["recent_p95_latency"], 3),
+                "recent_p99_seconds": round(values["recent_p99_latency"], 3)
             },
-            "error_distribution": dict(agg.error_counts),
-            "reservoir_samples": len(agg.latency_reservoir)
+            "error_distribution": values["error_counts"],
+            "latency_samples": values["latency_samples"]
         }
     
     def get_async_vs_sync_comparison(self) -> Dict[str, Any]:
@@ -297,59 +458,55 @@ class MetricsService:
         Returns:
             Dict with comparative metrics
         """
-        # Lock all metrics individually (read-only, minimal contention)
+        # One consistent pass over all metrics, then compare the copies
+        snapshot = self.snapshot()
         result = {}
         
         # OCR comparison
-        with self._locks[MetricType.OCR_ASYNC]:
-            ocr_async = self._serialize_metric(MetricType.OCR_ASYNC)
-        with self._locks[MetricType.OCR_SYNC]:
-            ocr_sync = self._serialize_metric(MetricType.OCR_SYNC)
-        
         result["ocr"] = {
-            "async": ocr_async,
-            "sync": ocr_sync,
-            "speedup": self._calculate_speedup(MetricType.OCR_ASYNC, MetricType.OCR_SYNC)
+            "async": self._serialize_metric(MetricType.OCR_ASYNC, snapshot[MetricType.OCR_ASYNC]),
+            "sync": self._serialize_metric(MetricType.OCR_SYNC, snapshot[MetricType.OCR_SYNC]),
+            "speedup": self._calculate_speedup(
+                snapshot[MetricType.OCR_ASYNC], snapshot[MetricType.OCR_SYNC]
+            )
         }
         
         # Embeddings comparison
-        with self._locks[MetricType.EMBEDDING_ASYNC]:
-            emb_async = self._serialize_metric(MetricType.EMBEDDING_ASYNC)
-        with self._locks[MetricType.EMBEDDING_SYNC]:
-            emb_sync = self._serialize_metric(MetricType.EMBEDDING_SYNC)
-        
         result["embeddings"] = {
-            "async": emb_async,
-            "sync": emb_sync,
-            "speedup": self._calculate_speedup(MetricType.EMBEDDING_ASYNC, MetricType.EMBEDDING_SYNC)
+            "async": self._serialize_metric(MetricType.EMBEDDING_ASYNC, snapshot[MetricType.EMBEDDING_ASYNC]),
+            "sync": self._serialize_metric(MetricType.EMBEDDING_SYNC, snapshot[MetricType.EMBEDDING_SYNC]),
+            "speedup": self._calculate_speedup(
+                snapshot[MetricType.EMBEDDING_ASYNC], snapshot[MetricType.EMBEDDING_SYNC]
+            )
         }
         
         # Cache stats
         result["cache"] = {
-            "hits": self._metrics[MetricType.CACHE_HIT].total_calls,
-            "misses": self._metrics[MetricType.CACHE_MISS].total_calls,
-            "hit_rate_percent": self._calculate_cache_hit_rate()
+            "hits": snapshot[MetricType.CACHE_HIT]["total_calls"],
+            "misses": snapshot[MetricType.CACHE_MISS]["total_calls"],
+            "hit_rate_percent": self._calculate_cache_hit_rate(snapshot)
         }
         
         return result
     
+    @staticmethod
     def _calculate_speedup(
-        self,
-        async_type: MetricType,
-        sync_type: MetricType
+        async_values: Dict[str, Any],
+        sync_values: Dict[str, Any]
     ) -> Optional[float]:
         """Calculate speedup factor (sync_time / async_time)"""
-        async_avg = self._metrics[async_type].avg_latency
-        sync_avg = self._metrics[sync_type].avg_latency
+        async_avg = async_values["avg_latency"]
+        sync_avg = sync_values["avg_latency"]
         
         if async_avg > 0 and sync_avg > 0:
             return round(sync_avg / async_avg, 2)
         return None
     
-    def _calculate_cache_hit_rate(self) -> float:
+    @staticmethod
+    def _calculate_cache_hit_rate(snapshot: Dict[MetricType, Dict[str, Any]]) -> float:
         """Calculate cache hit rate percentage"""
-        hits = self._metrics[MetricType.CACHE_HIT].total_calls
-        misses = self._metrics[MetricType.CACHE_MISS].total_calls
+        hits = snapshot[MetricType.CACHE_HIT]["total_calls"]
+        misses = snapshot[MetricType.CACHE_MISS]["total_calls"]
         total = hits + misses
         
         return round((hits / total * 100), 2) if total > 0 else 0.0
@@ -369,16 +526,20 @@ class MetricsService:
         Returns:
             List of rate limit events
         """
+        # Events are chronological: walk back from the newest until too old or enough
+        since_ts = None
+        if since:
+            since_ts = (since.replace(tzinfo=timezone.utc) if since.tzinfo is None else since).timestamp()
+        
+        events = []
         with self._rate_limit_lock:  # Use rate limit lock
-            events = self._rate_limit_events
-            
-            if since:
-                events = [
-                    e for e in events
-                    if datetime.fromisoformat(e["timestamp"]) >= since
-                ]
-            
-            return events[-limit:]
+            for recorded_at, event in reversed(self._rate_limit_events):
+                if len(events) >= limit or (since_ts is not None and recorded_at < since_ts):
+                    break
+                events.append(event)
+        
+        events.reverse()
+        return events
     
     def reset_metrics(self, metric_type: Optional[MetricType] = None):
         """
@@ -389,13 +550,17 @@ class MetricsService:
         """
         if metric_type:
             with self._locks[metric_type]:
-                self._metrics[metric_type] = AggregatedMetrics(reservoir_size=self.reservoir_size)
+                for pending in self._pending[metric_type]:
+                    pending.clear()
+                self._metrics[metric_type] = AggregatedMetrics()
                 logger.info(f"Metrics reset for {metric_type.value}")
         else:
             # Reset all - lock individually
             for mt in MetricType:
                 with self._locks[mt]:
-                    self._metrics[mt] = AggregatedMetrics(reservoir_size=self.reservoir_size)
+                    for pending in self._pending[mt]:
+                        pending.clear()
+                    self._metrics[mt] = AggregatedMetrics()
             
             with self._rate_limit_lock:
                 self._rate_limit_events.clear()
@@ -406,15 +571,15 @@ class MetricsService:
         """
         Clean up samples older than specified hours (periodic maintenance)
         
-        Note: With reservoir sampling, cleanup is automatic - reservoir maintains
-        fixed size via random replacement. This method is a no-op for compatibility.
+        Note: Latency histograms have fixed-size buckets, so memory does not
+        grow with sample count. This method is a no-op for compatibility.
         
         Args:
-            older_than_hours: Ignored (reservoir is self-cleaning)
+            older_than_hours: Ignored (histograms are fixed-size)
         """
-        # Reservoir sampling maintains fixed size automatically
+        # Histogram buckets are fixed-size
         # No cleanup needed
-        logger.debug("Cleanup skipped - reservoir sampling is self-maintaining")
+        logger.debug("Cleanup skipped - latency histograms are fixed-size")
         self._last_cleanup = datetime.utcnow()
     
     def export_prometheus_format(self) -> str:
@@ -424,28 +589,44 @@ class MetricsService:
         Returns:
             Prometheus-compatible metrics string
         """
+        values = {"timestamp": int(time.time() * 1000)}
+        
+        for metric_type, snapshot in self.snapshot().items():
+            name = metric_type.value
+            values[f"{name}_total"] = snapshot["total_calls"]
+            values[f"{name}_success"] = snapshot["successful_calls"]
+            values[f"{name}_failed"] = snapshot["failed_calls"]
+            values[f"{name}_p50"] = snapshot["p50_latency"]
+            values[f"{name}_p95"] = snapshot["p95_latency"]
+            values[f"{name}_p99"] = snapshot["p99_latency"]
+        
+        return self._prometheus_template.format_map(values)
+    
+    @staticmethod
+    def _build_prometheus_template() -> str:
+        """Build the export template once, with a named placeholder per value"""
         lines = []
-        timestamp = int(time.time() * 1000)
         
         for metric_type in MetricType:
-            agg = self._metrics[metric_type]
-            prefix = f"justiceai_{metric_type.value}"
+            name = metric_type.value
+            prefix = f"justiceai_{name}"
             
             # Counters
             lines.append(f'# TYPE {prefix}_total counter')
-            lines.append(f'{prefix}_total {agg.total_calls} {timestamp}')
+            lines.append(f'{prefix}_total {{{name}_total}} {{timestamp}}')
             
             lines.append(f'# TYPE {prefix}_success counter')
-            lines.append(f'{prefix}_success {agg.successful_calls} {timestamp}')
+            lines.append(f'{prefix}_success {{{name}_success}} {{timestamp}}')
             
             lines.append(f'# TYPE {prefix}_failed counter')
-            lines.append(f'{prefix}_failed {agg.failed_calls} {timestamp}')
+            lines.append(f'{prefix}_failed {{{name}_failed}} {{timestamp}}')
             
             # Latency histogram
             lines.append(f'# TYPE {prefix}_latency_seconds histogram')
-            lines.append(f'{prefix}_latency_seconds{{quantile="0.5"}} {agg.p50_latency} {timestamp}')
-            lines.append(f'{prefix}_latency_seconds{{quantile="0.95"}} {agg.p95_latency} {timestamp}')
-            lines.append(f'{prefix}_latency_seconds{{quantile="0.99"}} {agg.p99_latency} {timestamp}')
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(
+                    f'{prefix}_latency_seconds{{{{quantile="{quantile}"}}}} {{{name}_{key}}} {{timestamp}}'
+                )
         
         return "\n".join(lines)
 
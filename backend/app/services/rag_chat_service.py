@@ -12,7 +12,11 @@ Implements Retrieval-Augmented Generation (RAG) for intelligent chat:
 import os
 import json
 import time
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, NamedTuple
+import numpy as np
 from openai import OpenAI, OpenAIError
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -20,6 +24,173 @@ from app.models import ChatConversation, ChatMessage, DocumentEmbedding, Documen
 from app.services.embedding_service import EmbeddingService
 from app.services.cache_service import cache_service
 
+# Shared pool for query embeddings, so the OpenAI round-trip overlaps with the
+# database round-trip that saves the user message (threads start on demand)
+_QUERY_EMBEDDING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=16,
+    thread_name_prefix="rag_query_embedding"
+)
+
+
+@lru_cache(maxsize=8)
+def _halfvec_template(dimensions: int) -> str:
+    """Printf template for a halfvec literal of the given dimension."""
+    return "[" + ",".join(["%.5g"] * dimensions) + "]"
+
+
+def _halfvec_literal(embedding) -> str:
+    """
+    Format an embedding as a pgvector text literal for a ::halfvec parameter.
+    
+    Values are rounded to float16 first (as Postgres would on cast), and five
+    significant digits identify a float16 exactly, so the stored query vector
+    is unchanged while the literal is half the size and formatted in one
+    %-operation instead of one str() per dimension.
+    """
+    values = np.asarray(embedding, dtype=np.float16).tolist()
+    return _halfvec_template(len(values)) % tuple(values)
+
+
+class SearchChunk(NamedTuple):
+    """Document chunk returned by semantic search (columns of _SEMANTIC_SEARCH_SQL, in order)."""
+    embedding_id: int
+    document_id: int
+    chunk_text: str
+    chunk_index: int
+    document_name: str
+    file_path: str
+    similarity: float
+
+
+# Statements built once at import (SQLAlchemy caches their compiled form per engine)
+
+# Cosine similarity search with tenant isolation. CAST rather than "::" after the
+# bind parameter, which text() would otherwise parse as part of the parameter name
+_SEMANTIC_SEARCH_SQL = text("""
+    SELECT 
+        de.id,
+        de.document_id,
+        de.chunk_text,
+        de.chunk_index,
+        d.file_name as document_name,
+        d.file_path,
+        1 - (de.embedding <=> CAST(:query_embedding AS halfvec)) as similarity
+    FROM document_embeddings de
+    JOIN documents d ON de.document_id = d.id
+    WHERE de.firm_id = :firm_id
+    AND 1 - (de.embedding <=> CAST(:query_embedding AS halfvec)) >= :min_similarity
+    ORDER BY de.embedding <=> CAST(:query_embedding AS halfvec)
+    LIMIT :limit
+""")
+
+# Verify the conversation belongs to the firm, save the user message and fetch
+# the previous messages (the CTE's insert is not visible to the history subquery)
+_SAVE_USER_MESSAGE_SQL = text("""
+    WITH conversation AS (
+        SELECT id FROM chat_conversations
+        WHERE id = :conversation_id AND firm_id = :firm_id
+    ), inserted AS (
+        INSERT INTO chat_messages (conversation_id, firm_id, role, content)
+        SELECT id, :firm_id, 'user', :content FROM conversation
+        RETURNING id
+    )
+    SELECT
+        (SELECT id FROM inserted) AS user_message_id,
+        (
+            SELECT COALESCE(
+                json_agg(json_build_object('role', h.role, 'content', h.content)
+                         ORDER BY h.created_at, h.id),
+                '[]'::json
+            )
+            FROM (
+                SELECT id, role, content, created_at FROM chat_messages
+                WHERE conversation_id IN (SELECT id FROM conversation)
+                ORDER BY created_at DESC, id DESC
+                LIMIT :history_limit
+            ) h
+        ) AS history
+""")
+
+# Save the assistant response and update the conversation timestamp
+_SAVE_ASSISTANT_MESSAGE_SQL = text("""
+    WITH inserted AS (
+        INSERT INTO chat_messages (conversation_id, firm_id, role, content, sources)
+        VALUES (:conversation_id, :firm_id, 'assistant', :content, :sources)
+        RETURNING id
+    ), touched AS (
+        UPDATE chat_conversations SET updated_at = now()
+        WHERE id = :conversation_id AND firm_id = :firm_id
+    )
+    SELECT id FROM inserted
+""")
+
+
+# System prompts per language (Moroccan legal context), built once at import
+_SYSTEM_PROMPTS = MappingProxyType({
+    "ar": """أنت مساعد قانوني ذكي متخصص في القانون المغربي والمنظومة القانونية المغربية.
+
+السياق القانوني المغربي:
+- النظام القانوني: مزيج من القانون المدني الفرنسي والشريعة الإسلامية
+- القوانين الرئيسية: قانون الالتزامات والعقود (ظهير 1913)، مدونة الأسرة (2004)، قانون المسطرة المدنية، قانون المسطرة الجنائية، قانون الشغل، مدونة التجارة
+- المحاكم: محاكم ابتدائية، استئنافية، محكمة النقض، المحاكم التجارية، المحاكم الإدارية
+- الجهات القضائية: المحكمة الدستورية، محكمة النقض، المجلس الأعلى للسلطة القضائية
+
+مهمتك: مساعدة المحامين بالإجابة على أسئلتهم بناءً على الوثائق المتوفرة، مع مراعاة السياق القانوني المغربي.
+
+تعليمات مهمة:
+1. استخدم فقط المعلومات من الوثائق المقدمة في السياق
+2. عند الإشارة إلى قوانين أو مواد، اذكر المرجع القانوني الكامل (القانون، المادة، السنة)
+3. راعِ المواعيد القانونية المغربية في إجاباتك (آجال الطعن، التقادم، إلخ)
+4. إذا لم تكن المعلومة موجودة في السياق، قل ذلك بوضوح
+5. اذكر دائماً مصدر المعلومة (اسم الوثيقة ورقم الصفحة إن أمكن)
+6. كن دقيقاً ومحترفاً في إجاباتك
+7. إذا كان السؤال غامضاً، اطلب توضيحاً""",
+
+    "fr": """Vous êtes un assistant juridique intelligent spécialisé dans le droit marocain et le système juridique marocain.
+
+Contexte juridique marocain:
+- Système juridique: Mélange du droit civil français et de la Charia islamique
+- Lois principales: Code des Obligations et Contrats (DOC, dahir 1913), Code de la Famille (Moudawana, 2004), Code de Procédure Civile, Code de Procédure Pénale, Code du Travail, Code de Commerce
+- Tribunaux: Tribunaux de Première Instance, Cours d'Appel, Cour de Cassation, Tribunaux de Commerce, Tribunaux Administratifs
+- Autorités judiciaires: Cour Constitutionnelle, Cour de Cassation, Conseil Supérieur du Pouvoir Judiciaire
+
+Votre mission: Aider les avocats en répondant à leurs questions basées sur les documents disponibles, en tenant compte du contexte juridique marocain.
+
+Instructions importantes:
+1. Utilisez uniquement les informations des documents fournis dans le contexte
+2. Lors de la référence aux lois ou articles, mentionnez la référence juridique complète (loi, article, année)
+3. Tenez compte des délais juridiques marocains dans vos réponses (délais de recours, prescription, etc.)
+4. Si l'information n'est pas dans le contexte, dites-le clairement
+5. Citez toujours la source de l'information (nom du document et numéro de page si possible)
+6. Soyez précis et professionnel dans vos réponses
+7. Si la question est ambiguë, demandez des clarifications""",
+
+    "en": """You are an intelligent legal assistant specialized in Moroccan law and the Moroccan legal system.
+
+Moroccan Legal Context:
+- Legal System: Mix of French civil law and Islamic Sharia law
+- Key Laws: Code of Obligations and Contracts (DOC, dahir 1913), Family Code (Moudawana, 2004), Civil Procedure Code, Criminal Procedure Code, Labor Code, Commercial Code
+- Courts: Courts of First Instance, Courts of Appeal, Court of Cassation, Commercial Courts, Administrative Courts
+- Judicial Authorities: Constitutional Court, Court of Cassation, Supreme Council of the Judiciary
+
+Your mission: Help lawyers by answering their questions based on available documents, considering the Moroccan legal context.
+
+Important instructions:
+1. Use only information from the documents provided in the context
+2. When referring to laws or articles, mention the complete legal reference (law, article, year)
+3. Consider Moroccan legal timeframes in your responses (appeal deadlines, statute of limitations, etc.)
+4. If the information is not in the context, say so clearly
+5. Always cite the source of information (document name and page number if possible)
+6. Be precise and professional in your responses
+7. If the question is ambiguous, ask for clarification"""
+})
+
+# Ready-made system messages, so each chat turn does not rebuild them
+_SYSTEM_MESSAGES = MappingProxyType({
+    language: {"role": "system", "content": prompt}
+    for language, prompt in _SYSTEM_PROMPTS.items()
+})
+
 
 class RAGChatService:
     """Service for RAG-powered chat with semantic document search."""
@@ -65,8 +236,9 @@ class RAGChatService:
         firm_id: int,
         db: Session,
         limit: int = 5,
-        min_similarity: float = 0.7
-    ) -> List[Dict[str, Any]]:
+        min_similarity: float = 0.7,
+        query_embedding=None
+    ) -> List[SearchChunk]:
         """
         Search for document chunks semantically similar to the query.
         
@@ -76,120 +248,34 @@ class RAGChatService:
             db: Database session
             limit: Maximum number of results
             min_similarity: Minimum cosine similarity threshold (0-1)
+            query_embedding: Precomputed embedding of the query (optional)
         
         Returns:
-            List of relevant chunks with metadata
+            List of relevant chunks with metadata, most similar first
         """
-        # Generate query embedding
-        query_embedding = self.embedding_service.embed_query(query)
+        # Generate query embedding (unless the caller already did)
+        if query_embedding is None:
+            query_embedding = self.embedding_service.embed_query(query)
         
-        # Convert to PostgreSQL array format
-        embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
+        # Convert to pgvector text format
+        embedding_str = _halfvec_literal(query_embedding)
         
         # Semantic search using cosine similarity with tenant isolation
-        sql_query = text("""
-            SELECT 
-                de.id,
-                de.document_id,
-                de.chunk_text,
-                de.chunk_index,
-                d.file_name as document_name,
-                d.file_path,
-                1 - (de.embedding <=> :query_embedding::vector) as similarity
-            FROM document_embeddings de
-            JOIN documents d ON de.document_id = d.id
-            WHERE de.firm_id = :firm_id
-            AND 1 - (de.embedding <=> :query_embedding::vector) >= :min_similarity
-            ORDER BY de.embedding <=> :query_embedding::vector
-            LIMIT :limit
-        """)
-        
         results = db.execute(
-            sql_query,
+            _SEMANTIC_SEARCH_SQL,
             {
                 "query_embedding": embedding_str,
                 "firm_id": firm_id,
                 "min_similarity": min_similarity,
                 "limit": limit
             }
-        ).fetchall()
-        
-        # Format results
-        chunks = []
-        for row in results:
-            chunks.append({
-                "embedding_id": row[0],
-                "document_id": row[1],
-                "chunk_text": row[2],
-                "chunk_index": row[3],
-                "document_name": row[4],
-                "file_path": row[5],
-                "similarity": float(row[6])
-            })
+        )
         
-        return chunks
+        return [SearchChunk._make(row) for row in results]
     
     def _build_system_prompt(self, language: str = "ar") -> str:
         """Build system prompt in the specified language with Moroccan legal context."""
-        prompts = {
-            "ar": """أنت مساعد قانوني ذكي متخصص في القانون المغربي والمنظومة القانونية المغربية.
-
-السياق القانوني المغربي:
-- النظام القانوني: مزيج من القانون المدني الفرنسي والشريعة الإسلامية
-- القوانين الرئيسية: قانون الالتزامات والعقود (ظهير 1913)، مدونة الأسرة (2004)، قانون المسطرة المدنية، قانون المسطرة الجنائية، قانون الشغل، مدونة التجارة
-- المحاكم: محاكم ابتدائية، استئنافية، محكمة النقض، المحاكم التجارية، المحاكم الإدارية
-- الجهات القضائية: المحكمة الدستورية، محكمة النقض، المجلس الأعلى للسلطة القضائية
-
-مهمتك: مساعدة المحامين بالإجابة على أسئلتهم بناءً على الوثائق المتوفرة، مع مراعاة السياق القانوني المغربي.
-
-تعليمات مهمة:
-1. استخدم فقط المعلومات من الوثائق المقدمة في السياق
-2. عند الإشارة إلى قوانين أو مواد، اذكر المرجع القانوني الكامل (القانون، المادة، السنة)
-3. راعِ المواعيد القانونية المغربية في إجاباتك (آجال الطعن، التقادم، إلخ)
-4. إذا لم تكن المعلومة موجودة في السياق، قل ذلك بوضوح
-5. اذكر دائماً مصدر المعلومة (اسم الوثيقة ورقم الصفحة إن أمكن)
-6. كن دقيقاً ومحترفاً في إجاباتك
-7. إذا كان السؤال غامضاً، اطلب توضيحاً""",
-            
-            "fr": """Vous êtes un assistant juridique intelligent spécialisé dans le droit marocain et le système juridique marocain.
-
-Contexte juridique marocain:
-- Système juridique: Mélange du droit civil français et de la Charia islamique
-- Lois principales: Code des Obligations et Contrats (DOC, dahir 1913), Code de la Famille (Moudawana, 2004), Code de Procédure Civile, Code de Procédure Pénale, Code du Travail, Code de Commerce
-- Tribunaux: Tribunaux de Première Instance, Cours d'Appel, Cour de Cassation, Tribunaux de Commerce, Tribunaux Administratifs
-- Autorités judiciaires: Cour Constitutionnelle, Cour de Cassation, Conseil Supérieur du Pouvoir Judiciaire
-
-Votre mission: Aider les avocats en répondant à leurs questions basées sur les documents disponibles, en tenant compte du contexte juridique marocain.
-
-Instructions importantes:
-1. Utilisez uniquement les informations des documents fournis dans le contexte
-2. Lors de la référence aux lois ou articles, mentionnez la référence juridique complète (loi, article, année)
-3. Tenez compte des délais juridiques marocains dans vos réponses (délais de recours, prescription, etc.)
-4. Si l'information n'est pas dans le contexte, dites-le clairement
-5. Citez toujours la source de l'information (nom du document et numéro de page si possible)
-6. Soyez précis et professionnel dans vos réponses
-7. Si la question est ambiguë, demandez des clarifications""",
-            
-            "en": """You are an intelligent legal assistant specialized in Moroccan law and the Moroccan legal system.
-
-Moroccan Legal Context:
-- Legal System: Mix of French civil law and Islamic Sharia law
-- Key Laws: Code of Obligations and Contracts (DOC, dahir 1913), Family Code (Moudawana, 2004), Civil Procedure Code, Criminal Procedure Code, Labor Code, Commercial Code
-- Courts: Courts of First Instance, Courts of Appeal, Court of Cassation, Commercial Courts, Administrative Courts
-- Judicial Authorities: Constitutional Court, Court of Cassation, Supreme Council of the Judiciary
-
-Your mission: Help lawyers by answering their questions based on available documents, considering the Moroccan legal context.
-
-Important instructions:
-1. Use only information from the documents provided in the context
-2. When referring to laws or articles, mention the complete legal reference (law, article, year)
-3. Consider Moroccan legal timeframes in your responses (appeal deadlines, statute of limitations, etc.)
-4. If the information is not in the context, say so clearly
-5. Always cite the source of information (document name and page number if possible)
-6. Be precise and professional in your responses
-7. If the question is ambiguous, ask for clarification"""
-        }
-        return prompts.get(language, prompts["ar"])
+        return _SYSTEM_PROMPTS.get(language, _SYSTEM_PROMPTS["ar"])
     
     def generate_response(
         self,
@@ -216,65 +302,58 @@ Important instructions:
         """
         start_time = time.time()
         
-        # Verify conversation belongs to firm
-        conversation = db.query(ChatConversation).filter(
-            ChatConversation.id == conversation_id,
-            ChatConversation.firm_id == firm_id
-        ).first()
+        # Embed the query in the background: it only depends on the message text
+        query_embedding = _QUERY_EMBEDDING_EXECUTOR.submit(
+            self.embedding_service.embed_query, user_message
+        )
         
-        if not conversation:
-            raise ValueError(f"Conversation {conversation_id} not found for firm {firm_id}")
+        # One round-trip: verify conversation, save user message, fetch history
+        saved = db.execute(
+            _SAVE_USER_MESSAGE_SQL,
+            {
+                "conversation_id": conversation_id,
+                "firm_id": firm_id,
+                "content": user_message,
+                "history_limit": self.max_history_messages - 1
+            }
+        ).one()
         
-        # Save user message
-        user_msg = ChatMessage(
-            conversation_id=conversation_id,
-            firm_id=firm_id,
-            role="user",
-            content=user_message
-        )
-        db.add(user_msg)
-        db.commit()
+        if saved.user_message_id is None:
+            db.rollback()
+            raise ValueError(f"Conversation {conversation_id} not found for firm {firm_id}")
         
-        # Semantic search for relevant context
+        # Semantic search for relevant context (same transaction as the user message)
         relevant_chunks = self.semantic_search(
             query=user_message,
             firm_id=firm_id,
             db=db,
-            limit=self.max_context_chunks
+            limit=self.max_context_chunks,
+            query_embedding=query_embedding.result()
         )
         
+        # Commit before calling GPT-4o: the session hands its connection back to
+        # the pool on commit, so no pool slot is held during the model call
+        db.commit()
+        
         # Build context from relevant chunks
         context_parts = []
         sources = []
         
         for chunk in relevant_chunks:
-            context_parts.append(f"[من الوثيقة: {chunk['document_name']}]\n{chunk['chunk_text']}\n")
+            context_parts.append(f"[من الوثيقة: {chunk.document_name}]\n{chunk.chunk_text}\n")
             sources.append({
-                "document_id": chunk["document_id"],
-                "document_name": chunk["document_name"],
-                "similarity": chunk["similarity"]
+                "document_id": chunk.document_id,
+                "document_name": chunk.document_name,
+                "similarity": chunk.similarity
             })
         
         context_text = "\n---\n".join(context_parts) if context_parts else "لا توجد وثائق ذات صلة."
         
-        # Get conversation history
-        history = db.query(ChatMessage).filter(
-            ChatMessage.conversation_id == conversation_id
-        ).order_by(ChatMessage.created_at.desc()).limit(self.max_history_messages).all()
-        
-        history.reverse()  # Chronological order
-        
         # Build messages for GPT-4o
-        messages = [
-            {"role": "system", "content": self._build_system_prompt(language)}
-        ]
+        messages = [_SYSTEM_MESSAGES.get(language, _SYSTEM_MESSAGES["ar"])]
         
-        # Add recent history (exclude the message we just added)
-        for msg in history[:-1]:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+        # Add recent history (chronological, without the message we just added)
+        messages.extend(saved.history)
         
         # Add current query with context
         user_prompt = f"""السياق من الوثائق:
@@ -302,24 +381,20 @@ Important instructions:
             assistant_message = response.choices[0].message.content
             processing_time = time.time() - start_time
             
-            # Save assistant response
-            assistant_msg = ChatMessage(
-                conversation_id=conversation_id,
-                firm_id=firm_id,
-                role="assistant",
-                content=assistant_message,
-                sources=json.dumps(sources, ensure_ascii=False)
-            )
-            db.add(assistant_msg)
-            
-            # Update conversation timestamp
-            conversation.updated_at = time.time()
-            
+            # Save assistant response and update conversation timestamp in one round-trip
+            assistant_msg_id = db.execute(
+                _SAVE_ASSISTANT_MESSAGE_SQL,
+                {
+                    "conversation_id": conversation_id,
+                    "firm_id": firm_id,
+                    "content": assistant_message,
+                    "sources": json.dumps(sources, ensure_ascii=False)
+                }
+            ).scalar_one()
             db.commit()
-            db.refresh(assistant_msg)
             
             return {
-                "message_id": assistant_msg.id,
+                "message_id": assistant_msg_id,
                 "content": assistant_message,
                 "sources": sources,
                 "processing_time_seconds": round(processing_time, 2),
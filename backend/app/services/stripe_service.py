@@ -5,6 +5,9 @@ from typing import Optional, Dict, Any
 
 # Initialize Stripe
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Keep-alive HTTP client: each thread reuses its requests.Session (and TLS
+# connection) to api.stripe.com instead of handshaking on every call
+stripe.default_http_client = stripe.http_client.RequestsClient(timeout=10)
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 class StripeService:
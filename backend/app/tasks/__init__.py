@@ -1,4 +1,12 @@
 from .celery_app import celery_app
-from .ocr_tasks import process_document_ocr, index_document_elasticsearch
+from .ocr_tasks import (
+    process_document_ocr, ocr_pdf_page, finalize_document_ocr, index_document_elasticsearch
+)
+from .embedding_tasks import submit_bulk_embedding, poll_bulk_embedding
+from .audit_tasks import write_audit_logs
 
-__all__ = ['celery_app', 'process_document_ocr', 'index_document_elasticsearch']
+__all__ = [
+    'celery_app', 'process_document_ocr', 'ocr_pdf_page', 'finalize_document_ocr',
+    'index_document_elasticsearch',
+    'submit_bulk_embedding', 'poll_bulk_embedding', 'write_audit_logs'
+]
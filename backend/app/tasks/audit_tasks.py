@@ -0,0 +1,30 @@
+from celery import shared_task
+from datetime import datetime
+from sqlalchemy import insert
+import logging
+
+from app.database import SessionLocal
+from app.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, name='app.tasks.audit_tasks.write_audit_logs')
+def write_audit_logs(self, rows):
+    """
+    Bulk-insert audit log rows handed off by request paths (fire-and-forget).
+    
+    Rows are AuditLog column dicts with created_at as an ISO string (JSON
+    serializer). Runs on IO-bound queue; one INSERT and one commit per batch.
+    """
+    try:
+        # Parse into new dicts: rows are the task args that self.retry() re-sends
+        values = [{**row, 'created_at': datetime.fromisoformat(row['created_at'])} for row in rows]
+        with SessionLocal() as db:
+            db.execute(insert(AuditLog), values)
+            db.commit()
+    except Exception as exc:
+        logger.error(f"Writing {len(rows)} audit logs failed: {exc}")
+        raise self.retry(exc=exc, countdown=30 * (self.request.retries + 1))
+    
+    return {'success': True, 'written': len(rows)}
@@ -25,7 +25,12 @@ celery_app.conf.update(
 
 celery_app.conf.task_routes = {
     'app.tasks.ocr_tasks.process_document_ocr': {'queue': 'cpu_intensive'},
+    'app.tasks.ocr_tasks.ocr_pdf_page': {'queue': 'cpu_intensive'},
+    'app.tasks.ocr_tasks.finalize_document_ocr': {'queue': 'io_bound'},
     'app.tasks.ocr_tasks.index_document_elasticsearch': {'queue': 'io_bound'},
+    'app.tasks.embedding_tasks.submit_bulk_embedding': {'queue': 'io_bound'},
+    'app.tasks.embedding_tasks.poll_bulk_embedding': {'queue': 'io_bound'},
+    'app.tasks.audit_tasks.write_audit_logs': {'queue': 'io_bound'},
 }
 
 logger.info("Celery app configured successfully")
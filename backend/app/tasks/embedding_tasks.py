@@ -0,0 +1,68 @@
+from celery import shared_task
+import logging
+import os
+
+from app.database import SessionLocal
+from app.services.embedding_service import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+# How often to check on a submitted OpenAI embedding batch (completion window is 24h)
+BATCH_POLL_INTERVAL_SECONDS = int(os.getenv('EMBEDDING_BATCH_POLL_INTERVAL', '600'))
+# Consecutive failed polls (API or DB errors) tolerated before giving up on a batch
+BATCH_POLL_MAX_ERROR_RETRIES = 5
+
+
+@shared_task(name='app.tasks.embedding_tasks.submit_bulk_embedding')
+def submit_bulk_embedding(document_ids, firm_id: int):
+    """
+    Backfill embeddings for many documents through the OpenAI Batch API (~50% cheaper).
+    
+    Submits one batch for all documents that need embedding, then schedules
+    poll_bulk_embedding to store the results once the batch completes.
+    Runs on IO-bound queue for network operations.
+    """
+    with SessionLocal() as db:
+        job = EmbeddingService().submit_batch_embedding_job(document_ids, firm_id, db)
+    
+    if job is None:
+        logger.info(f"No documents to embed for firm {firm_id}")
+        return {'success': True, 'batch_id': None}
+    
+    poll_bulk_embedding.apply_async(
+        args=[job['batch_id'], firm_id, job['documents']],
+        countdown=BATCH_POLL_INTERVAL_SECONDS
+    )
+    return {'success': True, 'batch_id': job['batch_id'], 'documents': len(job['documents'])}
+
+
+@shared_task(bind=True, max_retries=None, name='app.tasks.embedding_tasks.poll_bulk_embedding')
+def poll_bulk_embedding(self, batch_id: str, firm_id: int, documents, error_retries: int = 0):
+    """
+    Poll an OpenAI embedding batch and bulk-insert its results when it completes.
+    
+    Re-schedules itself every BATCH_POLL_INTERVAL_SECONDS while the batch is running.
+    Errors (OpenAI retrieve/download, DB insert) are retried up to
+    BATCH_POLL_MAX_ERROR_RETRIES consecutive times, counted separately from the
+    unbounded "still running" polling, so a completed (paid) batch is not lost
+    to a transient failure.
+    """
+    try:
+        with SessionLocal() as db:
+            result = EmbeddingService().collect_batch_embedding_job(batch_id, firm_id, documents, db)
+    except Exception as exc:
+        if error_retries >= BATCH_POLL_MAX_ERROR_RETRIES:
+            logger.error(f"Embedding batch {batch_id} collection failed {error_retries + 1} times, giving up: {exc}")
+            raise
+        logger.warning(f"Embedding batch {batch_id} collection failed, retrying in {BATCH_POLL_INTERVAL_SECONDS}s: {exc}")
+        raise self.retry(
+            exc=exc,
+            countdown=BATCH_POLL_INTERVAL_SECONDS,
+            kwargs={'error_retries': error_retries + 1}
+        )
+    
+    if result is None:
+        logger.info(f"Embedding batch {batch_id} still running, checking again in {BATCH_POLL_INTERVAL_SECONDS}s")
+        raise self.retry(countdown=BATCH_POLL_INTERVAL_SECONDS, kwargs={'error_retries': 0})
+    
+    return result
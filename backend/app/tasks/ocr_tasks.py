@@ -1,13 +1,326 @@
 from celery import shared_task, chord
+from celery.exceptions import Ignore, Retry
+from celery.signals import worker_process_init
 from datetime import datetime
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import BulkIndexError, bulk
+from pdf2image import convert_from_path
+from sqlalchemy import select, update
+import asyncio
 import logging
 import os
-import sys
+import threading
 
-sys.path.insert(0, '/home/runner/workspace/backend')
+# Imported once when the worker loads its tasks (before forking), not on every task call
+from app.database import SessionLocal, engine
+from app.models import Document as DocumentModel
+from app.services.advanced_ocr_service import AdvancedOCRService
+from app.services.ai_service import ai_service
+from app.services.async_ocr_service import run_async_ocr_in_celery
+from app.services.elasticsearch_service import DOCUMENTS_INDEX_BODY
+from app.services.ocr_service import SyncOCRService
 
 logger = logging.getLogger(__name__)
 
+# Elasticsearch client shared by every indexing task in this worker process, so
+# its HTTP connection pool stays warm instead of being rebuilt per document
+_es_client = None
+_es_client_lock = threading.Lock()
+
+
+def _get_es_client():
+    """Return the process-wide Elasticsearch client, creating it on first use."""
+    global _es_client
+    with _es_client_lock:
+        if _es_client is None:
+            es_url = os.getenv('ELASTICSEARCH_URL', 'http://localhost:9200')
+            _es_client = Elasticsearch(
+                [es_url],
+                request_timeout=10,
+                retry_on_timeout=True,
+                max_retries=2
+            )
+        return _es_client
+
+
+def _ensure_documents_index(es):
+    """Create the judicial_documents index with its analyzers if it doesn't exist yet."""
+    es = es.options(request_timeout=5, max_retries=0)  # don't stall worker startup
+    try:
+        if not es.indices.exists(index='judicial_documents'):
+            es.indices.create(index='judicial_documents', body=DOCUMENTS_INDEX_BODY)
+            logger.info("✅ Created 'judicial_documents' index")
+    except Exception as e:
+        # Cluster down or another worker won the race: indexing reports real failures
+        logger.warning(f"Could not ensure 'judicial_documents' index: {e}")
+
+
+# Event loop shared by every AI processing call in this worker process: ai_service's
+# AsyncOpenAI connection pool is bound to the loop it first ran on, so a fresh loop
+# per document would discard (and break) its pooled connections
+_ai_loop = None
+_ai_loop_lock = threading.Lock()
+
+
+def _run_on_ai_loop(coro):
+    """Run a coroutine on the process-wide AI event loop, starting its thread on first use."""
+    global _ai_loop
+    with _ai_loop_lock:
+        if _ai_loop is None:
+            _ai_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_ai_loop.run_forever, name="ai-event-loop", daemon=True
+            ).start()
+        loop = _ai_loop
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result()
+    except BaseException:
+        # e.g. SoftTimeLimitExceeded while waiting: don't leave the call running
+        future.cancel()
+        raise
+
+
+@worker_process_init.connect
+def _init_worker_clients(**kwargs):
+    """Give each forked Celery worker its own clients (sockets and loop threads do not survive fork)."""
+    global _es_client, _ai_loop
+    _es_client = None
+    _ai_loop = None
+    # Pooled DB connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+    _ensure_documents_index(_get_es_client())
+
+
+# OCR engine shared by the page tasks of this worker process (models load lazily, once)
+_page_ocr_service = None
+
+
+def _get_page_ocr_service():
+    """Return the process-wide AdvancedOCRService used for page OCR."""
+    global _page_ocr_service
+    if _page_ocr_service is None:
+        _page_ocr_service = AdvancedOCRService()
+    return _page_ocr_service
+
+
+def _page_fanout_enabled() -> bool:
+    """Feature flag: OCR scanned PDF pages as separate tasks (needs file storage shared by OCR workers)."""
+    return os.getenv("OCR_PAGE_FANOUT_ENABLED", "true").lower() == "true"
+
+
+def _plan_pdf_ocr(document_id: int, expediente_id, file_path: str, language: str = "ar"):
+    """
+    Decide how to process a PDF before doing any OCR.
+    
+    Returns:
+        (result, None) if the PDF has a text layer (extracted directly),
+        (None, chord) to OCR a scanned multi-page PDF page by page,
+        (None, None) to OCR it in-task (single page)
+    """
+    service = _get_page_ocr_service()
+    
+    direct_text = service.extract_pdf_text_direct(file_path)
+    page_count = service.count_pdf_pages(file_path)
+    if direct_text and len(direct_text.strip()) > 50:
+        return {
+            'extracted_text': direct_text,
+            'ocr_confidence': 99,
+            'detected_language': language,
+            'pages_processed': page_count,
+            'method': 'direct_extraction'
+        }, None
+    
+    if page_count < 2:
+        return None, None
+    
+    engine = service.select_best_engine(language)
+    return None, _page_ocr_chord(document_id, expediente_id, file_path, page_count, engine, language)
+
+
+def _page_ocr_chord(document_id: int, expediente_id, file_path: str, page_count: int,
+                    engine: str, language: str, attempt: int = 0):
+    """
+    Build the chord that OCRs every page of a PDF and merges the results.
+    
+    Retries (attempt > 0) delay the page tasks with the same backoff as
+    process_document_ocr's retries (60s, 120s, 180s).
+    """
+    options = {'countdown': 60 * attempt} if attempt else {}
+    return chord(
+        [ocr_pdf_page.s(file_path, page_number, engine, language).set(**options)
+         for page_number in range(1, page_count + 1)],
+        finalize_document_ocr.s(document_id, expediente_id, language,
+                                file_path=file_path, engine=engine, attempt=attempt)
+    )
+
+
+def _merge_page_results(page_results: list, language: str) -> dict:
+    """Combine per-page OCR results (in page order) the way AsyncOCRService does."""
+    page_results = sorted(page_results, key=lambda page: page['page'])
+    
+    all_text = ""
+    total_confidence = 0
+    failed_pages = []
+    for page in page_results:
+        if 'error' in page:
+            failed_pages.append(page['page'])
+            all_text += f"\n--- Page {page['page']} ---\n[OCR FAILED: {page['error'][:100]}]\n"
+        else:
+            all_text += f"\n--- Page {page['page']} ---\n{page['text']}\n"
+            total_confidence += page['confidence']
+    
+    successful_pages = len(page_results) - len(failed_pages)
+    if successful_pages == 0:
+        raise RuntimeError(
+            f"All {len(page_results)} pages failed OCR processing. "
+            f"First error: {page_results[0]['error'] if page_results else 'Unknown'}"
+        )
+    if failed_pages:
+        logger.warning(
+            f"⚠️ Partial OCR failure: {len(failed_pages)}/{len(page_results)} "
+            f"pages failed (pages: {failed_pages})"
+        )
+    
+    return {
+        'extracted_text': all_text.strip(),
+        'ocr_confidence': round(total_confidence / successful_pages),
+        'detected_language': language,
+        'pages_processed': len(page_results),
+        'successful_pages': successful_pages,
+        'method': 'page_fanout_ocr'
+    }
+
+
+@shared_task(name='app.tasks.ocr_tasks.ocr_pdf_page')
+def ocr_pdf_page(file_path: str, page_number: int, engine: str, language: str = "ar"):
+    """
+    OCR a single page (1-based) of a scanned PDF.
+    
+    Header task of the page fan-out chord; runs on the CPU-intensive queue.
+    Failures are reported in the result instead of raised, so one bad page
+    doesn't fail the whole document (same tolerance as AsyncOCRService).
+    """
+    try:
+        image = convert_from_path(file_path, 300, first_page=page_number, last_page=page_number)[0]
+        result = _get_page_ocr_service().process_single_image(image, engine, language)
+        return {'page': page_number, 'text': result['text'], 'confidence': result['confidence']}
+    except Exception as e:
+        logger.error(f"❌ Page {page_number} of {file_path} failed: {e}")
+        return {'page': page_number, 'error': str(e)}
+
+
+@shared_task(bind=True, max_retries=3, name='app.tasks.ocr_tasks.finalize_document_ocr',
+             soft_time_limit=60)  # Same budget as process_document_ocr's AI step
+def finalize_document_ocr(self, page_results, document_id: int, expediente_id=None, language: str = "ar",
+                          file_path: str = None, engine: str = None, attempt: int = 0):
+    """
+    Merge the page results of a fanned-out PDF and store them like process_document_ocr.
+    
+    Its return value becomes process_document_ocr's result, so the
+    Elasticsearch indexing callback receives the usual payload.
+    If every page failed, the pages are OCR'd again (up to max_retries
+    rounds) by replacing this task with a new page chord.
+    """
+    try:
+        result = _merge_page_results(page_results, language)
+    except RuntimeError as exc:
+        if file_path is None or attempt >= self.max_retries:
+            logger.critical(f"OCR processing permanently failed for document {document_id}: {exc}")
+            raise
+        logger.error(f"OCR processing failed for document {document_id}, retrying pages: {exc}")
+        raise self.replace(_page_ocr_chord(
+            document_id, expediente_id, file_path, len(page_results), engine, language, attempt + 1
+        ))
+    
+    with SessionLocal() as db:
+        return _store_ocr_result(self, db, document_id, expediente_id, result, async_processed=True)
+
+
+def _store_ocr_result(task, db, document_id: int, expediente_id, result: dict, async_processed: bool) -> dict:
+    """
+    Save OCR results on the document, run AI processing and build the task result.
+    
+    Shared by process_document_ocr and finalize_document_ocr (page fan-out).
+    Writes with UPDATE statements, so callers never load the Document row.
+    """
+    def update_document(**values):
+        updated = db.execute(
+            update(DocumentModel).where(DocumentModel.id == document_id).values(**values)
+        ).rowcount
+        db.commit()
+        if not updated:
+            logger.error(f"Document {document_id} not found in database")
+            raise ValueError(f"Document {document_id} not found")
+    
+    # OCR and AI columns are buffered and written in one UPDATE (one commit)
+    extracted_text = result.get('extracted_text', '')
+    values = {
+        'ocr_processed': True,
+        'ocr_text': extracted_text,
+        'ocr_confidence': result.get('ocr_confidence', 0),
+        'ocr_language': result.get('detected_language', 'ar'),
+        'is_searchable': True
+    }
+    
+    # AI Processing (NEW): Process document with DeepSeek AI
+    if extracted_text and len(extracted_text.strip()) > 50:  # Only process if meaningful text
+        try:
+            logger.info(f"Starting AI processing for document {document_id}")
+            
+            # Run AI processing (async in sync context) on the worker's persistent loop
+            ai_results = _run_on_ai_loop(ai_service.process_document(extracted_text))
+            
+            # Update document with AI results
+            values.update(
+                ai_classification=ai_results.get('classification'),
+                ai_metadata=ai_results.get('metadata'),
+                ai_summary=ai_results.get('summary'),
+                ai_processed=True,
+                ai_processed_at=datetime.utcnow()
+            )
+            
+            if ai_results.get('error'):
+                values['ai_error'] = ai_results['error']
+                logger.warning(f"AI processing completed with errors for document {document_id}: {ai_results['error']}")
+            else:
+                logger.info(f"✅ AI processing completed successfully for document {document_id}")
+            
+        except Exception as ai_exc:
+            # Graceful degradation: Log error but don't fail the entire task
+            error_str = str(ai_exc)
+            
+            # Handle rate limits with exponential backoff
+            if "429" in error_str or "rate_limit" in error_str.lower():
+                logger.warning(f"Rate limit hit for document {document_id}, will retry")
+                # Keep the OCR result even though the task is retried
+                update_document(**values, ai_error=f"Rate limit (will retry): {error_str}")
+                # Retry with exponential backoff (60s, 120s, 240s)
+                raise task.retry(exc=ai_exc, countdown=60 * (2 ** task.request.retries))
+            
+            logger.error(f"AI processing failed for document {document_id}: {error_str}")
+            values.update(ai_error=error_str, ai_processed=False)
+    else:
+        logger.info(f"Skipping AI processing for document {document_id} (insufficient text)")
+    
+    update_document(**values)
+    
+    logger.info(
+        f"OCR processing completed for document {document_id} "
+        f"(async={async_processed}, confidence={result.get('ocr_confidence', 0)}%)"
+    )
+    
+    # Everything the indexing callback needs travels in the payload (no re-read there)
+    return {
+        'document_id': document_id,
+        'text': extracted_text,
+        'language': result.get('detected_language', 'unknown'),
+        'confidence': result.get('ocr_confidence', 0),
+        'case_id': expediente_id,
+        'async_processed': async_processed
+    }
+
+
 @shared_task(bind=True, max_retries=3, name='app.tasks.ocr_tasks.process_document_ocr', 
              soft_time_limit=60)  # 60s soft limit (30s AI timeout + 30s buffer)
 def process_document_ocr(self, document_id: int):
@@ -16,6 +329,9 @@ def process_document_ocr(self, document_id: int):
     
     Architecture:
     - Feature flag ASYNC_OCR_ENABLED controls rollout (default: true)
+    - PDFs with a text layer are extracted directly (no OCR)
+    - Scanned multi-page PDFs are replaced by a chord of per-page tasks when
+      OCR_PAGE_FANOUT_ENABLED (default: true), spreading pages over all workers
     - Uses AsyncOCRService for parallel page processing when enabled
     - Falls back to SyncOCRService when disabled or on error
     
@@ -23,27 +339,37 @@ def process_document_ocr(self, document_id: int):
     Uses shared SessionLocal from app.database for proper connection pooling.
     """
     try:
-        from app.database import SessionLocal
-        from app.models import Document as DocumentModel
-        
         logger.info(f"Starting OCR processing for document {document_id}")
         
         with SessionLocal() as db:
-            document = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
+            # Only the columns OCR needs; results are written back with UPDATEs
+            document = db.execute(
+                select(DocumentModel.file_path, DocumentModel.expediente_id)
+                .where(DocumentModel.id == document_id)
+            ).first()
             
             if not document:
                 logger.error(f"Document {document_id} not found in database")
                 raise ValueError(f"Document {document_id} not found")
             
-            file_path = document.file_path
-            case_id = document.case_id
+            file_path, expediente_id = document
             
             # Feature flag: Use async OCR if enabled
             use_async_ocr = os.getenv("ASYNC_OCR_ENABLED", "true").lower() == "true"
             
-            if use_async_ocr:
+            result = None
+            if use_async_ocr and _page_fanout_enabled() and file_path.lower().endswith('.pdf'):
+                result, page_chord = _plan_pdf_ocr(document_id, expediente_id, file_path)
+                if page_chord is not None:
+                    # Scanned multi-page PDF: OCR each page as its own task across the
+                    # worker pool; the finalizer's result replaces this task's result
+                    logger.info(f"📄 Fanning out OCR of document {document_id} into per-page tasks")
+                    raise self.replace(page_chord)
+            
+            if result is not None:
+                logger.info(f"📄 Document {document_id} has a text layer (no OCR needed)")
+            elif use_async_ocr:
                 try:
-                    from app.services.async_ocr_service import run_async_ocr_in_celery
                     logger.info(f"📄 Using AsyncOCRService for document {document_id} (parallel processing)")
                     
                     result = run_async_ocr_in_celery(
@@ -64,88 +390,19 @@ def process_document_ocr(self, document_id: int):
                         f"falling back to sync: {async_error}"
                     )
                     # Fallback to sync OCR
-                    from app.services.ocr_service import SyncOCRService
                     ocr_service = SyncOCRService()
                     result = ocr_service.process_document(file_path)
             else:
                 # Use legacy sync OCR
-                from app.services.ocr_service import SyncOCRService
                 logger.info(f"📄 Using SyncOCRService for document {document_id} (async disabled)")
                 ocr_service = SyncOCRService()
                 result = ocr_service.process_document(file_path)
             
-            # Update document with OCR results
-            document.ocr_processed = True
-            document.ocr_text = result.get('extracted_text', '')
-            document.ocr_confidence = result.get('ocr_confidence', 0)
-            document.ocr_language = result.get('detected_language', 'ar')
-            document.is_searchable = True
-            
-            db.commit()
-            
-            # AI Processing (NEW): Process document with DeepSeek AI
-            extracted_text = result.get('extracted_text', '')
-            if extracted_text and len(extracted_text.strip()) > 50:  # Only process if meaningful text
-                try:
-                    from app.services.ai_service import ai_service
-                    import asyncio
-                    
-                    logger.info(f"Starting AI processing for document {document_id}")
-                    
-                    # Run AI processing (async in sync context)
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    ai_results = loop.run_until_complete(ai_service.process_document(extracted_text))
-                    loop.close()
-                    
-                    # Update document with AI results
-                    document.ai_classification = ai_results.get('classification')
-                    document.ai_metadata = ai_results.get('metadata')
-                    document.ai_summary = ai_results.get('summary')
-                    document.ai_processed = True
-                    document.ai_processed_at = datetime.utcnow()
-                    
-                    if ai_results.get('error'):
-                        document.ai_error = ai_results['error']
-                        logger.warning(f"AI processing completed with errors for document {document_id}: {ai_results['error']}")
-                    else:
-                        logger.info(f"✅ AI processing completed successfully for document {document_id}")
-                    
-                    db.commit()
-                    
-                except Exception as ai_exc:
-                    # Graceful degradation: Log error but don't fail the entire task
-                    error_str = str(ai_exc)
-                    
-                    # Handle rate limits with exponential backoff
-                    if "429" in error_str or "rate_limit" in error_str.lower():
-                        logger.warning(f"Rate limit hit for document {document_id}, will retry")
-                        document.ai_error = f"Rate limit (will retry): {error_str}"
-                        db.commit()
-                        # Retry with exponential backoff (60s, 120s, 240s)
-                        raise self.retry(exc=ai_exc, countdown=60 * (2 ** self.request.retries))
-                    
-                    logger.error(f"AI processing failed for document {document_id}: {error_str}")
-                    document.ai_error = error_str
-                    document.ai_processed = False
-                    db.commit()
-            else:
-                logger.info(f"Skipping AI processing for document {document_id} (insufficient text)")
-            
-            logger.info(
-                f"OCR processing completed for document {document_id} "
-                f"(async={use_async_ocr}, confidence={result.get('ocr_confidence', 0)}%)"
-            )
-            
-            return {
-                'document_id': document_id,
-                'text': result.get('extracted_text', ''),
-                'language': result.get('detected_language', 'unknown'),
-                'confidence': result.get('ocr_confidence', 0),
-                'case_id': case_id,
-                'async_processed': use_async_ocr
-            }
+            return _store_ocr_result(self, db, document_id, expediente_id, result, async_processed=use_async_ocr)
         
+    except (Ignore, Retry):
+        # self.replace()/self.retry() signal the worker by raising; let them through
+        raise
     except Exception as exc:
         logger.error(f"OCR processing failed for document {document_id}: {str(exc)}")
         if self.request.retries < self.max_retries:
@@ -159,61 +416,59 @@ def index_document_elasticsearch(ocr_results):
     """
     Index document in Elasticsearch AFTER OCR completes.
     Runs on IO-bound queue for network operations.
-    Uses shared SessionLocal from app.database for proper connection pooling.
+    Doesn't touch the database: the OCR step already marked the documents searchable.
     
     Args:
         ocr_results: Either a list of OCR results from chord, or a single dict from chain
+            (every result of a chord is indexed, in one bulk request)
     """
-    if isinstance(ocr_results, list):
-        if not ocr_results:
-            logger.error("Received empty results list")
-            return {'success': False, 'error': 'No OCR results'}
-        ocr_result = ocr_results[0]
-    else:
-        ocr_result = ocr_results
+    results = ocr_results if isinstance(ocr_results, list) else [ocr_results]
+    if not results:
+        logger.error("Received empty results list")
+        return {'success': False, 'error': 'No OCR results'}
     
-    document_id = ocr_result.get('document_id')
+    document_ids = [ocr_result.get('document_id') for ocr_result in results]
+    document_id = document_ids[0] if len(document_ids) == 1 else document_ids
     
     try:
-        from elasticsearch import Elasticsearch
-        
-        es_url = os.getenv('ELASTICSEARCH_URL', 'http://localhost:9200')
-        es = Elasticsearch([es_url])
-        
-        if not es.ping():
-            logger.error("Elasticsearch is not available")
-            raise ConnectionError("Elasticsearch connection failed")
+        # No ping(): an unreachable cluster fails the bulk request itself
+        es = _get_es_client()
+        indexed_at = datetime.utcnow().isoformat()
         
-        index_body = {
-            'document_id': document_id,
-            'text': ocr_result.get('text', ''),
-            'language': ocr_result.get('language', 'unknown'),
-            'confidence': ocr_result.get('confidence', 0),
-            'case_id': ocr_result.get('case_id'),
-            'indexed_at': datetime.utcnow().isoformat(),
-            'status': 'indexed'
-        }
+        actions = [
+            {
+                # Append-only: a document is indexed once after OCR
+                '_op_type': 'create',
+                '_index': 'judicial_documents',
+                '_id': ocr_result.get('document_id'),
+                # Field names of DOCUMENTS_INDEX_BODY, so ocr_text gets the
+                # per-language analyzers that ElasticsearchService.search queries
+                '_source': {
+                    'document_id': ocr_result.get('document_id'),
+                    'ocr_text': ocr_result.get('text', ''),
+                    'ocr_language': ocr_result.get('language', 'unknown'),
+                    'ocr_confidence': ocr_result.get('confidence', 0),
+                    'case_id': ocr_result.get('case_id'),
+                    'indexed_at': indexed_at,
+                    'is_searchable': True
+                }
+            }
+            for ocr_result in results
+        ]
         
-        es.index(
-            index='judicial_documents',
-            id=document_id,
-            document=index_body
+        # One _bulk request for every document of the chord; no forced refresh,
+        # new documents become searchable with the index's periodic refresh
+        _, errors = bulk(
+            es.options(request_timeout=60), actions,
+            chunk_size=500, refresh=False, raise_on_error=False
         )
+        # 409 = already indexed (e.g. this task retried after a partial success)
+        errors = [error for error in errors if error.get('create', {}).get('status') != 409]
+        if errors:
+            raise BulkIndexError(f"{len(errors)} document(s) failed to index", errors)
         
         logger.info(f"Document {document_id} successfully indexed in Elasticsearch")
         
-        from app.database import SessionLocal
-        from app.models import Document as DocumentModel
-        
-        with SessionLocal() as db:
-            document = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
-            if not document:
-                logger.error(f"Document {document_id} not found after indexing")
-                raise ValueError(f"Document {document_id} disappeared during indexing")
-            
-            document.is_searchable = True
-            db.commit()
-        
         return {'success': True, 'document_id': document_id}
         
     except Exception as e:
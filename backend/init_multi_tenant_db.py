@@ -7,6 +7,8 @@ import sys
 import os
 from datetime import date, timedelta
 
+from sqlalchemy import insert
+
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -21,6 +23,26 @@ from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+DEMO_PASSWORD = "Demo2025!"
+
+
+def get_demo_password_hash():
+    """
+    Hash of the demo password, reusing DEMO_PASSWORD_HASH when set.
+    
+    bcrypt is deliberately slow (~250ms per hash); scripts that re-run this
+    setup (CI, container startup) can export the printed hash to skip it.
+    """
+    demo_hash = os.getenv("DEMO_PASSWORD_HASH")
+    if demo_hash and pwd_context.identify(demo_hash):
+        return demo_hash
+    if demo_hash:
+        print("⚠️  DEMO_PASSWORD_HASH is not a bcrypt hash, ignoring it")
+    
+    demo_hash = pwd_context.hash(DEMO_PASSWORD)
+    print(f"💡 Set DEMO_PASSWORD_HASH='{demo_hash}' to skip hashing on the next run")
+    return demo_hash
+
 
 def init_database():
     """Initialize database schema"""
@@ -61,23 +83,23 @@ def create_example_firm():
         )
         
         db.add(firm)
-        db.flush()
+        db.flush()  # the only flush: everything below needs firm.id
         
         print(f"✅ Firm created: {firm.name} (ID: {firm.id})")
         
         # Create subscription
-        subscription = Subscription(
-            firm_id=firm.id,
-            status=SubscriptionStatus.ACTIVE,
-            start_date=date.today(),
-            end_date=date.today() + timedelta(days=1095),
-            plan_tier=SubscriptionTier.COMPLETE,
-            monthly_cost=1620.0,  # 6 lawyers × 270 MAD
-            next_billing_date=date.today() + timedelta(days=30),
-            auto_renew=True
-        )
+        subscription_tier = SubscriptionTier.COMPLETE
+        db.execute(insert(Subscription), [{
+            "firm_id": firm.id,
+            "status": SubscriptionStatus.ACTIVE,
+            "start_date": date.today(),
+            "end_date": date.today() + timedelta(days=1095),
+            "plan_tier": subscription_tier,
+            "monthly_cost": 1620.0,  # 6 lawyers × 270 MAD
+            "next_billing_date": date.today() + timedelta(days=30),
+            "auto_renew": True
+        }])
         
-        db.add(subscription)
         print(f"✅ Subscription created for firm {firm.id}")
         
         # Create users
@@ -127,55 +149,56 @@ def create_example_firm():
         ]
         
         # Default password for all demo users: "Demo2025!"
-        default_password = pwd_context.hash("Demo2025!")
+        default_password = get_demo_password_hash()
         
-        created_users = []
-        for user_data in users_data:
-            user = User(
-                firm_id=firm.id,
-                email=user_data["email"],
-                name=user_data["name"],
-                hashed_password=default_password,
-                role=user_data["role"],
-                language=user_data["language"],
-                is_active=True,
-                is_verified=True
-            )
-            db.add(user)
-            created_users.append(user)
-        
-        db.flush()
+        # One multi-row INSERT; RETURNING gives the ids needed for the expediente
+        created_users = db.execute(
+            insert(User).returning(User.id, User.role, sort_by_parameter_order=True),
+            [
+                {
+                    "firm_id": firm.id,
+                    "email": user_data["email"],
+                    "name": user_data["name"],
+                    "hashed_password": default_password,
+                    "role": user_data["role"],
+                    "language": user_data["language"],
+                    "is_active": True,
+                    "is_verified": True
+                }
+                for user_data in users_data
+            ]
+        ).all()
         
         print(f"✅ Created {len(created_users)} users")
-        for user in created_users:
-            print(f"   - {user.name} ({user.role.value}) - {user.email}")
-        
-        # Create implementation fee invoice
-        impl_invoice = Invoice(
-            firm_id=firm.id,
-            invoice_number=f"INV-{firm.id}-IMPL-202501",
-            amount=30600.0,  # Complete tier implementation fee
-            currency="MAD",
-            invoice_date=date.today(),
-            due_date=date.today() + timedelta(days=7),
-            status=InvoiceStatus.PAID,
-            description="Implementation fee - Complete Plan (includes GPU, training, digitization of 50K pages)",
-            paid_date=date.today()
-        )
-        db.add(impl_invoice)
+        for user_data in users_data:
+            print(f"   - {user_data['name']} ({user_data['role'].value}) - {user_data['email']}")
         
-        # Create first monthly invoice
-        monthly_invoice = Invoice(
-            firm_id=firm.id,
-            invoice_number=f"INV-{firm.id}-202501",
-            amount=1620.0,  # 6 lawyers × 270 MAD
-            currency="MAD",
-            invoice_date=date.today(),
-            due_date=date.today() + timedelta(days=30),
-            status=InvoiceStatus.PENDING,
-            description="Monthly subscription - January 2025 (6 lawyers)"
-        )
-        db.add(monthly_invoice)
+        db.execute(insert(Invoice), [
+            # Implementation fee invoice
+            {
+                "firm_id": firm.id,
+                "invoice_number": f"INV-{firm.id}-IMPL-202501",
+                "amount": 30600.0,  # Complete tier implementation fee
+                "currency": "MAD",
+                "invoice_date": date.today(),
+                "due_date": date.today() + timedelta(days=7),
+                "status": InvoiceStatus.PAID,
+                "description": "Implementation fee - Complete Plan (includes GPU, training, digitization of 50K pages)",
+                "paid_date": date.today()
+            },
+            # First monthly invoice
+            {
+                "firm_id": firm.id,
+                "invoice_number": f"INV-{firm.id}-202501",
+                "amount": 1620.0,  # 6 lawyers × 270 MAD
+                "currency": "MAD",
+                "invoice_date": date.today(),
+                "due_date": date.today() + timedelta(days=30),
+                "status": InvoiceStatus.PENDING,
+                "description": "Monthly subscription - January 2025 (6 lawyers)",
+                "paid_date": None
+            }
+        ])
         
         print(f"✅ Created 2 invoices (implementation + monthly)")
         
@@ -198,6 +221,7 @@ def create_example_firm():
         
         print(f"✅ Created example expediente: {expediente.expediente_number}")
         
+        # Single commit: the whole firm is created or nothing is
         db.commit()
         
         print("\n" + "="*60)
@@ -206,10 +230,10 @@ def create_example_firm():
         print(f"\nFirm Details:")
         print(f"  Name: {firm.name}")
         print(f"  Email: {firm.email}")
-        print(f"  Subscription: {subscription.plan_tier.value.title()} (Active)")
+        print(f"  Subscription: {subscription_tier.value.title()} (Active)")
         print(f"  Users: {len(created_users)}")
         print(f"\nLogin Credentials (all users):")
-        print(f"  Password: Demo2025!")
+        print(f"  Password: {DEMO_PASSWORD}")
         print(f"\nExample Users:")
         print(f"  Admin: fatima@cabinet-demo.ma")
         print(f"  Lawyer: ahmed@cabinet-demo.ma")
@@ -0,0 +1,12 @@
+-- Migration: Track a content hash per embedded chunk
+-- Created: 2026-10-15
+-- Description: Lets embed_document_async reuse the stored embeddings of unchanged chunks when a document is re-embedded
+
+ALTER TABLE document_embeddings ADD COLUMN IF NOT EXISTS chunk_hash VARCHAR(32);
+
+-- Not unique: repeated boilerplate chunks in one document share a hash
+-- Note: CONCURRENTLY requires running outside a transaction block
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_document_embeddings_document_id_chunk_hash
+ON document_embeddings(document_id, chunk_hash);
+
+COMMENT ON COLUMN document_embeddings.chunk_hash IS 'blake2b-128 hex digest of chunk_text (rows embedded before this migration have NULL)';
@@ -0,0 +1,9 @@
+-- Migration: Track which OCR text a document's embeddings were built from
+-- Created: 2026-10-15
+-- Description: Lets embed_document skip re-embedding (and the embeddings COUNT) when the OCR text is unchanged
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS embedding_source_hash VARCHAR(32);
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS embedding_chunk_count INTEGER;
+
+COMMENT ON COLUMN documents.embedding_source_hash IS 'blake2b-128 hex digest of the OCR text used for the stored embeddings';
+COMMENT ON COLUMN documents.embedding_chunk_count IS 'Number of document_embeddings rows created from that OCR text';
@@ -0,0 +1,16 @@
+-- Migration: Store document embeddings as half-precision vectors
+-- Created: 2026-10-15
+-- Description: Converts document_embeddings.embedding from vector(1536) to halfvec(1536), halving
+-- row and HNSW index size. Cosine ranking is unaffected by float16 rounding. Requires pgvector >= 0.7.0.
+
+-- The HNSW index is tied to the vector opclass, so rebuild it after the type change
+DROP INDEX IF EXISTS ix_document_embeddings_embedding_cosine;
+
+ALTER TABLE document_embeddings
+    ALTER COLUMN embedding TYPE halfvec(1536) USING embedding::halfvec(1536);
+
+CREATE INDEX IF NOT EXISTS ix_document_embeddings_embedding_cosine ON document_embeddings
+USING hnsw (embedding halfvec_cosine_ops);
+
+COMMENT ON COLUMN document_embeddings.embedding IS '1536-dimensional float16 vector (halfvec) from OpenAI text-embedding-3-large';
+COMMENT ON INDEX ix_document_embeddings_embedding_cosine IS 'HNSW index (halfvec_cosine_ops) for fast cosine similarity search in RAG queries';
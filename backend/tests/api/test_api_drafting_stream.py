@@ -0,0 +1,134 @@
+# backend/tests/api/test_api_drafting_stream.py - Tests de API de Redacción en Streaming (SSE)
+
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.auth.jwt import get_current_user
+from app.database import get_db
+from app.models import UserRole
+from app.routes import drafting
+from app.services.document_drafting_service import DocumentDraftingService
+
+PROMPT_PAYLOAD = {"document_type": "contrato", "user_prompt": "contrato de arrendamiento"}
+
+
+def _chunk(delta):
+    """Fragmento de streaming con la forma de ChatCompletionChunk."""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+def _events(response):
+    """Separa el cuerpo SSE en (evento, datos) por cada bloque."""
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def db():
+    """Sesión simulada que asigna id al documento guardado."""
+    session = MagicMock()
+    session.refresh.side_effect = lambda document: setattr(document, "id", 42)
+    return session
+
+
+@pytest.fixture
+def drafting_client(db):
+    """App mínima con el router de redacción y un abogado autenticado."""
+    app = FastAPI()
+    app.include_router(drafting.router)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=2, firm_id=1, role=UserRole.LAWYER)
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+def _mock_completion(monkeypatch, chunks):
+    """Sustituye el cliente OpenAI por uno cuyo streaming devuelve los fragmentos dados."""
+    client = MagicMock()
+    client.chat.completions.create.side_effect = lambda **kwargs: iter(chunks)
+    monkeypatch.setattr(DocumentDraftingService, "_ensure_openai_client", lambda self: client)
+    return client
+
+
+@pytest.mark.api
+class TestDraftingStreamAPI:
+    """Tests de los endpoints /api/drafting/generate/*/stream."""
+
+    def test_prompt_stream_relays_deltas_then_done(self, drafting_client, db, monkeypatch):
+        """Test que cada fragmento llega como evento data: y el evento done lleva el id guardado."""
+        client = _mock_completion(monkeypatch, [_chunk("عقد "), _chunk(None), _chunk("كراء")])
+
+        response = drafting_client.post("/api/drafting/generate/prompt/stream", json=PROMPT_PAYLOAD)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = _events(response)
+        assert events[:2] == [("message", {"delta": "عقد "}), ("message", {"delta": "كراء"})]
+        assert events[2][0] == "done" and events[2][1]["id"] == 42
+        assert len(events) == 3
+        assert client.chat.completions.create.call_args.kwargs["stream"] is True
+        assert db.add.call_args.args[0].content == "عقد كراء"
+        db.commit.assert_called_once()
+
+    def test_template_stream_relays_deltas_then_done(self, drafting_client, monkeypatch):
+        """Test que el streaming desde plantilla termina con el evento done del documento guardado."""
+        _mock_completion(monkeypatch, [_chunk("محضر")])
+        monkeypatch.setattr(DocumentDraftingService, "_get_template", lambda self, template_id, firm_id, db: SimpleNamespace(
+            template_content="اجتماع {{date}}", template_type=drafting.LegalDocumentType.ACTA,
+            name="محضر", is_active=True
+        ))
+
+        response = drafting_client.post(
+            "/api/drafting/generate/template/stream",
+            json={"template_id": 7, "placeholders": {"date": "2025-01-01"}}
+        )
+
+        assert response.status_code == 200
+        assert [event for event, _ in _events(response)] == ["message", "done"]
+        assert _events(response)[1][1]["id"] == 42
+
+    def test_mid_stream_failure_emits_error_event(self, drafting_client, db, monkeypatch):
+        """Test que un fallo a mitad del streaming se notifica con un evento error sin guardar nada."""
+        def failing_stream():
+            yield _chunk("بداية")
+            raise RuntimeError("connection reset")
+
+        client = MagicMock()
+        client.chat.completions.create.side_effect = lambda **kwargs: failing_stream()
+        monkeypatch.setattr(DocumentDraftingService, "_ensure_openai_client", lambda self: client)
+
+        response = drafting_client.post("/api/drafting/generate/prompt/stream", json=PROMPT_PAYLOAD)
+
+        assert response.status_code == 200
+        assert _events(response) == [
+            ("message", {"delta": "بداية"}),
+            ("error", {"detail": "connection reset"}),
+        ]
+        db.commit.assert_not_called()
+
+    def test_missing_template_returns_404(self, drafting_client, db, monkeypatch):
+        """Test que una plantilla inexistente devuelve 404 antes de empezar el streaming."""
+        _mock_completion(monkeypatch, [])
+        db.query.return_value.filter.return_value.first.return_value = None
+
+        response = drafting_client.post(
+            "/api/drafting/generate/template/stream",
+            json={"template_id": 987654, "placeholders": {}}
+        )
+
+        assert response.status_code == 404
+
+    def test_missing_api_key_returns_503(self, drafting_client, monkeypatch):
+        """Test que sin clave de OpenAI se devuelve 503 antes de empezar el streaming."""
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+        response = drafting_client.post("/api/drafting/generate/prompt/stream", json=PROMPT_PAYLOAD)
+
+        assert response.status_code == 503
@@ -50,8 +50,14 @@ def db_session() -> Generator[Session, None, None]:
         # Limpiar tablas
         Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture(scope="session")
+def app_client() -> Generator[TestClient, None, None]:
+    """Single TestClient for the whole session (app startup/shutdown run once)."""
+    with TestClient(app) as test_client:
+        yield test_client
+
 @pytest.fixture(scope="function")
-def client(db_session: Session) -> Generator[TestClient, None, None]:
+def client(app_client: TestClient, db_session: Session) -> Generator[TestClient, None, None]:
     """Create a test client with database session override."""
     def override_get_db():
         try:
@@ -61,8 +67,7 @@ def client(db_session: Session) -> Generator[TestClient, None, None]:
     
     app.dependency_overrides[get_db] = override_get_db
     
-    with TestClient(app) as test_client:
-        yield test_client
+    yield app_client
     
     app.dependency_overrides.clear()
 
@@ -14,32 +14,137 @@ Simulates:
 - Real-world usage patterns
 """
 
-from locust import HttpUser, task, between, TaskSet
+from locust import events, task, between, TaskSet
+from locust.contrib.fasthttp import FastHttpUser
 from locust.exception import StopUser
+import itertools
 import json
+import os
 import random
-import io
 import time
 
+import numpy as np
+
 # Commercial role distribution (realistic)
 COMMERCIAL_ROLES = {
     "ADMIN": 0.10,      # 10% firm owners
     "LAWYER": 0.70,     # 70% attorneys
     "ASSISTANT": 0.20   # 20% paralegals
 }
+ROLE_NAMES = tuple(COMMERCIAL_ROLES)
+ROLE_WEIGHTS = tuple(COMMERCIAL_ROLES.values())
 
+# Request parameter pools (built once, sampled by every task iteration)
+PAGE_CHOICES = (1, 3, 5, 10)
+DOCUMENT_TYPES = ("contract", "demand", "power_of_attorney")
+RAG_QUERIES = (
+    # Arabic
+    "ما هي القضايا المشابهة لقضية العقارات؟",
+    "أين توجد عقود الإيجار؟",
+    "ما هي المواعيد النهائية القادمة؟",
+    # French
+    "Quels sont les contrats de bail?",
+    "Trouvez les documents sur les litiges commerciaux",
+    "Montrez-moi les procurations récentes"
+)
+DRAFT_TEMPLATES = ("meeting_minutes", "demand", "contract", "power_of_attorney")
+SEARCH_TERMS = ("عقد", "دعوى", "وكالة", "محضر", "contract", "demand")
+ASSISTANT_SEARCH_TERMS = ("عقد", "محضر", "وكالة")
+STRESS_QUESTION = " ".join(f"Legal document paragraph {i}" for i in range(100))
 
-def generate_pdf_content(pages=5):
-    """Generate mock PDF content for load testing"""
-    content_map = {
-        1: b"%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n/Pages 2 0 R\n>>\nendobj\n2 0 obj\n<<\n/Type /Pages\n/Kids [3 0 R]\n/Count 1\n>>\nendobj\n3 0 obj\n<<\n/Type /Page\n/Parent 2 0 R\n/MediaBox [0 0 612 792]\n/Contents 4 0 R\n>>\nendobj\n4 0 obj\n<<\n/Length 44\n>>\nstream\nBT\n/F1 12 Tf\n100 700 Td\n(JusticeAI Test Doc) Tj\nET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f\n0000000009 00000 n\n0000000056 00000 n\n0000000115 00000 n\n0000000214 00000 n\ntrailer\n<<\n/Size 5\n/Root 1 0 R\n>>\nstartxref\n308\n%%EOF",
-        3: b"%PDF-1.4" + b"\n%%PDF Test Content - 3 pages" * 300,
-        5: b"%PDF-1.4" + b"\n%%PDF Test Content - 5 pages" * 500,
-        10: b"%PDF-1.4" + b"\n%%PDF Test Content - 10 pages" * 1000
-    }
+# Expediente ids 1..500 are drawn on the hottest tasks: generate them in bulk with
+# numpy once and cycle, instead of one random.randint call per request
+EXPEDIENTE_IDS = itertools.cycle(np.random.default_rng().integers(1, 501, size=100_000).tolist())
+
+
+LOAD_TEST_PASSWORD = "Test123!@#"
+
+# Tokens are reused until shortly before the server's JWT expiry (same env var as app/config.py)
+TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")) * 60 - 60
+
+# (Bearer token, issue time) by username, shared by every simulated user in this
+# process. Usernames repeat across spawns (role/firm/n), so re-spawned users skip
+# /api/auth/login and the benchmark measures the API rather than bcrypt.
+_TOKEN_CACHE = {}
+
+
+def login_cached(client, username):
+    """Return a Bearer token for username, logging in on a miss or once the cached token expired"""
+    cached = _TOKEN_CACHE.get(username)
+    if cached is not None and time.monotonic() - cached[1] < TOKEN_TTL_SECONDS:
+        return cached[0]
+    
+    response = client.post(
+        "/api/auth/login",
+        json={"username": username, "password": LOAD_TEST_PASSWORD},
+        name="/api/auth/login"
+    )
+    if response.status_code != 200:
+        return None
     
-    closest_size = min(content_map.keys(), key=lambda k: abs(k - pages))
-    return content_map[closest_size]
+    token = response.json().get("access_token")
+    if not token:
+        _TOKEN_CACHE.pop(username, None)
+        return None
+    _TOKEN_CACHE[username] = (token, time.monotonic())
+    return token
+
+
+@events.request.add_listener
+def _evict_rejected_token(response=None, context=None, **kwargs):
+    """Drop a user's cached token when the API rejects it, so its next request logs in again"""
+    if context and getattr(response, "status_code", None) == 401:
+        _TOKEN_CACHE.pop(context.get("username"), None)
+
+
+# Mock PDF payloads by page count, built once per load generator (not per upload)
+PDF_CONTENT_BY_PAGES = {
+    1: b"%PDF-1.4\n1 0 obj\n<<\n/Type /Catalog\n/Pages 2 0 R\n>>\nendobj\n2 0 obj\n<<\n/Type /Pages\n/Kids [3 0 R]\n/Count 1\n>>\nendobj\n3 0 obj\n<<\n/Type /Page\n/Parent 2 0 R\n/MediaBox [0 0 612 792]\n/Contents 4 0 R\n>>\nendobj\n4 0 obj\n<<\n/Length 44\n>>\nstream\nBT\n/F1 12 Tf\n100 700 Td\n(JusticeAI Test Doc) Tj\nET\nendstream\nendobj\nxref\n0 5\n0000000000 65535 f\n0000000009 00000 n\n0000000056 00000 n\n0000000115 00000 n\n0000000214 00000 n\ntrailer\n<<\n/Size 5\n/Root 1 0 R\n>>\nstartxref\n308\n%%EOF",
+    3: b"%PDF-1.4" + b"\n%%PDF Test Content - 3 pages" * 300,
+    5: b"%PDF-1.4" + b"\n%%PDF Test Content - 5 pages" * 500,
+    10: b"%PDF-1.4" + b"\n%%PDF Test Content - 10 pages" * 1000
+}
+
+
+def generate_pdf_content(pages=5):
+    """Return mock PDF content for load testing (shared bytes, never mutated)"""
+    content = PDF_CONTENT_BY_PAGES.get(pages)
+    if content is None:
+        content = PDF_CONTENT_BY_PAGES[min(PDF_CONTENT_BY_PAGES, key=lambda k: abs(k - pages))]
+    return content
+
+
+# FastHttpUser has no files= support: uploads are sent as a hand-built multipart body
+MULTIPART_BOUNDARY = "JusticeAILoadTestBoundary7d93a1"
+MULTIPART_CONTENT_TYPE = f"multipart/form-data; boundary={MULTIPART_BOUNDARY}"
+
+
+def multipart_file_part(filename, content):
+    """Encode the trailing PDF file part (including the closing boundary)"""
+    return b"".join((
+        f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/pdf\r\n\r\n'.encode(),
+        content,
+        f'\r\n--{MULTIPART_BOUNDARY}--\r\n'.encode()
+    ))
+
+
+def encode_multipart(fields, file_part):
+    """Encode form fields in front of a pre-encoded file part"""
+    parts = [
+        f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(file_part)
+    return b"".join(parts)
+
+
+# File parts are encoded once at load; each upload only encodes its small form fields
+UPLOAD_FILE_PARTS = {
+    pages: multipart_file_part(f'legal_doc_{pages}p.pdf', generate_pdf_content(pages))
+    for pages in PAGE_CHOICES
+}
+STRESS_FILE_PART = multipart_file_part('stress_10p.pdf', generate_pdf_content(pages=10))
 
 
 class LawyerBehavior(TaskSet):
@@ -48,29 +153,23 @@ class LawyerBehavior(TaskSet):
     @task(15)
     def upload_and_classify_document(self):
         """Upload PDF + trigger async OCR + auto-classification"""
-        pages = random.choice([1, 3, 5, 10])
-        pdf_content = generate_pdf_content(pages)
-        
-        files = {
-            'file': (f'legal_doc_{pages}p.pdf', io.BytesIO(pdf_content), 'application/pdf')
-        }
+        pages = random.choice(PAGE_CHOICES)
         data = {
-            'expediente_id': str(random.randint(1, 500)),
-            'document_type': random.choice(['contract', 'demand', 'power_of_attorney'])
+            'expediente_id': str(next(EXPEDIENTE_IDS)),
+            'document_type': random.choice(DOCUMENT_TYPES)
         }
+        body = encode_multipart(data, UPLOAD_FILE_PARTS[pages])
         
         with self.client.post(
             "/api/documents/upload",
-            files=files,
-            data=data,
-            headers=self.user.headers,
+            data=body,
+            headers={**self.user.headers, "Content-Type": MULTIPART_CONTENT_TYPE},
             catch_response=True,
-            timeout=60,
             name=f"/api/documents/upload [{pages}p]"
         ) as response:
             if response.status_code == 200:
-                doc_data = response.json()
-                doc_id = doc_data.get('id')
+                # Cheap byte scan first: only decode the body when it can carry an id
+                doc_id = response.json().get('id') if b'"id"' in response.content else None
                 
                 if doc_id:
                     time.sleep(1)
@@ -90,18 +189,7 @@ class LawyerBehavior(TaskSet):
     @task(20)
     def rag_chat_query(self):
         """Intelligent chat with RAG (vector embeddings + semantic search)"""
-        queries_arabic = [
-            "ما هي القضايا المشابهة لقضية العقارات؟",
-            "أين توجد عقود الإيجار؟",
-            "ما هي المواعيد النهائية القادمة؟"
-        ]
-        queries_french = [
-            "Quels sont les contrats de bail?",
-            "Trouvez les documents sur les litiges commerciaux",
-            "Montrez-moi les procurations récentes"
-        ]
-        
-        query = random.choice(queries_arabic + queries_french)
+        query = random.choice(RAG_QUERIES)
         
         payload = {
             "question": query,
@@ -118,10 +206,8 @@ class LawyerBehavior(TaskSet):
     @task(10)
     def generate_legal_draft(self):
         """Legal document drafting with GPT-4o"""
-        templates = ["meeting_minutes", "demand", "contract", "power_of_attorney"]
-        
         payload = {
-            "template_type": random.choice(templates),
+            "template_type": random.choice(DRAFT_TEMPLATES),
             "context": {
                 "client_name": f"Client_{random.randint(1, 1000)}",
                 "case_number": f"{random.randint(1000, 9999)}/2025",
@@ -139,10 +225,8 @@ class LawyerBehavior(TaskSet):
     @task(12)
     def search_documents(self):
         """Document search (tests Elasticsearch + cache)"""
-        search_terms = ["عقد", "دعوى", "وكالة", "محضر", "contract", "demand"]
-        
         params = {
-            "q": random.choice(search_terms),
+            "q": random.choice(SEARCH_TERMS),
             "limit": 20
         }
         
@@ -241,9 +325,7 @@ class AssistantBehavior(TaskSet):
     @task(10)
     def search_documents(self):
         """Search documents"""
-        search_terms = ["عقد", "محضر", "وكالة"]
-        
-        params = {"q": random.choice(search_terms)}
+        params = {"q": random.choice(ASSISTANT_SEARCH_TERMS)}
         self.client.get(
             "/api/documents/search",
             params=params,
@@ -254,7 +336,7 @@ class AssistantBehavior(TaskSet):
     @task(8)
     def view_expediente_details(self):
         """View case details"""
-        exp_id = random.randint(1, 500)
+        exp_id = next(EXPEDIENTE_IDS)
         self.client.get(
             f"/api/expedientes/{exp_id}",
             headers=self.user.headers,
@@ -262,58 +344,62 @@ class AssistantBehavior(TaskSet):
         )
 
 
-class CommercialUser(HttpUser):
+# Behavior assigned to each role after login
+TASKS_BY_ROLE = {
+    "LAWYER": [LawyerBehavior],
+    "ADMIN": [AdminBehavior],
+    "ASSISTANT": [AssistantBehavior]
+}
+
+
+class AuthenticatedUser(FastHttpUser):
+    """User whose auth headers follow the shared token cache (re-login after expiry or a 401)"""
+    
+    abstract = True
+    username = None
+    token = None
+    extra_headers = {}
+    
+    def context(self):
+        """Tag every request with the username, so a 401 evicts this user's token"""
+        return {"username": self.username}
+    
+    @property
+    def headers(self):
+        """Bearer headers for the current cached token, logging in again when it was evicted"""
+        token = login_cached(self.client, self.username)
+        if token is None:
+            raise StopUser()
+        if token != self.token:
+            self.token = token
+            self._headers = {"Authorization": f"Bearer {token}", **self.extra_headers}
+        return self._headers
+
+
+class CommercialUser(AuthenticatedUser):
     """Multi-tenant commercial user (600 firms)"""
     
     wait_time = between(2, 5)
+    # geventhttpclient-based client: far more requests/s per load-generator core
+    connection_timeout = 10
+    network_timeout = 60  # uploads trigger OCR + classification
     
     def on_start(self):
         """Login with firm-based authentication"""
         role = self._select_role()
         firm_id = f"firm_{random.randint(1, 600)}"
         
-        username = f"{role.lower()}_{firm_id}_{random.randint(1, 20)}"
+        self.username = f"{role.lower()}_{firm_id}_{random.randint(1, 20)}"
+        self.extra_headers = {"X-Firm-ID": firm_id}
+        self.headers  # logs in (or stops the user) before any task runs
         
-        credentials = {
-            "username": username,
-            "password": "Test123!@#"
-        }
-        
-        response = self.client.post(
-            "/api/auth/login",
-            json=credentials,
-            catch_response=True
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            self.token = data.get("access_token", "")
-            self.headers = {
-                "Authorization": f"Bearer {self.token}",
-                "X-Firm-ID": firm_id
-            }
-            self.role = role
-            self.firm_id = firm_id
-            
-            if role == "LAWYER":
-                self.tasks = [LawyerBehavior]
-            elif role == "ADMIN":
-                self.tasks = [AdminBehavior]
-            else:
-                self.tasks = [AssistantBehavior]
-        else:
-            raise StopUser()
+        self.role = role
+        self.firm_id = firm_id
+        self.tasks = TASKS_BY_ROLE[role]
     
     def _select_role(self):
         """Select role based on realistic distribution"""
-        rand = random.random()
-        
-        if rand < COMMERCIAL_ROLES["ADMIN"]:
-            return "ADMIN"
-        elif rand < COMMERCIAL_ROLES["ADMIN"] + COMMERCIAL_ROLES["LAWYER"]:
-            return "LAWYER"
-        else:
-            return "ASSISTANT"
+        return random.choices(ROLE_NAMES, weights=ROLE_WEIGHTS)[0]
     
     @task(1)
     def health_check(self):
@@ -321,48 +407,34 @@ class CommercialUser(HttpUser):
         self.client.get("/health", name="/health")
 
 
-class HighLoadAsyncUser(HttpUser):
+class HighLoadAsyncUser(AuthenticatedUser):
     """Stress test async pipeline with heavy OCR/embedding workload"""
     
     wait_time = between(1, 2)
+    connection_timeout = 10
+    network_timeout = 90  # 10-page OCR uploads
     
     def on_start(self):
-        credentials = {
-            "username": f"lawyer_stress_{random.randint(1, 100)}",
-            "password": "Test123!@#"
-        }
-        
-        response = self.client.post("/api/auth/login", json=credentials)
-        if response.status_code == 200:
-            data = response.json()
-            self.token = data.get("access_token", "")
-            self.headers = {"Authorization": f"Bearer {self.token}"}
-        else:
-            raise StopUser()
+        self.username = f"lawyer_stress_{random.randint(1, 100)}"
+        self.headers  # logs in (or stops the user) before any task runs
     
     @task(10)
     def stress_async_ocr(self):
         """Heavy OCR load (10-page PDFs)"""
-        pdf_content = generate_pdf_content(pages=10)
-        
-        files = {'file': ('stress_10p.pdf', io.BytesIO(pdf_content), 'application/pdf')}
         data = {'expediente_id': str(random.randint(1, 100))}
+        body = encode_multipart(data, STRESS_FILE_PART)
         
         self.client.post(
             "/api/documents/upload",
-            files=files,
-            data=data,
-            headers=self.headers,
-            timeout=90,
+            data=body,
+            headers={**self.headers, "Content-Type": MULTIPART_CONTENT_TYPE},
             name="/api/documents/upload [STRESS 10p]"
         )
     
     @task(8)
     def stress_embeddings(self):
         """Heavy embedding generation"""
-        long_text = " ".join([f"Legal document paragraph {i}" for i in range(100)])
-        
-        payload = {"question": long_text, "max_results": 10}
+        payload = {"question": STRESS_QUESTION, "max_results": 10}
         
         self.client.post(
             "/api/chat/ask",
@@ -1,13 +1,10 @@
 import pytest
-from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
-from app.main import app
 from app.models import Firm, SubscriptionStatus
 
-client = TestClient(app)
 
 @patch("app.services.stripe_service.stripe")
-def test_create_checkout_session(mock_stripe, db_session, test_user_token, test_firm):
+def test_create_checkout_session(mock_stripe, client, db_session, test_user_token, test_firm):
     """Test creating a checkout session"""
     
     # Mock Stripe responses
@@ -38,7 +35,7 @@ def test_create_checkout_session(mock_stripe, db_session, test_user_token, test_
     assert len(line_items) == 2
     assert line_items[1]['price'] == 'price_setup_fee_test'
 
-def test_stripe_webhook(db_session, test_firm):
+def test_stripe_webhook(client, db_session, test_firm):
     """Test handling a successful payment webhook"""
     
     # Setup firm with customer_id
@@ -1,12 +1,9 @@
 import pytest
-from fastapi.testclient import TestClient
-from app.main import app
 from app.models import Document, User, Firm
 from app.database import get_db
 
-client = TestClient(app)
 
-def test_update_ocr_verification(db_session, test_user_token, test_document):
+def test_update_ocr_verification(client, db_session, test_user_token, test_document):
     """Test the OCR verification endpoint"""
     
     # 1. Verify initial state
@@ -11,62 +11,74 @@ from app.auth.auth import get_password_hash, create_access_token
 # -----------------------------------------------------------------------------
 
 @pytest.fixture(scope="function")
-def firm_a(db_session: Session) -> Firm:
-    firm = Firm(
-        name="Firm A - Legal Corp",
-        email="contact@firma.ma",
-        subscription_status=SubscriptionStatus.ACTIVE,
-        subscription_tier=SubscriptionTier.COMPLETE
+def tenant_firms(db_session: Session) -> tuple:
+    """Firm A y Firm B, insertadas juntas con un solo commit."""
+    firms = (
+        Firm(
+            name="Firm A - Legal Corp",
+            email="contact@firma.ma",
+            subscription_status=SubscriptionStatus.ACTIVE,
+            subscription_tier=SubscriptionTier.COMPLETE
+        ),
+        Firm(
+            name="Firm B - Another Corp",
+            email="contact@firmb.ma",
+            subscription_status=SubscriptionStatus.ACTIVE,
+            subscription_tier=SubscriptionTier.BASIC
+        )
     )
-    db_session.add(firm)
+    db_session.add_all(firms)
     db_session.commit()
-    db_session.refresh(firm)
-    return firm
+    return firms
 
 @pytest.fixture(scope="function")
-def firm_b(db_session: Session) -> Firm:
-    firm = Firm(
-        name="Firm B - Another Corp",
-        email="contact@firmb.ma",
-        subscription_status=SubscriptionStatus.ACTIVE,
-        subscription_tier=SubscriptionTier.BASIC
-    )
-    db_session.add(firm)
-    db_session.commit()
-    db_session.refresh(firm)
-    return firm
+def firm_a(tenant_firms: tuple) -> Firm:
+    return tenant_firms[0]
 
 @pytest.fixture(scope="function")
-def user_a(db_session: Session, firm_a: Firm) -> User:
-    user = User(
-        email="admin@firma.ma",
-        name="Admin Firm A",
-        hashed_password=get_password_hash("password123"),
-        role=UserRole.ADMIN,
-        firm_id=firm_a.id,
-        is_active=True,
-        is_verified=True
-    )
-    db_session.add(user)
-    db_session.commit()
-    db_session.refresh(user)
-    return user
+def firm_b(tenant_firms: tuple) -> Firm:
+    return tenant_firms[1]
+
+@pytest.fixture(scope="session")
+def tenant_password_hash() -> str:
+    """Hash bcrypt de "password123", calculado una vez por sesión."""
+    return get_password_hash("password123")
 
 @pytest.fixture(scope="function")
-def user_b(db_session: Session, firm_b: Firm) -> User:
-    user = User(
-        email="admin@firmb.ma",
-        name="Admin Firm B",
-        hashed_password=get_password_hash("password123"),
-        role=UserRole.ADMIN,
-        firm_id=firm_b.id,
-        is_active=True,
-        is_verified=True
+def tenant_users(db_session: Session, firm_a: Firm, firm_b: Firm, tenant_password_hash: str) -> tuple:
+    """Administradores de Firm A y Firm B (hash compartido y un solo commit)."""
+    hashed_password = tenant_password_hash
+    users = (
+        User(
+            email="admin@firma.ma",
+            name="Admin Firm A",
+            hashed_password=hashed_password,
+            role=UserRole.ADMIN,
+            firm_id=firm_a.id,
+            is_active=True,
+            is_verified=True
+        ),
+        User(
+            email="admin@firmb.ma",
+            name="Admin Firm B",
+            hashed_password=hashed_password,
+            role=UserRole.ADMIN,
+            firm_id=firm_b.id,
+            is_active=True,
+            is_verified=True
+        )
     )
-    db_session.add(user)
+    db_session.add_all(users)
     db_session.commit()
-    db_session.refresh(user)
-    return user
+    return users
+
+@pytest.fixture(scope="function")
+def user_a(tenant_users: tuple) -> User:
+    return tenant_users[0]
+
+@pytest.fixture(scope="function")
+def user_b(tenant_users: tuple) -> User:
+    return tenant_users[1]
 
 @pytest.fixture(scope="function")
 def token_a(user_a: User) -> str:
@@ -88,7 +100,6 @@ def case_a(db_session: Session, firm_a: Firm, user_a: User) -> Case:
     )
     db_session.add(case)
     db_session.commit()
-    db_session.refresh(case)
     return case
 
 # -----------------------------------------------------------------------------
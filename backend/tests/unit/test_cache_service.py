@@ -0,0 +1,251 @@
+# backend/tests/unit/test_cache_service.py - Tests Unitarios para el Cache en Memoria
+
+import sqlite3
+from collections import OrderedDict
+
+import pytest
+import numpy as np
+from datetime import timedelta
+
+from app.services import cache_service as cache_module
+from app.services.cache_service import CacheService, EmbeddingDiskStore
+
+
+@pytest.mark.unit
+class TestEmbeddingCache:
+    """Tests para el cache de embeddings."""
+
+    def test_embedding_stored_as_float16(self):
+        """Test que los embeddings se guardan como arrays float16."""
+        cache = CacheService()
+        cache.set_embedding("texto", [0.5, -0.25, 1.0], model="m")
+
+        arr = cache.get_embedding_np("texto", model="m")
+        assert isinstance(arr, np.ndarray)
+        assert arr.dtype == np.float16
+        assert not arr.flags.writeable
+        assert cache.get_embedding("texto", model="m") == [0.5, -0.25, 1.0]
+
+    def test_embedding_bytes_accounting(self):
+        """Test que el contador de bytes sigue inserciones y reemplazos."""
+        cache = CacheService()
+        cache.set_embedding("a", [0.0] * 8, model="m")
+        cache.set_embedding("a", [0.0] * 16, model="m")
+        cache.set_embedding("b", [0.0] * 8, model="m")
+
+        assert cache.get_cache_stats()["embedding_cache_bytes"] == (16 + 8) * 2
+
+    def test_embedding_miss(self):
+        """Test que una clave inexistente devuelve None."""
+        cache = CacheService()
+        assert cache.get_embedding("desconocido") is None
+        assert cache.get_embedding_np("desconocido") is None
+
+    def test_eviction_by_byte_budget(self):
+        """Test que se expulsan las entradas más antiguas al superar el presupuesto de bytes."""
+        cache = CacheService()
+        cache._max_embedding_bytes = 3 * 8 * 2  # tres vectores de 8 dimensiones
+        for text in ("a", "b", "c"):
+            cache.set_embedding(text, [0.0] * 8, model="m")
+        cache.get_embedding("a", model="m")  # "a" pasa a ser el más reciente
+        cache.set_embedding("d", [0.0] * 8, model="m")
+
+        assert cache.get_embedding("b", model="m") is None
+        assert cache.get_embedding("a", model="m") is not None
+        assert cache.get_cache_stats()["embedding_cache_bytes"] == 3 * 8 * 2
+
+    def test_batch_lookup_returns_hits_and_misses(self):
+        """Test que la búsqueda por lotes devuelve una matriz con los aciertos y los índices fallidos."""
+        cache = CacheService()
+        cache.set_embedding("a", [1.0, 2.0], model="m")
+        cache.set_embedding("c", [3.0, 4.0], model="m")
+
+        stacked, misses = cache.get_embeddings_batch(["a", "b", "c"], model="m")
+        assert stacked.shape == (3, 2)
+        assert stacked.dtype == np.float16
+        assert stacked[0].tolist() == [1.0, 2.0]
+        assert stacked[2].tolist() == [3.0, 4.0]
+        assert misses == [1]
+        assert cache.get_embeddings_batch(["x", "y"], model="m") == (None, [0, 1])
+
+    def test_many_roundtrip(self):
+        """Test que set/get por lotes equivalen a llamadas individuales."""
+        cache = CacheService()
+        cache.set_embeddings_many([("a", [1.0, 2.0]), ("b", [3.0, 4.0])], model="m")
+
+        assert cache.get_embeddings_many(["b", "x", "a"], model="m") == [[3.0, 4.0], None, [1.0, 2.0]]
+        assert cache.get_embeddings_many(["x"], model="m") == [None]
+
+    def test_precomputed_keys_match_text_keys(self):
+        """Test que las claves precalculadas equivalen a pasar solo los textos."""
+        cache = CacheService()
+        keys = cache.embedding_keys(["a", "b"], model="m")
+        cache.set_embeddings_many([("a", [1.0]), ("b", [2.0])], model="m", keys=keys)
+
+        assert cache.get_embeddings_many(["b", "a"], model="m") == [[2.0], [1.0]]
+        assert cache.get_embeddings_many(["a"], model="m", keys=keys[:1]) == [[1.0]]
+
+    def test_disk_cache_survives_restart(self, tmp_path):
+        """Test que el cache en disco permite recuperar embeddings tras reiniciar el servicio."""
+        path = str(tmp_path / "embeddings.sqlite3")
+        CacheService(disk_path=path).set_embedding("texto", [0.5, 1.5], model="m")
+
+        restarted = CacheService(disk_path=path)
+        assert restarted.get_embedding("texto", model="m") == [0.5, 1.5]
+        assert restarted.get_cache_stats()["embedding_cache_size"] == 1
+
+    def test_inflight_fetch_is_claimed_once(self):
+        """Test que solo el primer llamador obtiene la propiedad de una búsqueda en curso."""
+        cache = CacheService()
+        owner, event = cache.claim_embedding_fetch("texto", model="m")
+        second_owner, second_event = cache.claim_embedding_fetch("texto", model="m")
+
+        assert owner and not second_owner
+        assert second_event is event
+        cache.set_embedding("texto", [1.0], model="m")
+        assert event.is_set()
+        assert cache.claim_embedding_fetch("texto", model="m")[0]
+
+    def test_released_fetch_wakes_waiters(self):
+        """Test que liberar una búsqueda fallida despierta a los que esperan."""
+        cache = CacheService()
+        _, event = cache.claim_embedding_fetch("texto", model="m")
+        cache.release_embedding_fetch("texto", model="m")
+
+        assert event.is_set()
+        assert cache.get_embedding("texto", model="m") is None
+
+    def test_stale_release_keeps_new_owner(self):
+        """Test que un antiguo propietario no puede liberar la búsqueda reclamada por otro."""
+        cache = CacheService()
+        _, stale = cache.claim_embedding_fetch("texto", model="m")
+        cache.release_embedding_fetch("texto", model="m", inflight=stale)
+        owner, current = cache.claim_embedding_fetch("texto", model="m")
+
+        cache.release_embedding_fetch("texto", model="m", inflight=stale)
+        assert owner and not current.is_set()
+        assert not cache.claim_embedding_fetch("texto", model="m")[0]
+
+
+@pytest.mark.unit
+class TestEmbeddingDiskStore:
+    """Tests para el almacén de embeddings en disco."""
+
+    def test_prune_keeps_rows_once_file_exceeds_limit(self, tmp_path):
+        """Test que la poda mide las páginas vivas y no vacía el almacén cuando el archivo no encoge."""
+        store = EmbeddingDiskStore(str(tmp_path / "embeddings.sqlite3"), size_limit=256 * 1024)
+        store._PRUNE_CHECK_INTERVAL = 100
+        for batch in range(30):
+            store.set_many([(f"k{batch}_{i}", b"x" * 1024) for i in range(100)])
+
+        rows = store._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        assert rows >= 100
+        assert store._used_bytes() <= 256 * 1024 + 100 * 2 * 1024
+        assert store.get("k29_99") == b"x" * 1024
+
+    def test_failed_set_many_rolls_back(self, tmp_path):
+        """Test que un lote fallido no deja la transacción abierta."""
+        store = EmbeddingDiskStore(str(tmp_path / "embeddings.sqlite3"))
+        with pytest.raises(sqlite3.Error):
+            store.set_many([("a", b"1"), ("b", None)])  # value NOT NULL
+
+        store.set_many([("c", b"3")])
+        assert store.get("a") is None
+        assert store.get("c") == b"3"
+
+    def test_disk_read_error_is_a_miss(self, tmp_path):
+        """Test que un error de lectura en disco se trata como un fallo de cache."""
+        cache = CacheService(disk_path=str(tmp_path / "embeddings.sqlite3"))
+        cache._disk._conn.close()
+
+        assert cache.get_embedding("texto", model="m") is None
+
+
+@pytest.mark.unit
+class TestClassificationCache:
+    """Tests para el cache de clasificaciones."""
+
+    def test_eviction_keeps_max_entries(self):
+        """Test que el cache nunca supera el máximo de entradas."""
+        cache = CacheService()
+        cache._max_classification_entries = 2
+        for document_id in (1, 2, 3):
+            cache.set_classification(document_id, {"type": "contract"})
+
+        assert cache.get_classification(1) is None
+        assert cache.get_classification(3) == {"type": "contract"}
+        assert cache.get_cache_stats()["classification_cache_size"] == 2
+
+
+@pytest.mark.unit
+class TestTemplateCache:
+    """Tests para el cache de plantillas."""
+
+    def test_template_cached_per_firm(self):
+        """Test que las plantillas se cachean por (template_id, firm_id)."""
+        cache = CacheService()
+        cache.set_template(7, firm_id=1, template=("contenido", "contrato"))
+
+        assert cache.get_template(7, firm_id=1) == ("contenido", "contrato")
+        assert cache.get_template(7, firm_id=2) is None
+
+    def test_invalidate_template(self):
+        """Test que invalidar una plantilla la elimina del cache."""
+        cache = CacheService()
+        cache.set_template(7, firm_id=1, template=("contenido", "contrato"))
+        cache.invalidate_template(7, firm_id=1)
+
+        assert cache.get_template(7, firm_id=1) is None
+
+
+@pytest.mark.unit
+def test_clear_expired_entries_uses_expiry_heap():
+    """Test que la limpieza elimina solo las entradas caducadas, ignorando entradas obsoletas del heap."""
+    cache = CacheService()
+    cache._cache_ttl = timedelta(seconds=-1)
+    cache.set_embedding("caducado", [1.0], model="m")
+    cache.set_classification(1, {"type": "contract"})
+    cache._cache_ttl = timedelta(hours=1)
+    cache.set_embedding("vigente", [1.0], model="m")
+    cache.set_classification(1, {"type": "judgment"})  # reinsertada: su entrada antigua del heap queda obsoleta
+
+    cache.clear_expired_entries()
+
+    assert cache.get_embedding_np("vigente", model="m") is not None
+    assert cache.get_classification(1) == {"type": "judgment"}
+    stats = cache.get_cache_stats()
+    assert stats["embedding_cache_size"] == 1
+    assert stats["embedding_cache_bytes"] == 2
+
+
+@pytest.mark.unit
+def test_expiry_heaps_stay_bounded_under_repeated_sets():
+    """Test que los heaps de caducidad no crecen sin límite con reinserciones y expulsiones LRU."""
+    cache = CacheService()
+    cache._max_classification_entries = 10
+    for i in range(1000):
+        cache.set_classification(1, {"type": "contract"})
+        cache.set_classification(100 + i, {"type": "judgment"})  # fuerza expulsiones LRU
+        cache.set_embedding("texto", [float(i)], model="m")
+        cache.set_template(7, firm_id=1, template=("contenido", str(i)))
+
+    assert len(cache._classification_expiry_heap) <= 2 * len(cache._classification_cache)
+    assert len(cache._embedding_expiry_heap) <= 2 * len(cache._embedding_cache)
+    assert len(cache._template_expiry_heap) <= 2 * len(cache._template_cache)
+    assert cache.get_embedding("texto", model="m") == [999.0]
+    assert cache.get_classification(1099) == {"type": "judgment"}
+
+
+@pytest.mark.unit
+def test_singleton_is_bounded_lru_cache(monkeypatch):
+    """Test que el singleton del módulo expulsa la entrada más antigua al superar su capacidad."""
+    cache = cache_module.cache_service
+    monkeypatch.setattr(cache, "_max_classification_entries", 2)
+    monkeypatch.setattr(cache, "_classification_cache", OrderedDict())
+    monkeypatch.setattr(cache, "_classification_expiry_heap", [])
+    for document_id in (1, 2, 3):
+        cache.set_classification(document_id, {"type": "contract"})
+
+    assert cache.get_classification(1) is None
+    assert cache.get_classification(2) == {"type": "contract"}
+    assert cache.get_classification(3) == {"type": "contract"}
@@ -0,0 +1,59 @@
+# backend/tests/unit/test_document_drafting_service.py - Tests Unitarios para el Servicio de Redacción
+
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.models import LegalDocumentType
+from app.services import document_drafting_service as drafting_module
+from app.services.document_drafting_service import DocumentDraftingService, PromptGenerationRequest
+
+
+@pytest.mark.unit
+class TestGenerateMany:
+    """Tests para la generación concurrente de documentos."""
+
+    def test_results_keep_request_order_and_commit_once(self, monkeypatch):
+        """Test que los documentos siguen el orden de las peticiones y se guardan en un único commit."""
+        async def create(**kwargs):
+            prompt = kwargs["messages"][-1]["content"]
+            await asyncio.sleep(0.03 if "primero" in prompt else 0)  # el primero termina el último
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=prompt))])
+
+        client = MagicMock()
+        client.chat.completions.create = create
+        client.__aenter__ = AsyncMock(return_value=client)
+        client.__aexit__ = AsyncMock(return_value=False)
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        monkeypatch.setattr(drafting_module, "AsyncOpenAI", MagicMock(return_value=client))
+
+        db = MagicMock()
+        commit_threads = []
+        db.commit.side_effect = lambda: commit_threads.append(threading.current_thread())
+        requests = [
+            PromptGenerationRequest(LegalDocumentType.CONTRATO, "primero"),
+            PromptGenerationRequest(LegalDocumentType.DEMANDA, "segundo"),
+        ]
+
+        docs = asyncio.run(DocumentDraftingService().generate_many(requests, firm_id=1, user_id=2, db=db))
+
+        assert ["primero" in doc.content for doc in docs] == [True, False]
+        assert [doc.document_type for doc in docs] == [LegalDocumentType.CONTRATO, LegalDocumentType.DEMANDA]
+        db.add_all.assert_called_once_with(docs)
+        assert db.commit.call_count == 1
+        assert commit_threads[0] is not threading.main_thread()
+        client.__aexit__.assert_awaited_once()
+
+    def test_missing_api_key_raises(self, monkeypatch):
+        """Test que sin clave de API se lanza ValueError sin tocar la base de datos."""
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        db = MagicMock()
+
+        with pytest.raises(ValueError):
+            asyncio.run(DocumentDraftingService().generate_many(
+                [PromptGenerationRequest(LegalDocumentType.ACTA, "acta")], firm_id=1, user_id=2, db=db
+            ))
+        db.commit.assert_not_called()
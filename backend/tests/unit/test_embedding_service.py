@@ -0,0 +1,336 @@
+# backend/tests/unit/test_embedding_service.py - Tests Unitarios para el Servicio de Embeddings
+
+import asyncio
+import base64
+import json
+import httpx
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from openai import AsyncOpenAI
+from pgvector import HalfVector
+
+from app.services import embedding_service as embedding_module
+from app.services.cache_service import cache_service
+from app.services.embedding_service import EmbeddingService
+
+
+@pytest.mark.unit
+class TestChunkText:
+    """Tests para la división de texto en fragmentos."""
+
+    def test_chunks_overlap_and_cover_text(self, monkeypatch):
+        """Test que los fragmentos se solapan y cubren todas las palabras (sin tiktoken)."""
+        monkeypatch.setattr(embedding_module, "_get_token_encoder", lambda: None)
+        service = EmbeddingService()
+        words = [f"كلمة{i}" for i in range(1234)]
+        chunks = service.chunk_text(" ".join(words))
+
+        assert [len(chunk.split()) for chunk in chunks] == [500, 500, 334]
+        assert chunks[1].split()[0] == words[450]
+        assert chunks[-1].split()[-1] == words[-1]
+
+    def test_chunks_are_slices_of_original_text(self):
+        """Test que los fragmentos conservan el texto original (saltos de línea incluidos)."""
+        service = EmbeddingService()
+        text = "\n".join(f"línea número {i} del documento" for i in range(200))
+
+        for chunk in service.chunk_text(text):
+            assert chunk in text
+
+    def test_token_windows_respect_budget(self):
+        """Test que cada ventana cabe en el presupuesto de tokens y se solapa con la anterior."""
+        word_starts = np.arange(0, 200, 2)
+        word_ends = word_starts + 1
+        word_tokens = np.array([1, 2, 3, 4] * 25)
+
+        starts, ends = embedding_module._token_windows(
+            word_starts, word_ends, word_tokens, max_tokens=10, overlap=1, min_chars=0
+        )
+        first_words, last_words = starts // 2, (ends - 1) // 2
+
+        for first, last in zip(first_words, last_words):
+            assert word_tokens[first:last + 1].sum() <= 10
+        assert first_words[0] == 0 and last_words[-1] == 99
+        assert all(first_words[1:] == last_words[:-1])
+
+    def test_oversized_word_gets_own_window(self):
+        """Test que una palabra que supera el presupuesto forma su propia ventana."""
+        starts, ends = embedding_module._token_windows(
+            np.array([0, 10, 20]), np.array([5, 15, 25]), np.array([1, 50, 1]),
+            max_tokens=10, overlap=0, min_chars=0
+        )
+        assert starts.tolist() == [0, 10, 20]
+        assert ends.tolist() == [5, 15, 25]
+
+    def test_word_token_counts_sum_to_text_tokens(self):
+        """Test que los tokens se atribuyen a la palabra en la que empiezan."""
+        class CharEncoder:
+            """Codificador falso: un token por carácter."""
+            def encode_ordinary(self, text):
+                return list(text)
+
+            def decode_with_offsets(self, tokens):
+                return "".join(tokens), list(range(len(tokens)))
+
+        text = "ab  cde f"
+        counts = embedding_module._word_token_counts(CharEncoder(), text, np.array([0, 4, 8]))
+        assert counts.tolist() == [4, 4, 1]
+
+    def test_short_text_returned_whole(self):
+        """Test que un texto corto se devuelve completo."""
+        service = EmbeddingService()
+        assert service.chunk_text("texto corto") == ["texto corto"]
+
+
+@pytest.mark.unit
+class TestGenerateEmbeddingsBatch:
+    """Tests para la generación de embeddings por lotes."""
+
+    def test_duplicate_chunks_embedded_once(self, monkeypatch):
+        """Test que los fragmentos repetidos se envían a la API una sola vez."""
+        service = EmbeddingService()
+        sent = []
+
+        async def fake_embed(batch_texts, max_retries, batch_keys=None):
+            sent.extend(batch_texts)
+            return [[float(len(text))] for text in batch_texts]
+
+        monkeypatch.setattr(service, "_embed_batch_with_retry", fake_embed)
+        texts = ["cabecera dedup", "cuerpo dedup", "cabecera dedup"]
+        results = asyncio.run(service.generate_embeddings_batch(texts))
+
+        assert sent == ["cabecera dedup", "cuerpo dedup"]
+        assert results == [[14.0], [12.0], [14.0]]
+
+    def test_plan_misses_embedded_once(self, monkeypatch):
+        """Test que los fallos del plan se envían una sola vez por texto y se rellenan en orden."""
+        service = EmbeddingService()
+        batches = []
+
+        async def fake_embed_texts(texts, keys, semaphore, max_retries):
+            batches.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+        monkeypatch.setattr(service, "_embed_texts", fake_embed_texts)
+        text = "a bb a ccc dddd"
+        plan = embedding_module.ChunkPlan(
+            text, np.array([0, 2, 5, 7, 11]), np.array([1, 4, 6, 10, 15]),
+            keys=["ka", "kb", "ka", "kc", "kd"], hashes=["ha", "hb", "ha", "hc", "hd"], vectors=[None] * 5
+        )
+        asyncio.run(service._embed_plan_misses(plan, asyncio.Semaphore(5)))
+
+        assert batches == [["a", "bb", "ccc", "dddd"]]
+        assert list(plan.chunks()) == ["a", "bb", "a", "ccc", "dddd"]
+        assert plan.vectors == [[1.0], [2.0], [1.0], [3.0], [4.0]]
+
+    def test_chunk_plan_fills_cache_hits(self):
+        """Test que el plan marca como aciertos los fragmentos ya cacheados."""
+        service = EmbeddingService()
+        text = " ".join(f"plan{i}" for i in range(1200))
+        first_chunk = service.chunk_text(text)[0]
+        cache_service.set_embedding(first_chunk, [0.25, 0.5], service.model)
+
+        plan = service.build_chunk_plan(text)
+
+        assert plan.chunk(0) == first_chunk
+        assert plan.vectors[0].tolist() == [0.25, 0.5]
+        assert plan.miss_indices == list(range(1, len(plan)))
+
+    def test_reuse_stored_embeddings_by_chunk_hash(self):
+        """Test que al regenerar se reutilizan los embeddings de fragmentos sin cambios."""
+        service = EmbeddingService()
+        plan = embedding_module.ChunkPlan(
+            "uno dos", np.array([0, 4]), np.array([3, 7]),
+            keys=["k1", "k2"], hashes=["h1", "h2"], vectors=[None, None]
+        )
+        db = MagicMock()
+        db.query.return_value.filter.return_value.all.return_value = [("h2", HalfVector([0.5, 1.0]))]
+        document = MagicMock(id=1, firm_id=1, embedding_source_hash="previo")
+
+        assert service._reuse_stored_embeddings(plan, document, db) == 1
+        assert plan.vectors[0] is None
+        assert plan.vectors[1].tolist() == [0.5, 1.0]
+        assert plan.miss_indices == [0]
+
+    def test_chunk_hash_depends_on_model_and_dimensions(self):
+        """Test que el hash de fragmento cambia con el modelo o las dimensiones (no se reutilizan vectores ajenos)."""
+        service = EmbeddingService()
+        original = service._chunk_hashes(["mismo texto"])
+        service.dimensions += 1
+        other_dimensions = service._chunk_hashes(["mismo texto"])
+        service.model = "otro-modelo"
+
+        assert len({original[0], other_dimensions[0], service._chunk_hashes(["mismo texto"])[0]}) == 3
+
+    def test_force_regenerate_skips_stored_embeddings(self, monkeypatch):
+        """Test que force_regenerate vuelve a generar todos los fragmentos sin reutilizar los guardados."""
+        service = EmbeddingService()
+        document = MagicMock(id=1, firm_id=1, ocr_text="contenido " * 50, embedding_source_hash="previo")
+        db = MagicMock()
+        db.query.return_value.filter.return_value.first.return_value = document
+        reuse = MagicMock(return_value=1)
+        monkeypatch.setattr(service, "_reuse_stored_embeddings", reuse)
+        monkeypatch.setattr(service, "_check_existing_embeddings", MagicMock(return_value=None))
+        monkeypatch.setattr(service, "generate_embedding", MagicMock(return_value=[0.5]))
+        monkeypatch.setattr(service, "_persist_embeddings", MagicMock(return_value=1))
+
+        service.embed_document(1, 1, db, force_regenerate=True)
+
+        reuse.assert_not_called()
+        service.generate_embedding.assert_called_once()
+
+    def test_raw_base64_response_decoded_to_float32(self, monkeypatch):
+        """Test que la respuesta base64 cruda se decodifica en arrays float32 en el orden de entrada."""
+        def handler(request):
+            body = json.loads(request.content)
+            assert body["encoding_format"] == "base64"
+            data = [
+                {"object": "embedding", "index": index,
+                 "embedding": base64.b64encode(np.full(3, index + 0.5, dtype=np.float32).tobytes()).decode()}
+                for index in reversed(range(len(body["input"])))
+            ]
+            return httpx.Response(200, json={"object": "list", "data": data, "model": body["model"]})
+
+        service = EmbeddingService()
+        service._async_client = AsyncOpenAI(
+            api_key="test", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        vectors = asyncio.run(service._embed_batch_with_retry(["raw uno", "raw dos"], max_retries=1))
+
+        assert [v.dtype for v in vectors] == [np.float32, np.float32]
+        assert [v.tolist() for v in vectors] == [[0.5] * 3, [1.5] * 3]
+
+
+    def test_persist_embeddings_records_provenance(self):
+        """Test que la persistencia inserta solo los fragmentos embebidos y guarda el hash de origen."""
+        service = EmbeddingService()
+        db = MagicMock()
+        document = MagicMock(id=1, firm_id=2)
+
+        created = service._persist_embeddings(document, iter(["a", "b"]), [[1.0], None], "hash", db)
+
+        assert created == 1
+        assert document.embedding_source_hash == "hash"
+        assert document.embedding_chunk_count == 1
+        rows = db.execute.call_args.args[1]
+        assert [row["chunk_text"] for row in rows] == ["a"]
+        db.commit.assert_called_once()
+
+
+@pytest.mark.unit
+def test_failed_fetch_is_retried_by_one_waiter():
+    """Test que, si falla la búsqueda en curso, solo uno de los que esperan vuelve a llamar a la API."""
+    service = EmbeddingService()
+    calls = []
+
+    async def create(model, input, dimensions):
+        calls.append(input)
+        await asyncio.sleep(0.02)
+        if len(calls) == 1:
+            raise RuntimeError("fallo de red")
+        return MagicMock(data=[MagicMock(embedding=[0.5, 0.25])])
+
+    service._async_client = MagicMock()
+    service._async_client.embeddings.create = create
+
+    async def run():
+        return await asyncio.gather(
+            *(service.generate_embedding_async("texto coalescido") for _ in range(4)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert isinstance(results[0], RuntimeError)
+    assert results[1:] == [[0.5, 0.25]] * 3
+
+
+@pytest.mark.unit
+def test_embed_query_hit_skips_api(monkeypatch):
+    """Test que una consulta repetida (con otros espacios) se sirve del cache sin llamar a la API."""
+    service = EmbeddingService()
+    monkeypatch.setattr(service, "generate_embedding", MagicMock(return_value=[0.5, 0.25]))
+    service.embed_query("  résume   ce contrat ")
+    cache_service.set_embedding("résume ce contrat", [0.5, 0.25], service.model)
+
+    embedding = service.embed_query("résume ce\ncontrat")
+    assert isinstance(embedding, np.ndarray)
+    assert embedding.tolist() == [0.5, 0.25]
+    service.generate_embedding.assert_called_once_with("résume ce contrat")
+
+
+@pytest.mark.unit
+class TestPackBatches:
+    """Tests para el empaquetado de lotes por presupuesto de tokens."""
+
+    def test_respects_token_and_item_limits(self):
+        """Test que ningún lote supera el presupuesto de tokens ni el máximo de elementos."""
+        assert embedding_module._pack_batches([4, 4, 4, 1, 1, 1], max_tokens=8, max_items=3) == [
+            (0, 2), (2, 5), (5, 6)
+        ]
+
+    def test_oversized_item_gets_own_batch(self):
+        """Test que un texto que supera el presupuesto va solo en su lote."""
+        assert embedding_module._pack_batches([1, 20, 1], max_tokens=10, max_items=100) == [
+            (0, 1), (1, 2), (2, 3)
+        ]
+        assert embedding_module._pack_batches([], max_tokens=10, max_items=100) == []
+
+
+@pytest.mark.unit
+class TestBatchApi:
+    """Tests para el flujo de embeddings con la Batch API de OpenAI."""
+
+    def test_request_lines_use_document_and_chunk_ids(self):
+        """Test que cada línea JSONL es una petición /v1/embeddings con custom_id "doc:chunk"."""
+        service = EmbeddingService()
+        lines = service._batch_request_lines({7: ["uno", "dos"], 9: ["tres"]}).splitlines()
+        requests = [json.loads(line) for line in lines]
+
+        assert [r["custom_id"] for r in requests] == ["7:0", "7:1", "9:0"]
+        assert requests[2]["url"] == "/v1/embeddings"
+        assert requests[2]["body"] == {"model": service.model, "input": "tres", "dimensions": 1536}
+
+    def test_parse_output_skips_failed_requests(self):
+        """Test que la salida se agrupa por documento y se ignoran las peticiones fallidas."""
+        ok = {"custom_id": "7:1", "response": {"status_code": 200, "body": {"data": [{"embedding": [0.5]}]}}}
+        failed = {"custom_id": "7:0", "response": {"status_code": 400, "body": {}}, "error": None}
+        output = "\n".join(json.dumps(record) for record in (ok, failed)) + "\n"
+
+        assert EmbeddingService._parse_batch_output(output) == {7: {1: [0.5]}}
+
+
+@pytest.mark.unit
+class TestSharedClients:
+    """Tests para los clientes OpenAI compartidos a nivel de módulo."""
+
+    def test_sync_client_shared_across_instances(self, monkeypatch):
+        """Test que todas las instancias usan el mismo cliente síncrono."""
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setattr(embedding_module, "_shared_client", None)
+
+        assert EmbeddingService().client is EmbeddingService().client
+
+    def test_async_client_shared_per_event_loop(self, monkeypatch):
+        """Test que el cliente asíncrono se comparte dentro de un event loop y no entre loops."""
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+        async def clients():
+            return EmbeddingService().async_client, EmbeddingService().async_client
+
+        first, second = asyncio.run(clients())
+        other, _ = asyncio.run(clients())
+        assert first is second
+        assert other is not first
+
+
+@pytest.mark.unit
+def test_background_loop_is_reused():
+    """Test que el wrapper síncrono reutiliza el mismo event loop y servicio en cada llamada."""
+    loop, service = embedding_module._get_background_loop()
+    same_loop, same_service = embedding_module._get_background_loop()
+
+    assert loop is same_loop and service is same_service
+    assert loop.is_running()
@@ -0,0 +1,201 @@
+# backend/tests/unit/test_metrics_service.py - Tests Unitarios para el Servicio de Métricas
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.metrics_service import LatencyHistogram, MetricsService, MetricType, RecentLatencyWindow
+
+
+@pytest.mark.unit
+class TestRecordLatency:
+    """Tests para el registro de latencias."""
+
+    def test_buffered_samples_visible_on_read(self):
+        """Test que las muestras aún no agregadas se incluyen al leer las métricas."""
+        metrics = MetricsService(flush_threshold=1000)
+        metrics.record_latency(MetricType.OCR_ASYNC, 0.5)
+        metrics.record_latency(MetricType.OCR_ASYNC, 1.5, success=False, error_type="timeout")
+
+        result = metrics.get_metrics(MetricType.OCR_ASYNC)
+        assert result["total_calls"] == 2
+        assert result["successful_calls"] == 1
+        assert result["error_distribution"] == {"timeout": 1}
+        assert result["latency"]["avg_seconds"] == 1.0
+        assert result["latency"]["max_seconds"] == 1.5
+
+    def test_writer_folds_full_buffer(self):
+        """Test que el escritor que llena el buffer lo agrega sin esperar una lectura."""
+        metrics = MetricsService(flush_threshold=4)
+        for _ in range(4):
+            metrics.record_latency(MetricType.CACHE_HIT, 0.0)
+
+        assert sum(len(shard) for shard in metrics._pending[MetricType.CACHE_HIT]) == 0
+        assert metrics._metrics[MetricType.CACHE_HIT].total_calls == 4
+
+    def test_concurrent_writers_lose_no_samples(self):
+        """Test que escrituras concurrentes sin lock no pierden muestras."""
+        metrics = MetricsService(flush_threshold=64)
+
+        def worker():
+            for _ in range(2000):
+                metrics.record_latency(MetricType.EMBEDDING_ASYNC, 0.01)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert metrics.get_metrics(MetricType.EMBEDDING_ASYNC)["total_calls"] == 16000
+
+    def test_threads_buffer_in_different_shards(self):
+        """Test que cada hilo escribe en su propio shard y la lectura los agrega todos."""
+        metrics = MetricsService(flush_threshold=1000, shard_count=2)
+        metrics.record_latency(MetricType.OCR_SYNC, 1.0)
+        thread = threading.Thread(target=metrics.record_latency, args=(MetricType.OCR_SYNC, 3.0))
+        thread.start()
+        thread.join()
+
+        assert [len(shard) for shard in metrics._pending[MetricType.OCR_SYNC]] == [1, 1]
+        assert metrics.get_metrics(MetricType.OCR_SYNC)["latency"]["avg_seconds"] == 2.0
+
+    def test_cache_hit_rate_includes_buffered_samples(self):
+        """Test que la comparación async/sync incluye los aciertos de cache aún en buffer."""
+        metrics = MetricsService(flush_threshold=1000)
+        metrics.record_latency(MetricType.CACHE_HIT, 0.0)
+        metrics.record_latency(MetricType.CACHE_MISS, 0.0)
+
+        assert metrics.get_async_vs_sync_comparison()["cache"]["hit_rate_percent"] == 50.0
+
+
+@pytest.mark.unit
+class TestLatencyHistogram:
+    """Tests para el histograma de latencias."""
+
+    def test_percentiles_within_relative_precision(self):
+        """Test que los percentiles del histograma están dentro del 1% del valor exacto."""
+        histogram = LatencyHistogram()
+        durations = [i / 1000 for i in range(1, 1001)]  # 1ms .. 1s
+        histogram.record_many(durations)
+
+        assert histogram.total_count == 1000
+        for percentile, exact in ((50, 0.5), (95, 0.95), (99, 0.99)):
+            assert histogram.value_at_percentile(percentile) == pytest.approx(exact, rel=0.01)
+
+    def test_zero_and_out_of_range_durations(self):
+        """Test que las duraciones nulas y las mayores de 60s se cuentan sin error."""
+        histogram = LatencyHistogram()
+        assert histogram.value_at_percentile(50) == 0.0
+
+        histogram.record_many([0.0, 0.0, 0.0, 3600.0])
+        assert histogram.value_at_percentile(50) == 0.0
+        assert histogram.value_at_percentile(100) == pytest.approx(LatencyHistogram.MAX_SECONDS, rel=0.01)
+
+    def test_only_successful_latencies_feed_percentiles(self):
+        """Test que solo las llamadas exitosas alimentan los percentiles."""
+        metrics = MetricsService()
+        for _ in range(10):
+            metrics.record_latency(MetricType.AI_RAG_CHAT, 0.2)
+        metrics.record_latency(MetricType.AI_RAG_CHAT, 30.0, success=False)
+
+        result = metrics.get_metrics(MetricType.AI_RAG_CHAT)
+        assert result["latency_samples"] == 10
+        assert result["latency"]["p99_seconds"] == pytest.approx(0.2, rel=0.01)
+
+
+@pytest.mark.unit
+class TestRecentLatencyWindow:
+    """Tests para la ventana de latencias recientes."""
+
+    def test_window_keeps_only_latest_samples(self):
+        """Test que la ventana solo refleja las últimas muestras, aunque lleguen en lotes grandes."""
+        window = RecentLatencyWindow()
+        assert window.values_at_percentiles([50]) == [0.0]
+
+        window.record_many([10.0] * 1500)
+        window.record_many([0.5] * 700)
+        window.record_many([0.25] * 400)
+        assert window.total_count == 2600
+        assert sorted(set(window.samples.tolist())) == [0.25, 0.5]
+        assert window.values_at_percentiles([99]) == [0.5]
+
+    def test_recent_percentiles_follow_current_latency(self):
+        """Test que los percentiles recientes siguen la latencia actual y los históricos no."""
+        metrics = MetricsService(flush_threshold=64)
+        for duration in [5.0] * 4000 + [0.1] * 1024:
+            metrics.record_latency(MetricType.AI_DRAFTING, duration)
+
+        latency = metrics.get_metrics(MetricType.AI_DRAFTING)["latency"]
+        assert latency["recent_p99_seconds"] == pytest.approx(0.1, rel=0.01)
+        assert latency["p50_seconds"] == pytest.approx(5.0, rel=0.01)
+
+
+@pytest.mark.unit
+class TestSnapshot:
+    """Tests para la instantánea de métricas."""
+
+    def test_snapshot_covers_all_types_with_buffered_samples(self):
+        """Test que la instantánea incluye todos los tipos y las muestras aún en buffer."""
+        metrics = MetricsService(flush_threshold=1000)
+        metrics.record_latency(MetricType.OCR_ASYNC, 1.0)
+        metrics.record_latency(MetricType.OCR_SYNC, 3.0)
+
+        snapshot = metrics.snapshot()
+        assert set(snapshot) == set(MetricType)
+        assert snapshot[MetricType.OCR_ASYNC]["total_calls"] == 1
+        assert snapshot[MetricType.CACHE_HIT]["min_latency"] == 0
+        assert metrics.get_async_vs_sync_comparison()["ocr"]["speedup"] == 3.0
+
+
+@pytest.mark.unit
+def test_prometheus_export_from_template():
+    """Test que la exportación Prometheus rellena la plantilla precalculada con los valores actuales."""
+    metrics = MetricsService()
+    metrics.record_latency(MetricType.OCR_ASYNC, 0.0)
+    metrics.record_latency(MetricType.OCR_ASYNC, 0.0, success=False)
+
+    lines = metrics.export_prometheus_format().split("\n")
+    assert len(lines) == 10 * len(MetricType)
+    timestamp = lines[1].rsplit(" ", 1)[1]
+    assert lines[:10] == [
+        "# TYPE justiceai_ocr_async_total counter",
+        f"justiceai_ocr_async_total 2 {timestamp}",
+        "# TYPE justiceai_ocr_async_success counter",
+        f"justiceai_ocr_async_success 1 {timestamp}",
+        "# TYPE justiceai_ocr_async_failed counter",
+        f"justiceai_ocr_async_failed 1 {timestamp}",
+        "# TYPE justiceai_ocr_async_latency_seconds histogram",
+        f'justiceai_ocr_async_latency_seconds{{quantile="0.5"}} 0.0 {timestamp}',
+        f'justiceai_ocr_async_latency_seconds{{quantile="0.95"}} 0.0 {timestamp}',
+        f'justiceai_ocr_async_latency_seconds{{quantile="0.99"}} 0.0 {timestamp}',
+    ]
+
+
+@pytest.mark.unit
+class TestRateLimitEvents:
+    """Tests para los eventos de límite de tasa."""
+
+    def test_keeps_last_thousand_events(self):
+        """Test que solo se conservan los 1000 eventos más recientes, en orden cronológico."""
+        metrics = MetricsService()
+        for i in range(1005):
+            metrics.record_rate_limit_event("embedding", f"error {i}")
+
+        events = metrics.get_rate_limit_events(limit=2000)
+        assert len(events) == 1000
+        assert events[0]["error_message"] == "error 5"
+        assert [e["error_message"] for e in metrics.get_rate_limit_events(limit=2)] == ["error 1003", "error 1004"]
+
+    def test_since_filter(self):
+        """Test que el filtro since excluye los eventos anteriores."""
+        metrics = MetricsService()
+        metrics.record_rate_limit_event("embedding", "antiguo")
+        metrics._rate_limit_events[0] = (time.time() - 3600, metrics._rate_limit_events[0][1])
+        metrics.record_rate_limit_event("classification", "reciente", retry_after=20)
+
+        events = metrics.get_rate_limit_events(since=datetime.utcnow() - timedelta(minutes=5))
+        assert [e["error_message"] for e in events] == ["reciente"]
+        assert events[0]["retry_after"] == 20
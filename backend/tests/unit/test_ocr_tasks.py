@@ -0,0 +1,129 @@
+# backend/tests/unit/test_ocr_tasks.py - Tests Unitarios para el OCR por páginas
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.tasks import ocr_tasks
+from app.tasks.ocr_tasks import _merge_page_results, _plan_pdf_ocr, finalize_document_ocr
+
+
+def _ocr_service(monkeypatch, direct_text="", page_count=1, engine="tesseract"):
+    """Sustituye el servicio OCR del worker por un doble con texto y número de páginas fijos."""
+    service = MagicMock()
+    service.extract_pdf_text_direct.return_value = direct_text
+    service.count_pdf_pages.return_value = page_count
+    service.select_best_engine.return_value = engine
+    monkeypatch.setattr(ocr_tasks, "_get_page_ocr_service", lambda: service)
+    return service
+
+
+@pytest.mark.unit
+class TestMergePageResults:
+    """Tests para la fusión de resultados por página."""
+
+    def test_pages_sorted_and_confidence_averaged(self):
+        """Test que las páginas se ordenan y la confianza es la media de las páginas correctas."""
+        result = _merge_page_results([
+            {"page": 2, "text": "segunda", "confidence": 80},
+            {"page": 1, "text": "primera", "confidence": 90},
+        ], "ar")
+
+        assert result["extracted_text"].index("primera") < result["extracted_text"].index("segunda")
+        assert result["ocr_confidence"] == 85
+        assert result["pages_processed"] == 2
+        assert result["successful_pages"] == 2
+
+    def test_failed_pages_are_marked(self):
+        """Test que una página fallida se marca en el texto sin afectar a la confianza."""
+        result = _merge_page_results([
+            {"page": 1, "text": "primera", "confidence": 90},
+            {"page": 2, "error": "imagen ilegible"},
+        ], "fr")
+
+        assert "[OCR FAILED: imagen ilegible]" in result["extracted_text"]
+        assert result["ocr_confidence"] == 90
+        assert result["successful_pages"] == 1
+        assert result["detected_language"] == "fr"
+
+    def test_all_pages_failed_raises(self):
+        """Test que falla si ninguna página se pudo procesar."""
+        with pytest.raises(RuntimeError, match="All 2 pages failed"):
+            _merge_page_results([{"page": 1, "error": "a"}, {"page": 2, "error": "b"}], "ar")
+
+
+@pytest.mark.unit
+class TestPlanPdfOcr:
+    """Tests para la planificación del OCR de un PDF."""
+
+    def test_text_layer_is_extracted_directly(self, monkeypatch):
+        """Test que un PDF con capa de texto no necesita OCR."""
+        service = _ocr_service(monkeypatch, direct_text="texto " * 20, page_count=3)
+
+        result, page_chord = _plan_pdf_ocr(1, 7, "/tmp/doc.pdf")
+
+        assert page_chord is None
+        assert result["method"] == "direct_extraction"
+        assert result["pages_processed"] == 3
+        service.select_best_engine.assert_not_called()
+
+    def test_single_scanned_page_is_processed_in_task(self, monkeypatch):
+        """Test que un PDF escaneado de una página se procesa en la propia tarea."""
+        _ocr_service(monkeypatch, page_count=1)
+
+        assert _plan_pdf_ocr(1, 7, "/tmp/doc.pdf") == (None, None)
+
+    def test_scanned_pdf_fans_out_one_task_per_page(self, monkeypatch):
+        """Test que un PDF escaneado de varias páginas genera un chord con una tarea por página."""
+        _ocr_service(monkeypatch, page_count=3, engine="easyocr")
+
+        result, page_chord = _plan_pdf_ocr(1, 7, "/tmp/doc.pdf", language="fr")
+
+        assert result is None
+        assert [task.args for task in page_chord.tasks] == [
+            ("/tmp/doc.pdf", page, "easyocr", "fr") for page in (1, 2, 3)
+        ]
+        assert page_chord.body.args == (1, 7, "fr")
+        assert page_chord.body.kwargs == {"file_path": "/tmp/doc.pdf", "engine": "easyocr", "attempt": 0}
+
+
+@pytest.mark.unit
+class TestFinalizeDocumentOcr:
+    """Tests para la tarea que fusiona y guarda el OCR por páginas."""
+
+    FAILED_PAGES = [{"page": 1, "error": "a"}, {"page": 2, "error": "b"}]
+
+    def test_all_pages_failed_retries_pages(self, monkeypatch):
+        """Test que si fallan todas las páginas se reemplaza la tarea por un nuevo chord con espera."""
+        replace = MagicMock(side_effect=RuntimeError("replaced"))
+        monkeypatch.setattr(finalize_document_ocr, "replace", replace)
+
+        with pytest.raises(RuntimeError, match="replaced"):
+            finalize_document_ocr.run(self.FAILED_PAGES, 1, 7, "ar", file_path="/tmp/doc.pdf", engine="tesseract")
+
+        page_chord = replace.call_args.args[0]
+        assert len(page_chord.tasks) == 2
+        assert page_chord.tasks[0].options["countdown"] == 60
+        assert page_chord.body.kwargs["attempt"] == 1
+
+    def test_gives_up_after_max_retries(self, monkeypatch):
+        """Test que tras agotar los reintentos se propaga el error de fusión."""
+        replace = MagicMock()
+        monkeypatch.setattr(finalize_document_ocr, "replace", replace)
+
+        with pytest.raises(RuntimeError, match="All 2 pages failed"):
+            finalize_document_ocr.run(
+                self.FAILED_PAGES, 1, 7, "ar", file_path="/tmp/doc.pdf", engine="tesseract",
+                attempt=finalize_document_ocr.max_retries
+            )
+        replace.assert_not_called()
+
+    def test_merged_result_is_stored(self, monkeypatch):
+        """Test que el resultado fusionado se guarda en el documento."""
+        store = MagicMock(return_value={"document_id": 1})
+        monkeypatch.setattr(ocr_tasks, "_store_ocr_result", store)
+        monkeypatch.setattr(ocr_tasks, "SessionLocal", MagicMock())
+
+        assert finalize_document_ocr.run([{"page": 1, "text": "t", "confidence": 70}], 1, 7) == {"document_id": 1}
+        assert store.call_args.args[4]["ocr_confidence"] == 70
+        assert store.call_args.kwargs == {"async_processed": True}
@@ -0,0 +1,89 @@
+# backend/tests/unit/test_rag_chat_service.py - Tests Unitarios para el Servicio de Chat RAG
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from app.services.rag_chat_service import RAGChatService, _halfvec_literal
+
+
+@pytest.mark.unit
+class TestHalfvecLiteral:
+    """Tests para el formato de la consulta vectorial."""
+
+    def test_literal_roundtrips_to_same_float16(self):
+        """Test que el literal abreviado se convierte en los mismos valores float16 que el texto completo."""
+        embedding = (np.random.default_rng(0).standard_normal(1536) / 30).tolist()
+        literal = _halfvec_literal(embedding)
+
+        assert literal.startswith("[") and literal.endswith("]")
+        parsed = np.array([float(v) for v in literal[1:-1].split(",")])
+        assert np.array_equal(parsed.astype(np.float16), np.asarray(embedding).astype(np.float16))
+
+    def test_literal_accepts_numpy_arrays(self):
+        """Test que se aceptan embeddings como arrays de numpy."""
+        assert _halfvec_literal(np.array([0.5, -0.25], dtype=np.float32)) == "[0.5,-0.25]"
+
+
+@pytest.mark.unit
+class TestGenerateResponse:
+    """Tests para la generación de respuestas."""
+
+    def test_query_embedded_once_and_history_forwarded(self):
+        """Test que la consulta se embebe una sola vez y el historial se pasa al modelo."""
+        service = RAGChatService()
+        service._embedding_service = MagicMock()
+        service._embedding_service.embed_query.return_value = [0.5, 0.25]
+        service._client = MagicMock()
+        service._client.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="respuesta"))]
+        )
+        db = MagicMock()
+        history = [{"role": "user", "content": "hola"}, {"role": "assistant", "content": "buenas"}]
+        db.execute.return_value.one.return_value = SimpleNamespace(user_message_id=3, history=history)
+        db.execute.return_value.__iter__.return_value = iter([(10, 20, "texto", 0, "contrato.pdf", "/docs/c.pdf", 0.9)])
+        db.execute.return_value.scalar_one.return_value = 4
+
+        result = service.generate_response(1, "¿qué dice el contrato?", firm_id=1, user_id=1, db=db)
+
+        assert result["message_id"] == 4
+        assert result["sources"] == [{"document_id": 20, "document_name": "contrato.pdf", "similarity": 0.9}]
+        service._embedding_service.embed_query.assert_called_once_with("¿qué dice el contrato?")
+        messages = service._client.chat.completions.create.call_args.kwargs["messages"]
+        assert messages[1:3] == history
+        assert db.commit.call_count == 2
+
+    def test_connection_released_before_model_call(self):
+        """Test que la sesión se confirma (liberando la conexión) antes de llamar al modelo."""
+        service = RAGChatService()
+        service._embedding_service = MagicMock()
+        service._embedding_service.embed_query.return_value = [0.5]
+        db = MagicMock()
+        db.execute.return_value.one.return_value = SimpleNamespace(user_message_id=3, history=[])
+        db.execute.return_value.__iter__.return_value = iter([])
+        commits_during_call = []
+
+        def create(**kwargs):
+            commits_during_call.append(db.commit.call_count)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+        service._client = MagicMock()
+        service._client.chat.completions.create.side_effect = create
+
+        service.generate_response(1, "hola", firm_id=1, user_id=1, db=db)
+        assert commits_during_call == [1]
+        assert db.commit.call_count == 2
+
+    def test_unknown_conversation_raises(self):
+        """Test que una conversación de otra firma produce ValueError sin confirmar nada."""
+        service = RAGChatService()
+        service._embedding_service = MagicMock()
+        db = MagicMock()
+        db.execute.return_value.one.return_value = SimpleNamespace(user_message_id=None, history=[])
+
+        with pytest.raises(ValueError):
+            service.generate_response(1, "hola", firm_id=2, user_id=1, db=db)
+        db.commit.assert_not_called()
+        db.rollback.assert_called_once()